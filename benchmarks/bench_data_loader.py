@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Training data loading benchmark: the previous pd.concat(map(pd.read_csv, files))
+# path against workflow/training/data_loader.py, without and with the matrix
+# cache from workflow/training/matrix_cache.py. Each path runs in its own
+# process so peak RSS is measured independently. Synthetic files mimic the
+# CSE-CIC-IDS2018 channels: a Target label plus 79 numeric features.
+#
+# Usage: python -m benchmarks.bench_data_loader --files 8 --rows 50000
+
+# The cache is empty for cache_miss, which fills it for cache_hit
+MEASURES = ['legacy', 'loader', 'cache_miss', 'cache_hit']
+
+def generate(path, files, rows, features, seed=0):
+    """Write files CSVs with a Target column followed by feature columns"""
+    rng = np.random.RandomState(seed)
+    header = ','.join(['Target'] + ['f{}'.format(i) for i in range(features)])
+    for i in range(files):
+        data = np.column_stack([rng.randint(0, 15, rows), rng.rand(rows, features) * 1000])
+        np.savetxt(os.path.join(path, 'part-{:03d}.csv'.format(i)), data,
+                   delimiter=',', fmt='%.6g', header=header, comments='')
+
+def run_legacy(path):
+    import glob
+    import pandas as pd
+    import xgboost
+    df = pd.concat(map(pd.read_csv, glob.glob(path + '/*.*')))
+    y = df.Target.values
+    X = df.drop(['Target'], axis=1).values
+    return xgboost.DMatrix(X, label=y)
+
+def run_loader(path):
+    from workflow.training import data_loader
+    return data_loader.load_dmatrix(path)
+
+def run_cached(path):
+    from workflow.training import data_loader, matrix_cache
+    cache = matrix_cache.MatrixCache(os.path.join(os.path.dirname(path), 'cache'))
+    return data_loader.load_dmatrix(path, cache=cache)
+
+def measure(name, path):
+    """Run one loading path in this process and return its timing and peak RSS"""
+    import resource
+    import xgboost # Import before timing, as both paths need it
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    run = {'legacy': run_legacy, 'loader': run_loader, 'cache_miss': run_cached, 'cache_hit': run_cached}[name]
+    dmatrix = run(path)
+    elapsed = time.perf_counter() - start
+    return {
+        'rows': dmatrix.num_row(),
+        'seconds': round(elapsed, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+        'baseline_rss_mb': round(baseline_kb / 1024.0, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=50000, help='rows per file')
+    parser.add_argument('--features', type=int, default=79)
+    parser.add_argument('--measure', choices=MEASURES, help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.path)))
+        return
+
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'train')
+        os.makedirs(path)
+        generate(path, args.files, args.rows, args.features)
+        size_mb = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 1e6
+        results = {'files': args.files, 'rows': args.files * args.rows, 'csv_mb': round(size_mb, 1)}
+        for name in MEASURES:
+            output = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_data_loader',
+                                              '--measure', name, '--path', path])
+            results[name] = json.loads(output.decode('utf-8').strip().split('\n')[-1])
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from benchmarks.bench_runtime import percentile
+from benchmarks.stubs import SageMakerRuntimeStub, set_fake_credentials
+from regression import batch, local_model, payload
+
+# Compare in-process XGBoost scoring with invoking a stubbed endpoint.
+# The stub adds --latency_ms per request to model the network hop and
+# endpoint overhead, so set it to what you observe in CloudWatch.
+#
+# Usage: python -m benchmarks.bench_local_model --rows 1 4 16
+
+def train_model():
+    import xgboost
+    X = np.random.rand(1000, payload.FEATURE_COUNT)
+    return xgboost.train(
+        {'objective': 'reg:squarederror', 'max_depth': 5},
+        xgboost.DMatrix(X, label=X.sum(axis=1)), 10)
+
+def run(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--latency_ms', type=float, default=15.0)
+    args = parser.parse_args()
+
+    set_fake_credentials(os.environ)
+    import boto3
+    stub = SageMakerRuntimeStub(latency=args.latency_ms / 1000.0)
+    sm = stub.install(boto3.client('sagemaker-runtime'))
+    model = train_model()
+
+    results = {}
+    for n in args.rows:
+        rows = payload.to_libsvm(np.random.rand(n, payload.FEATURE_COUNT))
+
+        def local():
+            features = payload.parse(rows, payload.LIBSVM)[0]
+            return local_model.predict(model, features)
+
+        def endpoint():
+            return batch.invoke_chunk(sm, 'bench', rows, payload.LIBSVM)
+
+        results[n] = {
+            'local': run(local, args.iterations),
+            'endpoint': run(endpoint, args.iterations),
+        }
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_runtime import percentile
+from workflow.training import train_xgboost
+
+# Model artifact benchmark: size, load time and predict latency for each format
+# saved by workflow/training/train_xgboost.py. The model mimics the
+# CSE-CIC-IDS2018 classifier, 15 classes over 79 features. pickle_dmatrix is
+# the previous model_fn path, predicting through a DMatrix. The compiled format
+# is skipped unless treelite and tl2cgen are installed.
+#
+# Usage: python -m benchmarks.bench_model_format --rounds 50 --rows 1 100
+
+def train_model(rounds, max_depth, features=79, classes=15, seed=0):
+    import xgboost
+    rng = np.random.RandomState(seed)
+    X = rng.rand(5000, features)
+    y = rng.randint(0, classes, len(X))
+    params = {'objective': 'multi:softmax', 'num_class': classes, 'max_depth': max_depth, 'tree_method': 'hist'}
+    return xgboost.train(params, xgboost.DMatrix(X, label=y), rounds)
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def predict_dmatrix(features, model):
+    import xgboost
+    return model.predict(xgboost.DMatrix(features))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--max_depth', type=int, default=10)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 100])
+    parser.add_argument('--loads', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    bst = train_model(args.rounds, args.max_depth)
+    rng = np.random.RandomState(1)
+    results = {}
+    with tempfile.TemporaryDirectory() as model_dir:
+        train_xgboost.save_model(bst, model_dir, train_xgboost.MODEL_PREFERENCE)
+        formats = [(name, train_xgboost.predict_fn) for name in train_xgboost.MODEL_PREFERENCE
+                   if os.path.exists(os.path.join(model_dir, train_xgboost.MODEL_FILES[name]))]
+        formats.append(('pickle_dmatrix', predict_dmatrix))
+        for label, predict in formats:
+            name = label.split('_')[0]
+            model = train_xgboost.load_model(model_dir, name)
+            loads = timed(lambda: train_xgboost.load_model(model_dir, name), args.loads)
+            result = {
+                'bytes': os.path.getsize(os.path.join(model_dir, train_xgboost.MODEL_FILES[name])),
+                'load_ms': round(percentile(loads, 50) * 1000, 3),
+            }
+            for n in args.rows:
+                features = rng.rand(n, 79).astype(np.float32)
+                samples = timed(lambda: predict(features, model), args.iterations)
+                result['predict_{}_rows'.format(n)] = {
+                    'p50_ms': round(percentile(samples, 50) * 1000, 3),
+                    'p99_ms': round(percentile(samples, 99) * 1000, 3),
+                }
+            results[label] = result
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import base64
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from workflow.schedule import preprocessor
+
+# Monitoring record preprocessor benchmark: preprocess_handler called once per
+# record, as the monitoring job does, against preprocess_batch over each file.
+# Synthetic data capture files mimic the CSE-CIC-IDS2018 endpoint: 79 features
+# sent as CSV or libsvm, some requests with several rows, and the predicted
+# class returned as CSV or JSON. Reading and decoding the JSONL is timed for
+# both paths.
+#
+# Usage: python -m benchmarks.bench_preprocessor --files 4 --records 20000
+
+def generate(path, files, records, features, max_rows=4, seed=0):
+    """Write files of data capture JSONL records"""
+    rng = np.random.RandomState(seed)
+    for i in range(files):
+        lines = []
+        for j in range(records):
+            rows = rng.rand(rng.randint(1, max_rows + 1) if j % 10 == 0 else 1, features) * 1000
+            if j % 2:
+                content_type = 'text/csv'
+                data = '\n'.join(','.join('{:.6g}'.format(v) for v in row) for row in rows)
+            else:
+                content_type = 'text/libsvm'
+                data = '\n'.join(' '.join('{}:{:.6g}'.format(k, v) for k, v in enumerate(row)) for row in rows)
+            labels = rng.randint(0, 15, len(rows)).astype(float)
+            output = json.dumps({'predictions': [{'score': v} for v in labels]}) if j % 3 else \
+                ','.join(str(v) for v in labels)
+            lines.append(json.dumps({
+                'captureData': {
+                    'endpointInput': {'observedContentType': content_type, 'mode': 'INPUT',
+                                      'data': base64.b64encode(data.encode('utf-8')).decode('utf-8'),
+                                      'encoding': 'BASE64'},
+                    'endpointOutput': {'observedContentType': 'application/json' if j % 3 else 'text/csv',
+                                       'mode': 'OUTPUT', 'data': output, 'encoding': 'JSON' if j % 3 else 'CSV'},
+                },
+                'eventMetadata': {'eventId': str(j), 'inferenceTime': '2020-01-01T00:00:00Z'},
+                'eventVersion': '0',
+            }))
+        with open(os.path.join(path, 'capture-{:03d}.jsonl'.format(i)), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+def read(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def run_per_record(paths):
+    rows = 0
+    for path in paths:
+        for record in read(path):
+            flat = preprocessor.preprocess_handler(record)
+            rows += 1 if isinstance(flat, dict) else len(flat)
+    return rows
+
+def run_batch(paths):
+    return sum(len(preprocessor.preprocess_batch(read(path)).values) for path in paths)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--records', type=int, default=20000, help='records per file')
+    parser.add_argument('--features', type=int, default=79)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        generate(path, args.files, args.records, args.features)
+        paths = sorted(os.path.join(path, f) for f in os.listdir(path))
+        preprocessor.FEATURE_COLUMNS = ['feature{}'.format(i) for i in range(args.features)]
+        records = args.files * args.records
+        results = {'records': records, 'capture_mb': round(sum(os.path.getsize(p) for p in paths) / 1e6, 1)}
+        for name, run in (('per_record', run_per_record), ('batch', run_batch)):
+            start = time.perf_counter()
+            rows = run(paths)
+            seconds = time.perf_counter() - start
+            results[name] = {
+                'rows': rows,
+                'seconds': round(seconds, 3),
+                'records_per_sec': round(records / seconds, 1),
+                'rows_per_sec': round(rows / seconds, 1),
+            }
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
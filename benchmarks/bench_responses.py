@@ -0,0 +1,68 @@
+import argparse
+import json
+import random
+import time
+
+from regression import batch, responses
+
+# Compare bytes on the wire and serialization time of the response formats.
+# legacy: endpoint body decoded and embedded as a string (previous behaviour)
+#
+# Usage: python -m benchmarks.bench_responses --rows 1 100 10000
+
+def legacy(body):
+    return {
+        "statusCode": 200,
+        "body": json.dumps({
+            "version": 'abc1234',
+            "endpoint_name": 'bench',
+            "predictions": body.decode('utf-8')
+        }),
+    }
+
+def formatted(media_type):
+    def serialize(body):
+        return responses.format_predictions(
+            media_type, batch.parse_predictions(body), 'abc1234', 'bench')
+    return serialize
+
+def passthrough(body):
+    return responses.passthrough(body, responses.CSV, 'abc1234', 'bench')
+
+FORMATS = {
+    'legacy': legacy,
+    'json': formatted(responses.JSON),
+    'csv': formatted(responses.CSV),
+    'ndjson': formatted(responses.NDJSON),
+    'passthrough_csv': passthrough,
+}
+
+def measure(serialize, body, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        ret = serialize(body)
+    elapsed = (time.perf_counter() - start) / repeat
+    return {
+        'bytes': len(ret['body'].encode('utf-8')),
+        'serialize_us': round(elapsed * 1e6, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 100, 10000])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    results = {}
+    for rows in args.rows:
+        predictions = [round(random.uniform(1, 29), 6) for _ in range(rows)]
+        json_body = json.dumps(predictions).encode('utf-8')
+        csv_body = '\n'.join(str(p) for p in predictions).encode('utf-8')
+        results[rows] = {
+            name: measure(serialize, csv_body if name == 'passthrough_csv' else json_body, args.repeat)
+            for name, serialize in FORMATS.items()
+        }
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
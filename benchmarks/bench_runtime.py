@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import statistics
+import time
+
+from benchmarks.stubs import SageMakerRuntimeStub, set_fake_credentials
+
+# Cold-start vs warm-path benchmark for the RegressionFunction hot path.
+# Cold: build a sagemaker-runtime client per invocation (previous behaviour).
+# Warm: reuse the client cached by regression.runtime.
+#
+# Usage: python -m benchmarks.bench_runtime --iterations 200
+
+PAYLOAD = '0:1 1:0.555 2:0.435 3:0.145 4:0.9205 5:0.404 6:0.2275 7:0.255'
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def invoke(sm):
+    response = sm.invoke_endpoint(
+        EndpointName='bench',
+        Body=PAYLOAD,
+        ContentType='text/libsvm',
+        Accept='application/json'
+    )
+    return response['Body'].read()
+
+def run_cold(stub, iterations):
+    import boto3
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        sm = stub.install(boto3.client('sagemaker-runtime'))
+        invoke(sm)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def run_warm(stub, iterations):
+    from regression import runtime
+    runtime.reset()
+    sm = stub.install(runtime.client('sagemaker-runtime'))
+    invoke(sm) # First call pays the connect, as a cold start would
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        invoke(runtime.client('sagemaker-runtime'))
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def summarize(samples):
+    return {
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--latency_ms', type=float, default=0.0)
+    parser.add_argument('--connect_ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    set_fake_credentials(os.environ)
+    stub = SageMakerRuntimeStub(
+        latency=args.latency_ms / 1000.0,
+        connect_latency=args.connect_ms / 1000.0)
+
+    results = {
+        'cold': summarize(run_cold(stub, args.iterations)),
+        'warm': summarize(run_warm(stub, args.iterations)),
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_runtime import percentile
+from benchmarks.stubs import LatencyProfile, SageMakerRuntimeStub, ServiceStub, default_predict, set_fake_credentials
+
+# Replay recorded events through the regression Lambdas with stubbed AWS services.
+# Each handler is run at the given concurrency against a SageMaker runtime with
+# a log-normal latency and error profile, then once more serially under
+# tracemalloc to measure memory per request. Results are written as JSON
+# tagged with the git commit so runs can be compared across commits.
+# The prediction cache is disabled unless --cache is passed, and app payloads
+# are made distinct per request, except for a --repeat-rate fraction of them,
+# so the endpoint path is measured rather than cache hits on one event.
+#
+# Usage: python -m benchmarks.replay --handler all --requests 500 --concurrency 8 \
+#            --latency-ms 20 --sigma 0.5 --error-rate 0.01 --output replay.json
+#        python -m benchmarks.replay --handler app --cache --repeat-rate 0.3
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_EVENTS = {
+    'app': os.path.join(ROOT, 'events', 'event.json'),
+    'pre_traffic_hook': os.path.join(ROOT, 'events', 'code_deploy.json'),
+    'post_traffic_hook': os.path.join(ROOT, 'events', 'code_deploy.json'),
+}
+
+DEFAULT_ENVIRONMENT = {
+    'COMMIT_ID': 'replay',
+    'ENDPOINT_NAME': 'regression-replay-blue',
+    'CURRENT_VERSION': '1',
+    'VARIANT_NAME': 'AllTraffic',
+    'INSTANCE_COUNT': '2',
+}
+
+class Context:
+    """Minimal stand in for the Lambda context object"""
+
+    function_name = 'replay'
+    aws_request_id = 'replay'
+
+    def __init__(self, timeout_ms=30000):
+        self.deadline = time.time() + timeout_ms / 1000.0
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.time()) * 1000))
+
+def load_events(path):
+    """Load events from a .json file (one event or a list) or a .jsonl file"""
+    with open(path) as f:
+        if path.endswith('.jsonl'):
+            return [json.loads(line) for line in f if line.strip()]
+        events = json.load(f)
+    return events if isinstance(events, list) else [events]
+
+def load_handler(name):
+    from regression import app, post_traffic_hook, pre_traffic_hook
+    return {
+        'app': app,
+        'pre_traffic_hook': pre_traffic_hook,
+        'post_traffic_hook': post_traffic_hook,
+    }[name].lambda_handler
+
+def golden_predict(records=30, features=79):
+    """Write a synthetic golden set and answer its payloads with the expected class so the pre traffic gate passes"""
+    import tempfile
+    from regression import golden
+    golden_set = {'name': 'replay', 'version': 1, 'content_type': 'text/csv', 'records': [
+        {'payload': ','.join('{:.3f}'.format((i * 7 + j) % 100 / 10.0) for j in range(features)),
+         'label': float(i % 15), 'expected': float(i % 15)} for i in range(records)]}
+    golden.GOLDEN_SET = os.path.join(tempfile.mkdtemp(), 'golden.json')
+    with open(golden.GOLDEN_SET, 'w') as f:
+        json.dump(golden_set, f)
+    labels = {r['payload']: r['expected'] for r in golden_set['records']}
+
+    def predict(body):
+        text = body.decode('utf-8') if isinstance(body, bytes) else body
+        if text in labels:
+            return json.dumps([labels[text]]).encode('utf-8')
+        return default_predict(body)
+    return predict
+
+def vary(event, i):
+    """Return a copy of an app event with payload values made distinct by i"""
+    body = json.loads(event.get('body') or 'null')
+    key = 'data' if isinstance(body, dict) and 'data' in body else 'instances'
+    data = body.get(key) if isinstance(body, dict) else None
+    suffix = '{:09d}'.format(i) # Extra digits on the last value keep it a valid number
+
+    def distinct(record):
+        return record.rstrip() + suffix if isinstance(record, str) and record.strip() else record
+
+    if isinstance(data, str):
+        body[key] = '\n'.join(distinct(line) for line in data.split('\n'))
+    elif isinstance(data, list):
+        body[key] = [distinct(record) for record in data]
+    else:
+        return event
+    return dict(event, body=json.dumps(body))
+
+def build_requests(events, requests, repeat_rate=0.0, seed=0):
+    """Pick events round robin, repeating an earlier payload for a repeat_rate fraction of them"""
+    rng = random.Random(seed)
+    batch = []
+    for i in range(requests):
+        if batch and rng.random() < repeat_rate:
+            batch.append(batch[rng.randrange(len(batch))])
+        else:
+            batch.append(vary(events[i % len(events)], i))
+    return batch
+
+def install_stubs(profile, cache_enabled=False):
+    """Reset the cached clients and stub each service used by the handlers"""
+    from regression import cache, runtime
+    runtime.reset()
+    cache.reset()
+    cache.CACHE_ENABLED = cache_enabled
+    stubs = {
+        'sagemaker-runtime': SageMakerRuntimeStub(profile, predict=golden_predict()),
+        'sagemaker': ServiceStub('sagemaker', latency=LatencyProfile(profile.median, profile.sigma)),
+        'cloudwatch': ServiceStub('cloudwatch', latency=LatencyProfile(profile.median, profile.sigma)),
+        'codedeploy': ServiceStub('codedeploy', latency=LatencyProfile(profile.median, profile.sigma)),
+    }
+    for service_name, stub in stubs.items():
+        stub.install(runtime.client(service_name))
+    return stubs
+
+def succeeded(response):
+    status = response.get('statusCode', 200) if isinstance(response, dict) else 200
+    return status < 400
+
+def invoke(handler, event):
+    start = time.perf_counter()
+    try:
+        ok = succeeded(handler(event, Context()))
+    except Exception: # Count unhandled errors rather than abort the run
+        ok = False
+    return time.perf_counter() - start, ok
+
+def run_load(handler, batch, concurrency):
+    """Replay the batch of events at the given concurrency"""
+    requests = len(batch)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda event: invoke(handler, event), batch))
+    elapsed = time.perf_counter() - start
+    samples = [latency for latency, ok in results]
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': sum(1 for latency, ok in results if not ok),
+        'rps': round(requests / elapsed, 2),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+    }
+
+def run_memory(handler, events, requests):
+    """Replay serially under tracemalloc, recording the peak and retained bytes per request"""
+    invoke(handler, events[0]) # Warm up so imports and clients aren't counted
+    peaks = []
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    blocks = sys.getallocatedblocks()
+    for i in range(requests):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        invoke(handler, events[i % len(events)])
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    retained_blocks = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+    return {
+        'requests': requests,
+        'peak_bytes_p50': int(percentile(peaks, 50)),
+        'peak_bytes_max': max(peaks),
+        'retained_bytes_per_request': round(retained / requests, 1),
+        'retained_blocks_per_request': round(retained_blocks / requests, 2),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay events through the regression Lambdas')
+    parser.add_argument('--handler', choices=sorted(DEFAULT_EVENTS) + ['all'], default='all')
+    parser.add_argument('--events', help='.json or .jsonl events, defaults to events/ per handler')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--memory-requests', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=10.0, help='median stubbed service latency')
+    parser.add_argument('--sigma', type=float, default=0.3, help='log-normal latency spread')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of InvokeEndpoint errors')
+    parser.add_argument('--cache', action='store_true', help='enable the prediction cache')
+    parser.add_argument('--repeat-rate', type=float, default=0.0,
+                        help='fraction of app requests repeating an earlier payload')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    set_fake_credentials(os.environ)
+    for key, value in DEFAULT_ENVIRONMENT.items():
+        os.environ.setdefault(key, value)
+    profile = LatencyProfile(args.latency_ms / 1000.0, args.sigma, args.error_rate)
+
+    names = sorted(DEFAULT_EVENTS) if args.handler == 'all' else [args.handler]
+    results = {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'python': sys.version.split()[0],
+        'profile': {'latency_ms': args.latency_ms, 'sigma': args.sigma, 'error_rate': args.error_rate},
+        'cache': {'enabled': args.cache, 'repeat_rate': args.repeat_rate},
+        'handlers': {},
+    }
+    for name in names:
+        handler = load_handler(name)
+        events = load_events(args.events or DEFAULT_EVENTS[name])
+        if name == 'app':
+            batch = build_requests(events, args.requests + args.memory_requests + 1, args.repeat_rate)
+        else:
+            batch = [events[i % len(events)] for i in range(args.requests + args.memory_requests + 1)]
+        # Handlers log every request, which would otherwise swamp the results
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            stubs = install_stubs(profile, args.cache)
+            load = run_load(handler, batch[:args.requests], args.concurrency)
+            memory = run_memory(handler, batch[args.requests:], args.memory_requests)
+        load['endpoint_calls'] = stubs['sagemaker-runtime'].calls
+        results['handlers'][name] = {'load': load, 'memory': memory}
+    results['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
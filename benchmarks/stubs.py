@@ -0,0 +1,151 @@
+import io
+import json
+import math
+import random
+import threading
+import time
+
+from botocore.awsrequest import AWSResponse
+
+# Stubbed AWS services for offline benchmarks.
+# InvokeEndpoint responses are injected on the client's before-send event so
+# request serialization, retries and response parsing still run as in
+# production. Control plane calls are answered on before-call instead.
+
+def set_fake_credentials(environ, region='ap-southeast-2'):
+    """Ensure botocore can build clients without real credentials"""
+    environ.setdefault('AWS_DEFAULT_REGION', region)
+    environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+class _Raw(io.BytesIO):
+    def stream(self, **kwargs):
+        yield self.getvalue()
+
+def default_predict(body):
+    """Return one prediction per line of the request body as a JSON array"""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    rows = [line for line in body.split('\n') if line.strip()]
+    return json.dumps([float(i % 29) for i in range(len(rows))]).encode('utf-8')
+
+class LatencyProfile:
+    """Log-normal request latency with a fraction of failed requests
+
+    median: seconds for the median request
+    sigma: spread of the log-normal distribution, 0 for a fixed latency
+    error_rate: fraction of requests answered with an error
+    """
+
+    def __init__(self, median=0.0, sigma=0.0, error_rate=0.0):
+        self.median = median
+        self.sigma = sigma
+        self.error_rate = error_rate
+
+    def sample(self):
+        if self.sigma <= 0:
+            return self.median
+        return self.median * math.exp(random.gauss(0, self.sigma))
+
+    def failed(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+class SageMakerRuntimeStub:
+    """Answer InvokeEndpoint with a latency profile and a modelled TLS connect
+
+    latency: seconds spent "on the network" per request, or a LatencyProfile
+    connect_latency: one-off seconds paid by the first request of each client
+    """
+
+    def __init__(self, latency=0.0, connect_latency=0.0, predict=default_predict):
+        self.profile = latency if isinstance(latency, LatencyProfile) else LatencyProfile(latency)
+        self.connect_latency = connect_latency
+        self.predict = predict
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def install(self, client):
+        state = {'connected': False}
+
+        def before_send(request, **kwargs):
+            delay = self.profile.sample()
+            if not state['connected']:
+                state['connected'] = True
+                delay += self.connect_latency
+            if delay:
+                time.sleep(delay)
+            with self._lock:
+                self.calls += 1
+            if self.profile.failed():
+                with self._lock:
+                    self.errors += 1
+                body = json.dumps({'ErrorCode': 'MODEL_ERROR', 'Message': 'stubbed model error'}).encode('utf-8')
+                headers = {'Content-Type': 'application/json', 'x-amzn-ErrorType': 'ModelError'}
+                return AWSResponse(request.url, 424, headers, _Raw(body))
+            body = self.predict(request.body)
+            headers = {
+                'Content-Type': 'application/json',
+                'Content-Length': str(len(body)),
+                'x-Amzn-Invoked-Production-Variant': 'AllTraffic'
+            }
+            return AWSResponse(request.url, 200, headers, _Raw(body))
+
+        client.meta.events.register('before-send.sagemaker-runtime.InvokeEndpoint', before_send)
+        return client
+
+# Canned responses for the control plane services used by the traffic hooks
+DEFAULT_RESPONSES = {
+    'cloudwatch': {
+        'GetMetricData': {'MetricDataResults': []},
+    },
+    'codedeploy': {
+        'PutLifecycleEventHookExecutionStatus': {'lifecycleEventHookExecutionId': 'stub'},
+    },
+    'sagemaker': {
+        'DescribeEndpoint': {
+            'EndpointName': 'stub',
+            'EndpointConfigName': 'stub',
+            'EndpointStatus': 'InService',
+            'ProductionVariants': [{'VariantName': 'AllTraffic', 'CurrentInstanceCount': 1}],
+        },
+        'UpdateEndpointWeightsAndCapacities': {
+            'EndpointArn': 'arn:aws:sagemaker:ap-southeast-2:000000000000:endpoint/stub'
+        },
+        'DeleteEndpoint': {},
+        'DeleteEndpointConfig': {},
+    },
+}
+
+class ServiceStub:
+    """Answer operations from a dict of operation name to parsed response
+
+    Responses are returned from the before-call event, like botocore's Stubber,
+    so any protocol works. A response may be a callable taking the API params.
+    """
+
+    def __init__(self, service_name, responses=None, latency=0.0):
+        self.service_name = service_name
+        self.responses = dict(DEFAULT_RESPONSES.get(service_name, {}))
+        self.responses.update(responses or {})
+        self.profile = latency if isinstance(latency, LatencyProfile) else LatencyProfile(latency)
+        self.calls = []
+
+    def install(self, client):
+        def before_call(model, params, **kwargs):
+            self.calls.append(model.name)
+            delay = self.profile.sample()
+            if delay:
+                time.sleep(delay)
+            if self.profile.failed():
+                error = {'Error': {'Code': 'ServiceUnavailable', 'Message': 'stubbed error'},
+                         'ResponseMetadata': {'HTTPStatusCode': 503}}
+                return AWSResponse(None, 503, {}, None), error
+            response = self.responses.get(model.name, {})
+            if callable(response):
+                response = response(params)
+            return AWSResponse(None, 200, {}, None), dict(response)
+
+        service_id = client.meta.service_model.service_id.hyphenize()
+        client.meta.events.register('before-call.{}'.format(service_id), before_call)
+        return client
@@ -1,6 +1,16 @@
-import boto3
 import json
-import os
+
+try:
+    from . import batch, cache, local_model, metrics, payload, responses, runtime, shadow
+except ImportError:  # Lambda loads the handler as a top level module
+    import batch
+    import cache
+    import local_model
+    import metrics
+    import payload
+    import responses
+    import runtime
+    import shadow
 
 def lambda_handler(event, context):
     """Sample pure Lambda function
@@ -28,35 +38,196 @@ def lambda_handler(event, context):
     # See: https://docs.aws.amazon.com/AWSCloudFormation/latest/UserGuide/aws-resource-sagemaker-endpoint.html
 
     # Print the event
-    commit_id = os.environ['COMMIT_ID']
-    endpoint_name = os.environ['ENDPOINT_NAME']
-    print('commit id: {} endpoint: {} event: {}'.format(
-        commit_id, endpoint_name, json.dumps(event)))
-
-    # Get posted body and content type
-    content_type = event['headers'].get('Content-Type', 'text/libsvm')
-    body = json.loads(event['body'])
-    payload = body.get('data')
-    print('payload', endpoint_name, content_type, payload)
-
-    # Get boto3 sagemaker client and endpoint
-    sm = boto3.client('sagemaker-runtime')
-
-    # Invoke endpoint
-    response = sm.invoke_endpoint(
-        EndpointName=endpoint_name,
-        Body=payload,
-        ContentType=content_type,
-        Accept='application/json'
-    )
-    predictions = response['Body'].read().decode('utf-8')
+    timer = metrics.StageTimer()
+    config = runtime.get_config()
+    runtime.log_event('commit id: {} endpoint: {}'.format(
+        config.commit_id, config.endpoint_name), event)
+
+    # Get posted body, content type and negotiated response type
+    with timer.stage('parse'):
+        content_type = event['headers'].get('Content-Type', 'text/libsvm')
+        accept = responses.negotiate(responses.header(event, 'Accept'))
+        body = json.loads(event['body'])
+        data = body.get('data', body.get('instances')) if isinstance(body, dict) else None
+    if not isinstance(data, (str, list)):
+        return responses.format_predictions(
+            accept, [], config.commit_id, config.endpoint_name,
+            errors=[{"message": 'expected "data" or "instances" in the request body'}], status_code=400)
+    metrics.log_payload(config.endpoint_name, content_type, data)
+
+    # Get cached prediction cache
+    predictions_cache = cache.get_cache()
+    hits = predictions_cache.counters['hits'] if predictions_cache else 0
+
+    # Shadow requests must finish within the invocation
+    deadline = runtime.deadline(context, shadow.SHADOW_RESERVE_MS)
+    if isinstance(data, list):
+        # Batch mode when a list of records is posted
+        response, rows = predict_batch(timer, predictions_cache, config, data, content_type, accept, deadline)
+    else:
+        response, rows = predict_payload(timer, predictions_cache, config, data, content_type, accept, deadline)
+
+    # Emit stage timings tagged with the deployment, bounding the content types reported
+    counts = {"Rows": rows}
+    if predictions_cache is not None:
+        counts["CacheHits"] = predictions_cache.counters['hits'] - hits
+    metrics.emit_stages(timer, {
+        "EndpointName": config.endpoint_name or 'unknown',
+        "CommitId": config.commit_id or 'unknown',
+        "ContentType": content_type if payload.is_supported(content_type) else 'other'
+    }, counts, properties={
+        "StatusCode": response["statusCode"],
+        "Cache": predictions_cache.stats() if predictions_cache else None
+    })
+    return response
+
+def predict_payload(timer, predictions_cache, config, data, content_type, accept, deadline):
+    """Predict a single newline delimited payload, returning the response and row count"""
+    commit_id = config.commit_id
+    endpoint_name = config.endpoint_name
+
+    # Validate and convert rows locally, rejecting bad payloads without an endpoint call
+    with timer.stage('convert'):
+        rows, index, errors = payload.prepare(data.strip().split('\n'), content_type)
+        if payload.is_supported(content_type):
+            data = '\n'.join(rows)
+            content_type = payload.ENDPOINT_CONTENT_TYPE
+    if errors:
+        with timer.stage('serialize'):
+            return responses.format_predictions(
+                accept, [], commit_id, endpoint_name, errors=errors, status_code=400), len(rows)
+
+    # Return the endpoint bytes untouched when the client accepts them as is
+    passthrough = responses.is_passthrough(accept)
+    kind = 'raw:' + accept if passthrough else 'payload'
+
+    # Return cached predictions for a repeated payload
+    key = None
+    cached = None
+    if predictions_cache is not None:
+        key = cache.make_key(endpoint_name, commit_id, content_type, kind, data)
+        cached = predictions_cache.get(key)
+
+    if cached is None and not passthrough and local_model.enabled():
+        # Score small payloads in-process when a local model is available
+        with timer.stage('local'):
+            cached = predict_local(config, rows, content_type)
+        if cached is not None and key is not None:
+            predictions_cache.put(key, cached)
+
+    if cached is None:
+        # Invoke endpoint, mirroring a sample of requests to the candidate endpoint side by side
+        sm = runtime.client('sagemaker-runtime')
+        mirrored = None
+        if not passthrough and shadow.should_mirror(endpoint_name):
+            mirrored = shadow.mirror(sm, endpoint_name, rows, content_type, batch.invoke_chunk)
+        with timer.stage('invoke'):
+            response = sm.invoke_endpoint(
+                EndpointName=endpoint_name,
+                Body=data,
+                ContentType=content_type,
+                Accept=accept if passthrough else responses.JSON
+            )
+        with timer.stage('read'):
+            response_body = response['Body'].read()
+            if passthrough and response.get('ContentType', '').split(';')[0] != accept:
+                # Endpoint can't produce the requested type, so format it here
+                passthrough = False
+                key = None
+            cached = response_body if passthrough else batch.parse_predictions(response_body)
+        if key is not None:
+            predictions_cache.put(key, cached)
+
+        if mirrored is not None:
+            latency = timer.stages['invoke'] + timer.stages['read']
+            with timer.stage('shadow'):
+                shadow.compare(mirrored, shadow.Variant(endpoint_name, latency, cached), deadline)
 
     # Return predictions
-    return {
-        "statusCode": 200,
-        "body": json.dumps({
-            "version": commit_id,
-            "endpoint_name": endpoint_name, # TEMP for debugging
-            "predictions": predictions
-        }),
-    }
+    with timer.stage('serialize'):
+        if passthrough:
+            return responses.passthrough(cached, accept, commit_id, endpoint_name), len(rows)
+        return responses.format_predictions(accept, cached, commit_id, endpoint_name), len(rows)
+
+def predict_batch(timer, predictions_cache, config, records, content_type, accept, deadline):
+    """Predict a list of records, returning the response and record count"""
+    predictions, errors = predict_records(timer, predictions_cache, config, records, content_type, deadline)
+    # Only fail the request when every record failed, as a bad request unless the endpoint failed
+    status_code = 200
+    if errors and all(p is None for p in predictions):
+        status_code = 400 if all('record' in e for e in errors) else 502
+    with timer.stage('serialize'):
+        return responses.format_predictions(
+            accept, predictions, config.commit_id, config.endpoint_name,
+            errors=errors, status_code=status_code), len(records)
+
+def predict_records(timer, predictions_cache, config, records, content_type, deadline):
+    """Validate and convert records, then invoke the valid ones in parallel chunks
+
+    Returns predictions in input order with None for rejected or failed records.
+    """
+    with timer.stage('convert'):
+        rows, index, errors = payload.prepare(records, content_type)
+        if payload.is_supported(content_type):
+            content_type = payload.ENDPOINT_CONTENT_TYPE
+    results = None
+    if local_model.enabled():
+        with timer.stage('local'):
+            results = predict_local(config, rows, content_type)
+    chunk_errors = []
+    if results is None:
+        sm = runtime.client('sagemaker-runtime')
+        # Mirror batches that fit in a single candidate request
+        mirrored = None
+        if rows and shadow.should_mirror(config.endpoint_name) and len(batch.chunk_records(rows)) == 1:
+            mirrored = shadow.mirror(sm, config.endpoint_name, rows, content_type, batch.invoke_chunk)
+        with timer.stage('invoke'):
+            results, chunk_errors = invoke_batch_cached(sm, predictions_cache, config, rows, content_type)
+        if mirrored is not None and not chunk_errors:
+            primary = shadow.Variant(config.endpoint_name, timer.stages['invoke'], results)
+            with timer.stage('shadow'):
+                shadow.compare(mirrored, primary, deadline)
+
+    predictions = [None] * len(records)
+    for i, prediction in zip(index, results):
+        predictions[i] = prediction
+    return predictions, errors + remap_errors(chunk_errors, index)
+
+def predict_local(config, rows, content_type):
+    """Return in-process predictions for small requests, or None to use the endpoint"""
+    if not local_model.can_serve(len(rows)) or not payload.is_supported(content_type):
+        return None
+    model = local_model.get_model(runtime.client('s3'), config.commit_id)
+    if model is None:
+        return None
+    features, valid, errors = payload.parse(rows, content_type)
+    return local_model.predict(model, features)
+
+def remap_errors(errors, index):
+    """Report chunk ranges against the records the chunk rows were taken from"""
+    for error in errors:
+        error['start'] = index[error['start']]
+        error['end'] = index[error['end'] - 1] + 1
+    return errors
+
+def invoke_batch_cached(sm, predictions_cache, config, records, content_type):
+    """Invoke only the records missing from the cache, caching new predictions"""
+    if predictions_cache is None:
+        return batch.invoke_batch(
+            sm, runtime.executor(), config.endpoint_name, records, content_type)
+
+    keys = [cache.make_key(config.endpoint_name, config.commit_id, content_type, 'record', record)
+            for record in records]
+    predictions = [predictions_cache.get(key) for key in keys]
+    missing = [i for i, prediction in enumerate(predictions) if prediction is None]
+    errors = []
+    if missing:
+        results, errors = batch.invoke_batch(
+            sm, runtime.executor(), config.endpoint_name,
+            [records[i] for i in missing], content_type)
+        for i, prediction in zip(missing, results):
+            predictions[i] = prediction
+            if prediction is not None:
+                predictions_cache.put(keys[i], prediction)
+        errors = remap_errors(errors, missing)
+    return predictions, errors
@@ -0,0 +1,94 @@
+import json
+import os
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+# Batch prediction support for the regression function.
+# Records are packed into newline delimited payloads that stay under the
+# SageMaker invoke payload limit (6 MB) and the chunks are invoked in parallel.
+# See: https://docs.aws.amazon.com/sagemaker/latest/dg/API_runtime_InvokeEndpoint.html
+
+MAX_PAYLOAD_BYTES = int(os.environ.get('MAX_PAYLOAD_BYTES', str(5 * 1024 * 1024)))
+MAX_RECORDS_PER_CHUNK = int(os.environ.get('MAX_RECORDS_PER_CHUNK', '1000'))
+
+def chunk_records(records, max_bytes=None, max_records=None):
+    """Split records into (start, end) index ranges whose joined payload fits max_bytes
+
+    A record larger than max_bytes is returned in a chunk of its own so the
+    endpoint error is reported against that record only.
+    """
+    max_bytes = max_bytes or MAX_PAYLOAD_BYTES
+    max_records = max_records or MAX_RECORDS_PER_CHUNK
+    chunks = []
+    start = 0
+    size = 0
+    for i, record in enumerate(records):
+        record_size = len(record.encode('utf-8')) + 1 # Trailing newline
+        if i > start and (size + record_size > max_bytes or i - start >= max_records):
+            chunks.append((start, i))
+            start = i
+            size = 0
+        size += record_size
+    if start < len(records):
+        chunks.append((start, len(records)))
+    return chunks
+
+def parse_predictions(body):
+    """Parse an endpoint response body into a list with one prediction per row"""
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        # CSV or newline delimited output
+        return [float(value) for value in text.replace('\n', ',').split(',') if value.strip()]
+    if isinstance(parsed, dict):
+        parsed = parsed.get('predictions', [])
+    if not isinstance(parsed, list):
+        parsed = [parsed]
+    if parsed and isinstance(parsed[0], dict):
+        return [p.get('score', p.get('predicted_label')) for p in parsed]
+    return parsed
+
+def invoke_chunk(sm, endpoint_name, records, content_type, accept='application/json'):
+    """Invoke the endpoint with records packed as a multi-line payload"""
+    response = sm.invoke_endpoint(
+        EndpointName=endpoint_name,
+        Body='\n'.join(records),
+        ContentType=content_type,
+        Accept=accept
+    )
+    predictions = parse_predictions(response['Body'].read())
+    if len(predictions) != len(records):
+        raise ValueError('Expected {} predictions got {}'.format(len(records), len(predictions)))
+    return predictions
+
+def invoke_batch(sm, executor, endpoint_name, records, content_type, accept='application/json'):
+    """Invoke records in parallel chunks
+
+    Returns predictions in input order, with None for records in failed chunks,
+    and a list of errors describing each failed chunk.
+    """
+    chunks = chunk_records(records)
+    futures = [
+        executor.submit(invoke_chunk, sm, endpoint_name, records[start:end], content_type, accept)
+        for start, end in chunks
+    ]
+
+    predictions = [None] * len(records)
+    errors = []
+    for index, ((start, end), future) in enumerate(zip(chunks, futures)):
+        try:
+            predictions[start:end] = future.result()
+        except ClientError as e:
+            errors.append(chunk_error(index, start, end, e.response['Error']['Message']))
+        except (BotoCoreError, ValueError) as e: # eg. a read timeout or a malformed response
+            errors.append(chunk_error(index, start, end, str(e)))
+    return predictions, errors
+
+def chunk_error(index, start, end, message):
+    return {
+        "chunk": index,
+        "start": start,
+        "end": end,
+        "message": message
+    }
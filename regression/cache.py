@@ -0,0 +1,134 @@
+import collections
+import hashlib
+import importlib
+import json
+import os
+import threading
+import time
+
+# In-process prediction cache for the regression function.
+# Entries are keyed on the endpoint, deployed commit and payload, so a new
+# deployment (new COMMIT_ID) never serves predictions from the previous model.
+# An optional second tier (eg. ElastiCache) can be plugged in with
+# PREDICTION_CACHE_TIER=module:factory, where factory() returns an object with
+# get(key) and put(key, value, ttl) methods.
+
+CACHE_ENABLED = os.environ.get('PREDICTION_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CACHE_MAX_ENTRIES = int(os.environ.get('PREDICTION_CACHE_MAX_ENTRIES', '10000'))
+CACHE_MAX_BYTES = int(os.environ.get('PREDICTION_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', '300'))
+CACHE_TIER = os.environ.get('PREDICTION_CACHE_TIER')
+
+_cache = None
+
+def normalize_payload(payload):
+    """Normalize whitespace and line endings so equivalent payloads share a key"""
+    lines = payload.replace('\r\n', '\n').strip().split('\n')
+    return '\n'.join(' '.join(line.split()) for line in lines)
+
+def make_key(endpoint_name, commit_id, content_type, kind, payload):
+    """Hash the inputs that determine a prediction
+
+    kind distinguishes whole payload responses from per record predictions.
+    """
+    digest = hashlib.sha256()
+    for part in (endpoint_name, commit_id, content_type, kind, normalize_payload(payload)):
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def value_size(value):
+    """Approximate a value's size by its serialized length, as sys.getsizeof doesn't count list items"""
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return len(json.dumps(value, separators=(',', ':')))
+
+class PredictionCache:
+    """LRU cache with a TTL and an approximate memory bound"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES,
+                 ttl=CACHE_TTL, second_tier=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.second_tier = second_tier
+        self.clock = clock
+        self.bytes = 0
+        self.counters = collections.Counter()
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value or None, promoting second tier hits"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, expires = entry
+                if expires > self.clock():
+                    self._entries.move_to_end(key)
+                    self.counters['hits'] += 1
+                    return value
+                self._remove(key)
+                self.counters['expirations'] += 1
+
+        if self.second_tier is not None:
+            value = self.second_tier.get(key)
+            if value is not None:
+                with self._lock:
+                    self.counters['tier2_hits'] += 1
+                self._put_local(key, value)
+                return value
+
+        with self._lock:
+            self.counters['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        self._put_local(key, value)
+        if self.second_tier is not None:
+            self.second_tier.put(key, value, self.ttl)
+
+    def _put_local(self, key, value):
+        size = len(key) + value_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, self.clock() + self.ttl)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+
+    def _remove(self, key):
+        value, size, expires = self._entries.pop(key)
+        self.bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.counters['hits'],
+                "tier2_hits": self.counters['tier2_hits'],
+                "misses": self.counters['misses'],
+                "evictions": self.counters['evictions'],
+                "expirations": self.counters['expirations'],
+                "entries": len(self._entries),
+                "bytes": self.bytes
+            }
+
+def load_tier(spec):
+    """Build a second tier from a module:factory spec"""
+    module_name, factory_name = spec.split(':')
+    return getattr(importlib.import_module(module_name), factory_name)()
+
+def get_cache():
+    """Return the container wide cache, or None when disabled"""
+    global _cache
+    if _cache is None and CACHE_ENABLED:
+        _cache = PredictionCache(second_tier=load_tier(CACHE_TIER) if CACHE_TIER else None)
+    return _cache
+
+def reset():
+    global _cache
+    _cache = None
@@ -0,0 +1,134 @@
+import collections
+import datetime
+import math
+import os
+import time
+
+# Cooldown capacity planning for the post traffic hook.
+# After traffic shifts, the previous (cooldown) endpoint is kept warm for a
+# fast rollback. Rather than pinning it to one instance, its capacity is sized
+# from the traffic both the blue and green endpoints served recently: the peak
+# combined invocation rate, converted to instances by throughput (invocations
+# per instance per minute, as used by autoscaling) and by concurrency (rate
+# times ModelLatency, by Little's law), whichever needs more.
+# See: https://docs.aws.amazon.com/sagemaker/latest/dg/monitoring-cloudwatch.html
+
+LIVE_ENDPOINT_NAME = os.environ.get('LIVE_ENDPOINT_NAME')
+LIVE_VARIANT_NAME = os.environ.get('LIVE_VARIANT_NAME', 'AllTraffic')
+LOOKBACK_MINUTES = int(os.environ.get('CAPACITY_LOOKBACK_MINUTES', '60'))
+PERIOD_SECONDS = int(os.environ.get('CAPACITY_PERIOD_SECONDS', '60'))
+INVOCATIONS_PER_INSTANCE = float(os.environ.get('INVOCATIONS_PER_INSTANCE', '100'))
+CONCURRENCY_PER_INSTANCE = float(os.environ.get('CONCURRENCY_PER_INSTANCE', '4'))
+# Fraction of the peak traffic the cooldown endpoint must absorb on rollback
+ROLLBACK_FRACTION = float(os.environ.get('ROLLBACK_FRACTION', '1.0'))
+HEADROOM = float(os.environ.get('CAPACITY_HEADROOM', '1.2'))
+MIN_CAPACITY = int(os.environ.get('COOLDOWN_MIN_CAPACITY', '1'))
+# The cooldown endpoint takes all traffic on rollback, so it may scale as far as the live endpoint
+MAX_CAPACITY = int(os.environ.get('COOLDOWN_MAX_CAPACITY', '1'))
+
+# Endpoint status backoff
+WAIT_INITIAL_SECONDS = float(os.environ.get('ENDPOINT_WAIT_INITIAL_SECONDS', '2'))
+WAIT_MAX_SECONDS = float(os.environ.get('ENDPOINT_WAIT_MAX_SECONDS', '30'))
+TRANSITIONAL_STATUSES = ('Creating', 'Updating', 'SystemUpdating', 'RollingBack')
+
+Variant = collections.namedtuple('Variant', ['endpoint_name', 'variant_name'])
+Plan = collections.namedtuple('Plan', [
+    'capacity',
+    'peak_invocations_per_minute',
+    'latency_ms',
+    'throughput_instances',
+    'concurrency_instances',
+])
+
+def wait_in_service(sm, endpoint_name, until, sleep=time.sleep):
+    """Describe the endpoint until it leaves a transitional status or the deadline passes
+
+    Polls with exponential backoff and returns the last describe_endpoint response.
+    """
+    delay = WAIT_INITIAL_SECONDS
+    while True:
+        response = sm.describe_endpoint(EndpointName=endpoint_name)
+        status = response['EndpointStatus']
+        remaining = until - time.time()
+        if status not in TRANSITIONAL_STATUSES or remaining <= 0:
+            return response
+        print('endpoint {} is {}, waiting {:.1f}s'.format(endpoint_name, status, min(delay, remaining)))
+        sleep(min(delay, remaining))
+        delay = min(delay * 2, WAIT_MAX_SECONDS)
+
+def get_traffic(cw, variants, lookback_minutes=None, period=None, now=None):
+    """Read Invocations and ModelLatency for each variant with one GetMetricData call
+
+    Returns a dict of Variant to {'invocations': {timestamp: sum}, 'latency_ms': {timestamp: average}}
+    """
+    lookback_minutes = lookback_minutes or LOOKBACK_MINUTES
+    period = period or PERIOD_SECONDS
+    end = now or datetime.datetime.now(datetime.timezone.utc)
+    start = end - datetime.timedelta(minutes=lookback_minutes)
+
+    queries = []
+    for i, variant in enumerate(variants):
+        dimensions = [
+            {'Name': 'EndpointName', 'Value': variant.endpoint_name},
+            {'Name': 'VariantName', 'Value': variant.variant_name},
+        ]
+        for prefix, metric_name, stat in (('i', 'Invocations', 'Sum'), ('l', 'ModelLatency', 'Average')):
+            queries.append({
+                'Id': '{}{}'.format(prefix, i),
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': 'AWS/SageMaker',
+                        'MetricName': metric_name,
+                        'Dimensions': dimensions
+                    },
+                    'Period': period,
+                    'Stat': stat
+                },
+                'ReturnData': True
+            })
+
+    traffic = {v: {'invocations': {}, 'latency_ms': {}} for v in variants}
+    kwargs = {'MetricDataQueries': queries, 'StartTime': start, 'EndTime': end}
+    while True:
+        response = cw.get_metric_data(**kwargs)
+        for result in response['MetricDataResults']:
+            variant = variants[int(result['Id'][1:])]
+            series = traffic[variant]['invocations' if result['Id'][0] == 'i' else 'latency_ms']
+            for timestamp, value in zip(result['Timestamps'], result['Values']):
+                # ModelLatency is reported in microseconds
+                series[timestamp] = value if result['Id'][0] == 'i' else value / 1000.0
+        if not response.get('NextToken'):
+            return traffic
+        kwargs['NextToken'] = response['NextToken']
+
+def plan(traffic, max_capacity, period=None, min_capacity=None):
+    """Return the cooldown Plan for the combined traffic of all variants"""
+    period = period or PERIOD_SECONDS
+    min_capacity = MIN_CAPACITY if min_capacity is None else min_capacity
+
+    # Combine variants per period, as traffic moves from one to the other during a deployment
+    combined = collections.Counter()
+    weighted_latency = 0.0
+    latency_invocations = 0.0
+    for series in traffic.values():
+        for timestamp, invocations in series['invocations'].items():
+            combined[timestamp] += invocations
+            latency = series['latency_ms'].get(timestamp)
+            if latency is not None:
+                weighted_latency += latency * invocations
+                latency_invocations += invocations
+
+    peak_per_minute = max(combined.values()) * 60.0 / period if combined else 0.0
+    latency_ms = weighted_latency / latency_invocations if latency_invocations else 0.0
+    throughput_instances = peak_per_minute / INVOCATIONS_PER_INSTANCE
+    concurrency_instances = peak_per_minute / 60.0 * latency_ms / 1000.0 / CONCURRENCY_PER_INSTANCE
+    needed = math.ceil(max(throughput_instances, concurrency_instances) * ROLLBACK_FRACTION * HEADROOM)
+    capacity = max(min_capacity, min(needed, max_capacity))
+    return Plan(capacity, round(peak_per_minute, 3), round(latency_ms, 3),
+                round(throughput_instances, 3), round(concurrency_instances, 3))
+
+def current_capacity(response, variant_name):
+    for variant in response.get('ProductionVariants', []):
+        if variant['VariantName'] == variant_name:
+            return variant.get('DesiredInstanceCount', variant.get('CurrentInstanceCount'))
+    return None
@@ -0,0 +1,159 @@
+import collections
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+try:
+    from . import batch, runtime
+except ImportError:  # Lambda loads the handler as a top level module
+    import batch
+    import runtime
+
+# Golden set regression and latency SLO gate for the pre traffic hook.
+# The golden set is built by workflow/training/golden_set.py from validation
+# rows of each class, labelled with their Target class and the class the live
+# model predicts (expected). It is replayed concurrently against the new
+# endpoint, and the deployment fails if the predicted classes agree with the
+# live model less than GOLDEN_MIN_AGREEMENT, or on errors or latency.
+# The replay stops at a deadline taken from the Lambda context, leaving time
+# to report the hook status. Without a GOLDEN_SET, eg. a stack deployed outside
+# the pipeline, only LATENCY_PAYLOAD is replayed to gate on errors and latency.
+
+GOLDEN_SET = os.environ.get('GOLDEN_SET', '') # s3:// uri or local path
+GOLDEN_CONCURRENCY = int(os.environ.get('GOLDEN_CONCURRENCY', '4'))
+GOLDEN_ROUNDS = int(os.environ.get('GOLDEN_ROUNDS', '2'))
+GOLDEN_MIN_AGREEMENT = float(os.environ.get('GOLDEN_MIN_AGREEMENT', '0.95'))
+GOLDEN_MIN_ACCURACY = float(os.environ.get('GOLDEN_MIN_ACCURACY', '0')) # Against the labels, 0 to only report
+# A libsvm row any model accepts, replayed when there is no golden set
+LATENCY_PAYLOAD = os.environ.get('LATENCY_PAYLOAD', '0:0')
+LATENCY_REQUESTS = int(os.environ.get('LATENCY_REQUESTS', '10'))
+GOLDEN_MAX_ERROR_RATE = float(os.environ.get('GOLDEN_MAX_ERROR_RATE', '0'))
+LATENCY_SLO_P50_MS = float(os.environ.get('LATENCY_SLO_P50_MS', '200'))
+LATENCY_SLO_P99_MS = float(os.environ.get('LATENCY_SLO_P99_MS', '1000'))
+# Time kept back from the deadline to report the lifecycle hook status
+RESERVE_MS = int(os.environ.get('GOLDEN_RESERVE_MS', '3000'))
+
+Result = collections.namedtuple('Result', ['index', 'prediction', 'latency_ms', 'error'])
+
+def load(path=None):
+    """Load a golden set: {"name", "version", "content_type", "records": [{"payload", "label", "expected"}]}"""
+    path = path or GOLDEN_SET
+    if not path:
+        raise ValueError('GOLDEN_SET is not configured')
+    if path.startswith('s3://'):
+        bucket, key = path[len('s3://'):].split('/', 1)
+        golden = json.loads(runtime.client('s3').get_object(Bucket=bucket, Key=key)['Body'].read())
+    else:
+        with open(path) as f:
+            golden = json.load(f)
+    if not golden.get('records'):
+        raise ValueError('Golden set has no records: {}'.format(path))
+    return golden
+
+def latency_set():
+    """Return a golden set of unlabelled LATENCY_PAYLOAD records, to only check errors and latency"""
+    return {
+        'name': 'latency',
+        'version': 'unconfigured',
+        'content_type': 'text/libsvm',
+        'records': [{'payload': LATENCY_PAYLOAD} for _ in range(LATENCY_REQUESTS)],
+    }
+
+def deadline(context, reserve_ms=None):
+    """Return the time.time() by which the replay must finish"""
+    return runtime.deadline(context, RESERVE_MS if reserve_ms is None else reserve_ms)
+
+def replay(sm, endpoint_name, golden, until, concurrency=None, rounds=None):
+    """Invoke the endpoint once per record per round, concurrently, until the deadline
+
+    Returns the results and the number of requests not completed in time.
+    """
+    records = golden['records']
+    content_type = golden.get('content_type', 'text/libsvm')
+
+    def invoke(index):
+        if time.time() >= until:
+            return Result(index, None, None, 'deadline exceeded')
+        start = time.perf_counter()
+        try:
+            prediction = batch.invoke_chunk(sm, endpoint_name, [records[index]['payload']], content_type)[0]
+            return Result(index, prediction, (time.perf_counter() - start) * 1000, None)
+        except (ClientError, BotoCoreError, ValueError) as e:
+            return Result(index, None, (time.perf_counter() - start) * 1000, str(e))
+
+    # Warm up the connection so the TLS handshake isn't measured against the SLO
+    invoke(0)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency or GOLDEN_CONCURRENCY)
+    futures = [executor.submit(invoke, i)
+               for _ in range(rounds or GOLDEN_ROUNDS) for i in range(len(records))]
+    done, not_done = wait(futures, timeout=max(0, until - time.time()))
+    for future in not_done:
+        future.cancel()
+    executor.shutdown(wait=False)
+    results = [f.result() for f in futures if f in done]
+    return results, len(not_done)
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def evaluate(golden, results, timed_out=0):
+    """Check results against the correctness thresholds and latency SLO
+
+    Returns a summary dict with passed and a list of failures.
+    """
+    records = golden['records']
+    failures = []
+    requests = len(results) + timed_out
+    errors = [r for r in results if r.error]
+    latencies = [r.latency_ms for r in results if not r.error]
+
+    predictions = {}
+    for r in results:
+        if not r.error:
+            predictions.setdefault(r.index, r.prediction)
+
+    # Predictions and labels are classes, compared as whole numbers
+    labelled = [(predictions[i], records[i]['label']) for i in predictions if 'label' in records[i]]
+    accuracy = sum(round(p) == round(y) for p, y in labelled) / len(labelled) if labelled else None
+    expected = [(predictions[i], records[i]['expected']) for i in predictions if 'expected' in records[i]]
+    agreement = sum(round(p) == round(e) for p, e in expected) / len(expected) if expected else None
+
+    if timed_out:
+        failures.append('{} of {} requests not completed before the deadline'.format(timed_out, requests))
+    if requests and (len(errors) + timed_out) / requests > GOLDEN_MAX_ERROR_RATE:
+        failures.append('{} errors, first: {}'.format(len(errors), errors[0].error) if errors
+                        else 'error rate above {}'.format(GOLDEN_MAX_ERROR_RATE))
+    if len(predictions) < len(records):
+        failures.append('{} of {} golden records without a prediction'.format(
+            len(records) - len(predictions), len(records)))
+    if accuracy is not None and accuracy < GOLDEN_MIN_ACCURACY:
+        failures.append('accuracy {:.3f} below {}'.format(accuracy, GOLDEN_MIN_ACCURACY))
+    if agreement is not None and agreement < GOLDEN_MIN_AGREEMENT:
+        failures.append('agreement {:.3f} below {}'.format(agreement, GOLDEN_MIN_AGREEMENT))
+
+    p50 = percentile(latencies, 50) if latencies else None
+    p99 = percentile(latencies, 99) if latencies else None
+    if p50 is not None and p50 > LATENCY_SLO_P50_MS:
+        failures.append('p50 latency {:.1f}ms above SLO {}ms'.format(p50, LATENCY_SLO_P50_MS))
+    if p99 is not None and p99 > LATENCY_SLO_P99_MS:
+        failures.append('p99 latency {:.1f}ms above SLO {}ms'.format(p99, LATENCY_SLO_P99_MS))
+
+    return {
+        "golden_set": '{}/{}'.format(golden.get('name'), golden.get('version')),
+        "records": len(records),
+        "requests": requests,
+        "errors": len(errors),
+        "timed_out": timed_out,
+        "accuracy": accuracy,
+        "agreement": agreement,
+        "p50_ms": round(p50, 3) if p50 is not None else None,
+        "p99_ms": round(p99, 3) if p99 is not None else None,
+        "passed": not failures,
+        "failures": failures
+    }
@@ -0,0 +1,112 @@
+import os
+import pickle
+import shutil
+import tarfile
+import threading
+import time
+
+# Optional in-process inference for the regression function.
+# With INFERENCE_MODE=local the model artifact for the deployed COMMIT_ID is
+# downloaded once per container, cached under /tmp and used to score small
+# requests without the network hop to the SageMaker endpoint. Large requests,
+# or any failure to load the model, fall back to invoke_endpoint.
+# Requires xgboost to be packaged with the function, eg. as a Lambda layer.
+
+INFERENCE_MODE = os.environ.get('INFERENCE_MODE', 'endpoint')
+MODEL_DATA_URL = os.environ.get('MODEL_DATA_URL')
+MODEL_CACHE_DIR = os.environ.get('MODEL_CACHE_DIR', '/tmp/model')
+LOCAL_MAX_ROWS = int(os.environ.get('LOCAL_MAX_ROWS', '16'))
+RETRY_SECONDS = float(os.environ.get('LOCAL_MODEL_RETRY_SECONDS', '300'))
+# Native XGBoost formats load faster and across library versions, model.bin
+# is the pickled booster written by earlier training jobs
+MODEL_FILES = ('model.ubj', 'model.json', 'model.bin')
+
+_model = None
+_failed_at = None
+_lock = threading.Lock()
+
+def enabled():
+    return INFERENCE_MODE == 'local' and bool(MODEL_DATA_URL)
+
+def can_serve(n_rows):
+    """Return True when n_rows is small enough to score in-process"""
+    return enabled() and 0 < n_rows <= LOCAL_MAX_ROWS
+
+def get_model(s3, commit_id):
+    """Return the loaded booster, or None if it could not be loaded
+
+    A failed load is retried at most once every RETRY_SECONDS so a missing
+    artifact doesn't add a download attempt to every request.
+    """
+    global _model, _failed_at
+    if _model is not None:
+        return _model
+    if _failed_at is not None and time.time() - _failed_at < RETRY_SECONDS:
+        return None
+    with _lock:
+        if _model is None:
+            try:
+                _model = load(download(s3, MODEL_DATA_URL, commit_id))
+                _failed_at = None
+            except Exception as e: # Any failure falls back to the endpoint
+                print('local model error', e)
+                _failed_at = time.time()
+    return _model
+
+def download(s3, model_data_url, commit_id):
+    """Download and extract model.tar.gz into a per commit directory under /tmp
+
+    /tmp survives between invocations of a container, so the artifact is only
+    fetched when it isn't already on local disk.
+    """
+    model_dir = os.path.join(MODEL_CACHE_DIR, commit_id or 'latest')
+    if any(os.path.exists(os.path.join(model_dir, f)) for f in MODEL_FILES):
+        return model_dir
+
+    bucket, _, key = model_data_url.replace('s3://', '', 1).partition('/')
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    archive = model_dir + '.tar.gz'
+    start = time.time()
+    s3.download_file(bucket, key, archive)
+
+    # Extract to a temporary directory and rename so a partial extract is never used
+    staging = model_dir + '.partial'
+    shutil.rmtree(staging, ignore_errors=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(staging, members=safe_members(tar))
+    os.rename(staging, model_dir)
+    os.remove(archive)
+    print('downloaded model {} in: {}'.format(model_data_url, time.time() - start))
+    return model_dir
+
+def safe_members(tar):
+    """Only extract regular files that stay inside the target directory"""
+    return [m for m in tar.getmembers()
+            if m.isfile() and not os.path.isabs(m.name) and '..' not in m.name.split('/')]
+
+def load(model_dir):
+    """Load the first of MODEL_FILES present in model_dir"""
+    import xgboost # Imported lazily, only needed in local mode
+    name = next((f for f in MODEL_FILES if os.path.exists(os.path.join(model_dir, f))), None)
+    if name is None:
+        raise ValueError('No model in {}'.format(model_dir))
+    path = os.path.join(model_dir, name)
+    if name == 'model.bin':
+        with open(path, 'rb') as f:
+            model = pickle.load(f)
+    else:
+        model = xgboost.Booster()
+        model.load_model(path)
+    if not isinstance(model, xgboost.Booster):
+        raise ValueError('Unexpected model type: {}'.format(type(model)))
+    return model
+
+def predict(model, features):
+    """Score a (rows, features) array, treating NaN as missing"""
+    # inplace_predict skips building a DMatrix, which dominates small requests
+    return model.inplace_predict(features).tolist()
+
+def reset():
+    global _model, _failed_at
+    _model = None
+    _failed_at = None
@@ -0,0 +1,77 @@
+import collections
+import contextlib
+import json
+import os
+import random
+import time
+
+# Per stage latency metrics written as CloudWatch Embedded Metric Format (EMF)
+# log lines, which CloudWatch Logs turns into metrics without any API calls.
+# See: https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'SamSageMaker/Regression')
+PAYLOAD_LOG_SAMPLE_RATE = float(os.environ.get('PAYLOAD_LOG_SAMPLE_RATE', '0'))
+
+MILLISECONDS = 'Milliseconds'
+COUNT = 'Count'
+
+class StageTimer:
+    """Accumulate wall time per named stage of a request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name, elapsed_ms):
+        self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+def document(dimensions, metrics, properties=None, namespace=None):
+    """Build an EMF document
+
+    dimensions: dict of dimension name to value
+    metrics: dict of metric name to (value, unit)
+    properties: extra fields searchable in Logs Insights but not metrics
+    """
+    doc = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": namespace or NAMESPACE,
+                "Dimensions": [list(dimensions)],
+                "Metrics": [{"Name": name, "Unit": unit} for name, (value, unit) in metrics.items()]
+            }]
+        }
+    }
+    doc.update(properties or {})
+    doc.update(dimensions)
+    doc.update((name, value) for name, (value, unit) in metrics.items())
+    return doc
+
+def emit(dimensions, metrics, properties=None, namespace=None):
+    print(json.dumps(document(dimensions, metrics, properties, namespace), separators=(',', ':')))
+
+def emit_stages(timer, dimensions, counts=None, properties=None):
+    """Emit each stage as <Stage>Latency plus the overall Latency"""
+    metrics = collections.OrderedDict(
+        ('{}Latency'.format(name.capitalize()), (round(elapsed, 3), MILLISECONDS))
+        for name, elapsed in timer.stages.items())
+    metrics['Latency'] = (round(timer.total_ms(), 3), MILLISECONDS)
+    for name, value in (counts or {}).items():
+        metrics[name] = (value, COUNT)
+    emit(dimensions, metrics, properties)
+
+def log_payload(endpoint_name, content_type, data):
+    """Log a sample of request payloads, none by default"""
+    if PAYLOAD_LOG_SAMPLE_RATE > 0 and random.random() < PAYLOAD_LOG_SAMPLE_RATE:
+        print('payload', endpoint_name, content_type, json.dumps(data))
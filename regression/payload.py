@@ -0,0 +1,243 @@
+import os
+import warnings
+
+import numpy as np
+
+# Vectorized request parsing, validation and conversion for the regression function.
+# Records are checked against the feature schema (the 8 abalone features sent by
+# the pre traffic hook) so malformed rows are rejected without an endpoint call.
+# Rows are parsed as whole arrays with numpy rather than one Python loop per row.
+
+LIBSVM = 'text/libsvm'
+CSV = 'text/csv'
+JSON = 'application/json'
+
+FEATURE_COUNT = int(os.environ.get('FEATURE_COUNT', '8'))
+ENDPOINT_CONTENT_TYPE = os.environ.get('ENDPOINT_CONTENT_TYPE', LIBSVM)
+
+# Row separator token, never produced by str.split()
+_SENTINEL = '\x00'
+
+def is_supported(content_type):
+    return content_type in (LIBSVM, CSV, JSON)
+
+def parse(records, content_type, n_features=None):
+    """Parse records into a (rows, n_features) float array with NaN for missing features
+
+    Returns the features, a boolean mask of valid rows and a dict of row index
+    to error message for the rows that were rejected. Rows without any
+    feature, eg. empty lines, all empty CSV cells or all null instances, are
+    rejected as they can't be sent to the endpoint. libsvm and CSV records must
+    be strings, other values such as numbers, lists or null are rejected.
+    """
+    n_features = n_features or FEATURE_COUNT
+    errors = {}
+    if content_type in (LIBSVM, CSV):
+        _reject(errors, [i for i, r in enumerate(records) if not isinstance(r, str)], 'record is not a string')
+        records = ['' if i in errors else r for i, r in enumerate(records)]
+    if content_type == LIBSVM:
+        features, valid, parsed = parse_libsvm(records, n_features)
+    elif content_type == CSV:
+        features, valid, parsed = parse_csv(records, n_features)
+    elif content_type == JSON:
+        features, valid, parsed = parse_instances(records, n_features)
+    else:
+        raise ValueError('Unsupported content type: {}'.format(content_type))
+    for row, message in parsed.items():
+        errors.setdefault(row, message)
+    _reject(errors, np.flatnonzero(valid & np.isnan(features).all(axis=1)), 'no features')
+    return _result(features, errors)
+
+def parse_libsvm(lines, n_features):
+    """Parse libsvm lines with 0 based feature indexes, as read by XGBoost"""
+    n_rows = len(lines)
+    features = np.full((n_rows, n_features), np.nan)
+    errors = {}
+
+    # Tokenize every row at once, marking row boundaries with a sentinel
+    tokens = np.array((' ' + _SENTINEL + ' ').join(lines).split() + [_SENTINEL])
+    boundary = tokens == _SENTINEL
+    row_ids = np.cumsum(boundary)[~boundary]
+    tokens = tokens[~boundary]
+    if not len(tokens):
+        return _result(features, errors) # Only empty lines, rejected for having no features
+    first = np.ones(len(tokens), dtype=bool)
+    first[1:] = row_ids[1:] != row_ids[:-1]
+
+    parts = np.char.partition(tokens, ':')
+    has_index = parts[:, 1] == ':'
+    _reject(errors, row_ids[~has_index & ~first], 'unexpected token without a feature index')
+
+    # A leading token without an index is the label, which is ignored for inference
+    row_ids = row_ids[has_index]
+    indexes = parts[has_index, 0]
+    values = parts[has_index, 2]
+
+    indexes, numeric_index = _to_float(indexes)
+    numeric_index &= indexes == np.floor(indexes)
+    _reject(errors, row_ids[~numeric_index], 'feature index is not an integer')
+    indexes = np.where(numeric_index, indexes, 0).astype(np.int64)
+    in_range = (indexes >= 0) & (indexes < n_features)
+    _reject(errors, row_ids[numeric_index & ~in_range], 'feature index out of range 0-{}'.format(n_features - 1))
+
+    values, numeric_value = _to_float(values)
+    _reject(errors, row_ids[~numeric_value], 'feature value is not a finite number')
+
+    keep = in_range & numeric_value
+    slots = row_ids[keep] * (n_features + 1) + indexes[keep]
+    unique, counts = np.unique(slots, return_counts=True)
+    _reject(errors, unique[counts > 1] // (n_features + 1), 'duplicate feature index')
+
+    features[row_ids[keep], indexes[keep]] = values[keep]
+    return _result(features, errors)
+
+def parse_csv(lines, n_features):
+    n_rows = len(lines)
+    features = np.full((n_rows, n_features), np.nan)
+    errors = {}
+
+    rows = np.array(lines, dtype=str)
+    widths = np.char.count(rows, ',') + 1
+    good = widths == n_features
+    _reject(errors, np.flatnonzero(~good), 'expected {} features'.format(n_features))
+
+    if good.any():
+        cells = np.array(','.join(rows[good].tolist()).split(','))
+        cells = np.where(np.char.strip(cells) == '', 'nan', cells)
+        values, numeric = _to_float(cells, allow_nan=True)
+        values = values.reshape(-1, n_features)
+        numeric = numeric.reshape(-1, n_features).all(axis=1)
+        good_rows = np.flatnonzero(good)
+        _reject(errors, good_rows[~numeric], 'feature value is not a finite number')
+        features[good_rows] = values
+    return _result(features, errors)
+
+def parse_instances(instances, n_features):
+    """Parse JSON instances, either lists of values or {"features": [...]} objects"""
+    rows = [i.get('features') if isinstance(i, dict) else i for i in instances]
+    try:
+        features = np.array(rows, dtype=float).reshape(len(rows), -1)
+        if features.shape[1] == n_features and np.isfinite(features[~np.isnan(features)]).all():
+            return _result(features, {})
+    except (TypeError, ValueError):
+        pass
+
+    # Ragged or non numeric input, validate row by row to report which rows failed
+    features = np.full((len(rows), n_features), np.nan)
+    errors = {}
+    for i, row in enumerate(rows):
+        try:
+            values = np.array(row, dtype=float)
+        except (TypeError, ValueError):
+            errors[i] = 'feature value is not a number'
+            continue
+        if values.shape != (n_features,):
+            errors[i] = 'expected {} features'.format(n_features)
+        elif np.isinf(values).any():
+            errors[i] = 'feature value is not a finite number'
+        else:
+            features[i] = values
+    return _result(features, errors)
+
+def to_libsvm(features):
+    """Format feature rows as libsvm strings with 0 based indexes, skipping missing (NaN) features"""
+    if len(features) == 0:
+        return []
+    rows, cols = np.nonzero(~np.isnan(features))
+    if len(np.unique(rows)) != len(features):
+        raise ValueError('libsvm rows need at least one feature')
+    tokens = _format(cols) + ':' + _format(features[rows, cols])
+    last = np.ones(len(rows), dtype=bool)
+    last[:-1] = rows[1:] != rows[:-1]
+    return _join(tokens, last)
+
+def to_csv(features):
+    """Format feature rows as dense CSV strings, leaving missing features empty"""
+    if len(features) == 0:
+        return []
+    cells = _format(features.ravel())
+    cells[np.isnan(features.ravel())] = ''
+    last = np.zeros(features.shape, dtype=bool)
+    last[:, -1] = True
+    return _join(cells, last.ravel(), separator=',')
+
+def to_instances(features):
+    """Format feature rows as JSON instance lists with None for missing features"""
+    values = features.astype(object)
+    values[np.isnan(features)] = None
+    return values.tolist()
+
+def convert(features, content_type):
+    if content_type == LIBSVM:
+        return to_libsvm(features)
+    if content_type == CSV:
+        return to_csv(features)
+    if content_type == JSON:
+        return to_instances(features)
+    raise ValueError('Unsupported content type: {}'.format(content_type))
+
+def prepare(records, content_type, target_type=None):
+    """Validate records and convert the valid ones for the endpoint
+
+    Returns the rows to send, the index of each row in records, and a list of
+    errors for rejected records. Records of an unknown content type are
+    returned unchanged.
+    """
+    target_type = target_type or ENDPOINT_CONTENT_TYPE
+    if not is_supported(content_type):
+        return records, list(range(len(records))), []
+    features, valid, errors = parse(records, content_type)
+    index = np.flatnonzero(valid)
+    if content_type == target_type:
+        rows = [records[i] for i in index]
+    else:
+        rows = convert(features[index], target_type)
+    return rows, index.tolist(), [
+        {"record": row, "message": message} for row, message in sorted(errors.items())]
+
+def _to_float(strings, allow_nan=False):
+    """Convert strings to floats, returning the values and a mask of valid numbers"""
+    values = None
+    if len(strings):
+        # Parse every value in one C call, falling back when any value is malformed
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            try:
+                values = np.fromstring(' '.join(strings.tolist()), sep=' ')
+            except ValueError:
+                pass
+    if values is None or len(values) != len(strings):
+        values = np.array([_safe_float(s) for s in strings.tolist()])
+    valid = np.isfinite(values)
+    if allow_nan:
+        valid |= np.isnan(values) & (np.char.strip(strings) == 'nan')
+    return values, valid
+
+def _safe_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.inf
+
+def _reject(errors, rows, message):
+    for row in np.unique(rows).tolist():
+        errors.setdefault(row, message)
+
+def _result(features, errors):
+    valid = np.ones(len(features), dtype=bool)
+    if errors:
+        valid[list(errors)] = False
+    return features, valid, errors
+
+def _format(values):
+    """Format values as an object array of the shortest strings that round trip"""
+    formatted = np.empty(len(values), dtype=object)
+    formatted[:] = list(map(repr, values.tolist()))
+    return formatted
+
+def _join(tokens, last, separator=' '):
+    """Join tokens into rows, ending a row after each token flagged in last"""
+    joined = np.empty(2 * len(tokens), dtype=object)
+    joined[0::2] = tokens
+    joined[1::2] = np.where(last, '\n', separator)
+    return ''.join(joined.tolist())[:-1].split('\n')
@@ -1,7 +1,11 @@
-import boto3
 from botocore.exceptions import ClientError
 import json
-import os
+
+try:
+    from . import capacity, runtime
+except ImportError:  # Lambda loads the handler as a top level module
+    import capacity
+    import runtime
 
 def lambda_handler(event, context):
     """Sample pure Lambda function
@@ -29,49 +33,65 @@ def lambda_handler(event, context):
     # See: https://awslabs.github.io/serverless-application-model/safe_lambda_deployments.html
 
     # Print the event
-    current_version = os.environ['CURRENT_VERSION']
-    endpoint_name = os.environ['ENDPOINT_NAME']
-    variant_name = os.environ['VARIANT_NAME']
-    instance_count = int(os.environ['INSTANCE_COUNT'])
-    print('version: {} endpoint: {}/{} instance count: {} event: {}'.format(
-        current_version, endpoint_name, variant_name, instance_count, json.dumps(event)))
+    config = runtime.get_config()
+    current_version = config.current_version
+    endpoint_name = config.endpoint_name
+    variant_name = config.variant_name
+    instance_count = config.instance_count
+    runtime.log_event('version: {} endpoint: {}/{} instance count: {}'.format(
+        current_version, endpoint_name, variant_name, instance_count), event)
 
-    # Get boto3 sagemaker client and endpoint
-    sm = boto3.client('sagemaker')
+    # Get cached sagemaker client
+    sm = runtime.client('sagemaker')
     error_message = None
 
     try:
-        # First check the endpoint is in service
-        response = sm.describe_endpoint(EndpointName=endpoint_name)
-        print('describe_endpoint', response)
         if instance_count == 0:
             # Delete the endpoint and config
+            response = sm.describe_endpoint(EndpointName=endpoint_name)
+            print('describe_endpoint', response)
             endpoint_config_name = response['EndpointConfigName']
             response = sm.delete_endpoint(EndpointName=endpoint_name)
             print('delete_endpoint', response)
             response = sm.delete_endpoint_config(EndpointConfigName=endpoint_config_name)
             print('delete_endpoint_config', response)
-        elif response['EndpointStatus'] == "InService":
-            # Return to the minimum instance count
-            response = sm.update_endpoint_weights_and_capacities(
-                EndpointName=endpoint_name,
-                DesiredWeightsAndCapacities=[
-                    {
-                        'VariantName': variant_name,
-                        'DesiredInstanceCount': 1
-                    },
-                ]
-            )
-            print('update_endpoint_weights_and_capacities', response)
         else:
-            print('endpoint not in service')
-            error_message = "Unable to update endpoint not InService"
+            # Wait for the endpoint to be in service, leaving time to report the status
+            response = capacity.wait_in_service(sm, endpoint_name, runtime.deadline(context, reserve_ms=5000))
+            print('describe_endpoint', response)
+            if response['EndpointStatus'] == "InService":
+                # Size the cooldown endpoint for the recent traffic of both endpoints
+                variants = [capacity.Variant(endpoint_name, variant_name)]
+                if capacity.LIVE_ENDPOINT_NAME:
+                    variants.append(capacity.Variant(capacity.LIVE_ENDPOINT_NAME, capacity.LIVE_VARIANT_NAME))
+                try:
+                    traffic = capacity.get_traffic(runtime.client('cloudwatch'), variants)
+                except ClientError as e:
+                    # Without metrics fall back to the minimum capacity
+                    print('metrics error', e)
+                    traffic = {}
+                plan = capacity.plan(traffic, max_capacity=capacity.MAX_CAPACITY, min_capacity=instance_count)
+                print('capacity_plan', json.dumps(plan._asdict()))
+                if capacity.current_capacity(response, variant_name) != plan.capacity:
+                    response = sm.update_endpoint_weights_and_capacities(
+                        EndpointName=endpoint_name,
+                        DesiredWeightsAndCapacities=[
+                            {
+                                'VariantName': variant_name,
+                                'DesiredInstanceCount': plan.capacity
+                            },
+                        ]
+                    )
+                    print('update_endpoint_weights_and_capacities', response)
+            else:
+                print('endpoint not in service')
+                error_message = "Unable to update endpoint not InService"
     except ClientError as e:
         print('endpoint error', e)
         error_message = e.response['Error']['Message']
 
-    # Get boto3 sagemaker client and endpoint
-    cd = boto3.client('codedeploy')
+    # Get cached codedeploy client
+    cd = runtime.client('codedeploy')
 
     try:
         if error_message and not error_message.startswith('Could not find endpoint'):
@@ -1,7 +1,29 @@
-import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
 import json
-import os
+
+try:
+    from . import golden, runtime
+except ImportError:  # Lambda loads the handler as a top level module
+    import golden
+    import runtime
+
+def check_golden_set(sm, endpoint_name, context):
+    """Return why the golden set failed against the endpoint, or None when it passed"""
+    if not golden.GOLDEN_SET:
+        print('golden set not configured, skipping the correctness check and checking latency only')
+        golden_set = golden.latency_set()
+    else:
+        try:
+            golden_set = golden.load()
+        except (OSError, ValueError, ClientError, BotoCoreError) as e:
+            return 'Unable to load golden set: {}'.format(e)
+    # Invocation errors are counted per request by replay
+    results, timed_out = golden.replay(sm, endpoint_name, golden_set, golden.deadline(context))
+    summary = golden.evaluate(golden_set, results, timed_out)
+    print('golden_set', json.dumps(summary))
+    if not summary['passed']:
+        return 'Golden set {} failed: {}'.format(summary['golden_set'], '; '.join(summary['failures']))
+    return None
 
 def lambda_handler(event, context):
     """Sample pure Lambda function
@@ -29,35 +51,24 @@ def lambda_handler(event, context):
     # See: https://awslabs.github.io/serverless-application-model/safe_lambda_deployments.html
 
     # Print the event
-    current_version = os.environ['CURRENT_VERSION']
-    endpoint_name = os.environ['ENDPOINT_NAME']
-    print('version: {} endpoint: {} event: {}'.format(
-        current_version, endpoint_name, json.dumps(event)))
+    config = runtime.get_config()
+    current_version = config.current_version
+    endpoint_name = config.endpoint_name
+    runtime.log_event('version: {} endpoint: {}'.format(
+        current_version, endpoint_name), event)
 
-    # Get boto3 sagemaker client and endpoint
-    sm = boto3.client('sagemaker-runtime')
+    # Get cached sagemaker client
+    sm = runtime.client('sagemaker-runtime')
 
-    # Dummy data
-    content_type = 'text/libsvm'
-    payload = '1:1 2:0.555 3:0.435 4:0.145 5:0.9205 6:0.404 7:0.2275 8:0.255'
-    error_message = None
-
-    # Invoke endpoint
+    # Replay the golden set within the hook's time budget and check it against
+    # the correctness thresholds and latency SLO
     try:
-        response = sm.invoke_endpoint(
-            EndpointName=endpoint_name,
-            Body=payload,
-            ContentType=content_type,
-            Accept='application/json'
-        )
-        body = json.loads((response['Body'].read().decode('utf-8')))
-        print('invoke_endpoint', body)
-        # TODO: Add additional validations
-    except ClientError as e:
-        error_message = e.response['Error']['Message']
-
-    # Get boto3 sagemaker client and endpoint
-    cd = boto3.client('codedeploy')
+        error_message = check_golden_set(sm, endpoint_name, context)
+    except Exception as e:  # Report Failed for any error, rather than leaving CodeDeploy to time out
+        error_message = 'Golden set check error: {!r}'.format(e)
+
+    # Get cached codedeploy client
+    cd = runtime.client('codedeploy')
 
     # If error return failure condition, else update to success
     try:
@@ -83,12 +94,12 @@ def lambda_handler(event, context):
             return {
                 "statusCode": 200,
             }    
-    except ClientError as e:
+    except (ClientError, BotoCoreError) as e:
         # Error attempting to update the cloud formation
         print('code deploy error', e)
         return {
             "statusCode": 500,
-            "message": e.response['Error']['Message']            
+            "message": str(e)
         }
                 
 
@@ -0,0 +1,106 @@
+import base64
+import json
+import os
+
+# Response formatting and content negotiation for the regression function.
+# Predictions are returned as a JSON array by default, with compact CSV and
+# newline delimited JSON formats for large batches. When the client asks for
+# a type in PASSTHROUGH_TYPES the endpoint bytes are returned untouched.
+# See: https://docs.aws.amazon.com/apigateway/latest/developerguide/set-up-lambda-proxy-integrations.html
+
+JSON = 'application/json'
+CSV = 'text/csv'
+NDJSON = 'application/x-ndjson'
+JSONLINES = 'application/jsonlines'
+
+SUPPORTED_TYPES = (JSON, CSV, NDJSON, JSONLINES)
+PASSTHROUGH_TYPES = tuple(os.environ.get('PASSTHROUGH_TYPES', CSV).split(','))
+
+def header(event, name, default=None):
+    """Return a request header, matching the name case insensitively"""
+    headers = event.get('headers') or {}
+    value = headers.get(name)
+    if value is None:
+        lower = name.lower()
+        for key, candidate in headers.items():
+            if key.lower() == lower:
+                return candidate
+        return default
+    return value
+
+def negotiate(accept):
+    """Return the supported media type with the highest quality in an Accept header"""
+    if not accept:
+        return JSON
+    best = None
+    best_quality = 0.0
+    for order, item in enumerate(accept.split(',')):
+        parts = item.strip().split(';')
+        media_type = parts[0].strip().lower()
+        quality = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type in ('*/*', 'application/*'):
+            media_type = JSON
+        elif media_type == 'text/*':
+            media_type = CSV
+        if media_type in SUPPORTED_TYPES and quality > best_quality:
+            best, best_quality = media_type, quality
+    return best or JSON
+
+def is_passthrough(media_type):
+    return media_type in PASSTHROUGH_TYPES
+
+def metadata_headers(content_type, commit_id, endpoint_name):
+    return {
+        "Content-Type": content_type,
+        "X-Model-Version": commit_id or '',
+        "X-Endpoint-Name": endpoint_name or ''
+    }
+
+def passthrough(body, content_type, commit_id, endpoint_name):
+    """Return the endpoint body bytes as the response body without decoding predictions"""
+    is_text = content_type.startswith('text/') or content_type.endswith('json')
+    return {
+        "statusCode": 200,
+        "headers": metadata_headers(content_type, commit_id, endpoint_name),
+        "body": body.decode('utf-8') if is_text else base64.b64encode(body).decode('ascii'),
+        "isBase64Encoded": not is_text
+    }
+
+def format_predictions(media_type, predictions, commit_id, endpoint_name, errors=None, status_code=200):
+    """Serialize predictions in the negotiated media type"""
+    if media_type == CSV:
+        if None in predictions:
+            body = '\n'.join('' if p is None else str(p) for p in predictions)
+        else:
+            body = '\n'.join(map(str, predictions))
+    elif media_type in (NDJSON, JSONLINES):
+        if any(isinstance(p, (str, list, dict)) for p in predictions):
+            body = '\n'.join(json.dumps(p) for p in predictions)
+        else:
+            # Scalars never contain a comma, so encode the array in one pass
+            body = json.dumps(predictions, separators=(',', ':'))[1:-1].replace(',', '\n')
+    else:
+        document = {
+            "version": commit_id,
+            "endpoint_name": endpoint_name, # TEMP for debugging
+            "predictions": predictions
+        }
+        if errors is not None:
+            document["errors"] = errors
+        body = json.dumps(document, separators=(',', ':'))
+
+    headers = metadata_headers(media_type, commit_id, endpoint_name)
+    if errors and media_type != JSON:
+        headers["X-Prediction-Errors"] = json.dumps(errors, separators=(',', ':'))
+    return {
+        "statusCode": status_code,
+        "headers": headers,
+        "body": body
+    }
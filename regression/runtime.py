@@ -0,0 +1,118 @@
+import collections
+import json
+import os
+import threading
+import time
+
+# Shared warm-start runtime for the regression Lambdas.
+# Clients and parsed environment config are built once per container and
+# reused by every subsequent (warm) invocation.
+# See: https://docs.aws.amazon.com/lambda/latest/dg/best-practices.html
+
+Config = collections.namedtuple('Config', [
+    'commit_id',
+    'endpoint_name',
+    'current_version',
+    'variant_name',
+    'instance_count',
+    'log_events',
+])
+
+# Connection settings per service: (connect_timeout, read_timeout, max_attempts)
+# Connect fast on invoke, leaving read time for batch chunks within the
+# 29 second API Gateway integration timeout.
+CLIENT_SETTINGS = {
+    'sagemaker-runtime': (1, 5, 2),
+    'sagemaker': (2, 10, 3),
+    'codedeploy': (2, 10, 3),
+}
+DEFAULT_SETTINGS = (2, 10, 3)
+MAX_POOL_CONNECTIONS = int(os.environ.get('MAX_POOL_CONNECTIONS', '10'))
+BATCH_CONCURRENCY = min(int(os.environ.get('BATCH_CONCURRENCY', '4')), MAX_POOL_CONNECTIONS)
+
+_config = None
+_clients = {}
+_executor = None
+_lock = threading.Lock()
+
+def get_config():
+    """Return the environment config, parsed on first use and cached"""
+    global _config
+    if _config is None:
+        env = os.environ
+        _config = Config(
+            commit_id=env.get('COMMIT_ID'),
+            endpoint_name=env.get('ENDPOINT_NAME'),
+            current_version=env.get('CURRENT_VERSION'),
+            variant_name=env.get('VARIANT_NAME'),
+            instance_count=int(env.get('INSTANCE_COUNT', '1')),
+            log_events=env.get('LOG_EVENTS', 'false').lower() in ('1', 'true', 'yes'),
+        )
+    return _config
+
+def client(service_name):
+    """Return a boto3 client for service_name, created lazily once per container
+
+    Clients keep their connection pool alive between invocations so warm calls
+    skip client construction, endpoint resolution and the TLS handshake.
+    """
+    sm = _clients.get(service_name)
+    if sm is None:
+        with _lock:
+            sm = _clients.get(service_name)
+            if sm is None:
+                sm = _create_client(service_name)
+                _clients[service_name] = sm
+    return sm
+
+def _create_client(service_name):
+    # Import lazily so handlers that never call AWS don't pay for boto3 import
+    import boto3
+    from botocore.config import Config as BotoConfig
+
+    connect_timeout, read_timeout, max_attempts = CLIENT_SETTINGS.get(
+        service_name, DEFAULT_SETTINGS)
+    config = BotoConfig(
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries={
+            'max_attempts': max_attempts,
+            'mode': 'standard'
+        }
+    )
+    return boto3.client(service_name, config=config)
+
+def executor():
+    """Return the bounded thread pool used to fan out endpoint requests"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY)
+    return _executor
+
+def deadline(context, reserve_ms=0, default_ms=30000):
+    """Return the time.time() by which work must finish, keeping reserve_ms of the invocation
+
+    Falls back to default_ms when context isn't a Lambda context, eg. in tests.
+    """
+    remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    budget_ms = remaining() if remaining else default_ms
+    return time.time() + max(0, budget_ms - reserve_ms) / 1000.0
+
+def log_event(message, event):
+    """Print message with the event, only serializing the event when enabled"""
+    if get_config().log_events:
+        print('{} event: {}'.format(message, json.dumps(event)))
+    else:
+        print(message)
+
+def reset():
+    """Drop cached config and clients, used by tests and benchmarks"""
+    global _config
+    with _lock:
+        _config = None
+        _clients.clear()
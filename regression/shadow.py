@@ -0,0 +1,168 @@
+import collections
+import os
+import random
+import threading
+import time
+from concurrent.futures import TimeoutError
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+try:
+    from . import metrics
+except ImportError:  # Lambda loads the handler as a top level module
+    import metrics
+
+# Shadow traffic for blue/green deployments.
+# A sample of requests is mirrored to the candidate endpoint (the other of
+# -blue/-green, or SHADOW_ENDPOINT_NAME) on a worker thread started alongside
+# the primary invocation. Once the primary has returned, the request waits at
+# most SHADOW_MAX_WAIT_MS more for the candidate (and never past
+# SHADOW_RESERVE_MS before the Lambda timeout), so the caller isn't held up by
+# a slow candidate. Lambda freezes the container after returning, so a
+# candidate still running then can't be timed and isn't compared.
+# Side by side latency and prediction agreement are emitted as EMF metrics
+# with a Variant dimension of primary or candidate; a candidate that misses
+# the wait is counted in the ShadowTimeouts metric.
+
+SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', '0'))
+SHADOW_ENDPOINT_NAME = os.environ.get('SHADOW_ENDPOINT_NAME')
+SHADOW_TOLERANCE = float(os.environ.get('SHADOW_TOLERANCE', '0.000001'))
+SHADOW_MAX_PENDING = int(os.environ.get('SHADOW_MAX_PENDING', '4'))
+SHADOW_PAUSE_SECONDS = float(os.environ.get('SHADOW_PAUSE_SECONDS', '60'))
+SHADOW_RESERVE_MS = int(os.environ.get('SHADOW_RESERVE_MS', '1000'))
+SHADOW_MAX_WAIT_MS = float(os.environ.get('SHADOW_MAX_WAIT_MS', '50'))
+
+_executor = None
+_pending = 0
+_paused_until = 0.0
+_lock = threading.Lock()
+
+Variant = collections.namedtuple('Variant', ['endpoint_name', 'latency_ms', 'predictions'])
+
+class ShadowStats:
+    """Running side by side totals, logged with every comparison"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.agreed = 0
+        self.compared = 0
+        self.latency_ms = {'primary': 0.0, 'candidate': 0.0}
+
+    def record(self, primary, candidate, agreed, compared):
+        self.requests += 1
+        self.agreed += agreed
+        self.compared += compared
+        self.latency_ms['primary'] += primary.latency_ms
+        self.latency_ms['candidate'] += candidate.latency_ms
+
+    def summary(self):
+        requests = max(self.requests, 1)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "agreement": self.agreed / self.compared if self.compared else None,
+            "mean_latency_ms": {k: v / requests for k, v in self.latency_ms.items()}
+        }
+
+stats = ShadowStats()
+
+def candidate_endpoint(endpoint_name):
+    """Return the endpoint to mirror to, defaulting to the other blue/green endpoint"""
+    if SHADOW_ENDPOINT_NAME:
+        return SHADOW_ENDPOINT_NAME
+    for live, candidate in (('-blue', '-green'), ('-green', '-blue')):
+        if endpoint_name and endpoint_name.endswith(live):
+            return endpoint_name[:-len(live)] + candidate
+    return None
+
+def should_mirror(endpoint_name):
+    """Sample requests to mirror, skipping when paused or too many are in flight"""
+    if SHADOW_SAMPLE_RATE <= 0 or candidate_endpoint(endpoint_name) is None:
+        return False
+    if _pending >= SHADOW_MAX_PENDING or time.time() < _paused_until:
+        return False
+    return random.random() < SHADOW_SAMPLE_RATE
+
+def mirror(sm, endpoint_name, data, content_type, invoke):
+    """Start invoking the candidate endpoint, returning a future of its Variant or None on error
+
+    Call before invoking the primary endpoint so both run side by side, then
+    pass the future to compare. invoke(sm, endpoint_name, data, content_type)
+    returns a list of predictions.
+    """
+    global _executor, _pending
+    with _lock:
+        if _executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=SHADOW_MAX_PENDING)
+        _pending += 1
+    return _executor.submit(_invoke, sm, candidate_endpoint(endpoint_name), data, content_type, invoke)
+
+def _invoke(sm, candidate_name, data, content_type, invoke):
+    global _pending, _paused_until
+    try:
+        start = time.perf_counter()
+        try:
+            predictions = invoke(sm, candidate_name, data, content_type)
+        except (ClientError, BotoCoreError, ValueError) as e:
+            stats.errors += 1
+            # The candidate may not exist yet or has been deleted, so back off
+            _paused_until = time.time() + SHADOW_PAUSE_SECONDS
+            print('shadow error', candidate_name, e)
+            return None
+        return Variant(candidate_name, (time.perf_counter() - start) * 1000, predictions)
+    finally:
+        with _lock:
+            _pending -= 1
+
+def compare(future, primary, deadline):
+    """Wait briefly for the candidate and emit the comparison with primary
+
+    Waits at most SHADOW_MAX_WAIT_MS, and not past the deadline (a time.time()).
+    """
+    timeout = min(deadline - time.time(), SHADOW_MAX_WAIT_MS / 1000)
+    try:
+        candidate = future.result(timeout=max(0.0, timeout))
+    except TimeoutError:
+        stats.timeouts += 1
+        metrics.emit({
+            "EndpointName": candidate_endpoint(primary.endpoint_name) or 'unknown'
+        }, {
+            "ShadowTimeouts": (1, metrics.COUNT)
+        })
+        return None
+    if candidate is None:
+        return None
+    agreed, compared = agreement(primary.predictions, candidate.predictions)
+    stats.record(primary, candidate, agreed, compared)
+    for variant, result in (('primary', primary), ('candidate', candidate)):
+        metrics.emit({
+            "EndpointName": result.endpoint_name,
+            "Variant": variant
+        }, {
+            "ShadowLatency": (round(result.latency_ms, 3), metrics.MILLISECONDS)
+        })
+    metrics.emit({
+        "EndpointName": candidate.endpoint_name
+    }, {
+        "ShadowAgreement": (agreed / compared if compared else 0.0, 'None'),
+        "ShadowCompared": (compared, metrics.COUNT)
+    }, properties={"ShadowTotals": stats.summary()})
+    return candidate
+
+def agreement(primary, candidate):
+    """Count predictions that match within SHADOW_TOLERANCE (relative to magnitude)"""
+    if len(primary) != len(candidate):
+        return 0, max(len(primary), 1)
+    agreed = 0
+    for a, b in zip(primary, candidate):
+        if a is None or b is None:
+            continue
+        try:
+            agreed += abs(a - b) <= SHADOW_TOLERANCE * max(1.0, abs(a))
+        except TypeError:
+            agreed += a == b
+    return agreed, len(primary)
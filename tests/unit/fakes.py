@@ -0,0 +1,60 @@
+import io
+import json
+
+from botocore.exceptions import ClientError
+
+from workflow.training import fingerprint
+
+# SageMaker and S3 fakes shared by the training orchestration tests
+
+class FakeSageMaker:
+    """Trials tagged with a fingerprint and job, and the jobs and models they point to"""
+
+    def __init__(self, trials=(), jobs=None, models=()):
+        self.trials = trials
+        self.jobs = jobs or {}
+        self.models = models
+        self.tags = {}
+
+    def search(self, **kwargs):
+        value = kwargs['SearchExpression']['Filters'][0]['Value']
+        return {'Results': [{'Trial': {'TrialName': name, 'Tags': [
+            {'Key': fingerprint.FINGERPRINT_TAG, 'Value': value}, {'Key': fingerprint.JOB_TAG, 'Value': job}]}}
+            for name, job in self.trials]}
+
+    def describe_training_job(self, TrainingJobName):
+        return {'TrainingJobStatus': self.jobs[TrainingJobName],
+                'ModelArtifacts': {'S3ModelArtifacts': 's3://b/p/model/{}/output/model.tar.gz'.format(TrainingJobName)}}
+
+    def describe_model(self, ModelName):
+        if ModelName not in self.models:
+            raise ClientError({'Error': {'Code': 'ValidationException', 'Message': 'not found'}}, 'DescribeModel')
+        return {}
+
+    def describe_trial(self, TrialName):
+        return {'TrialArn': 'arn:trial/' + TrialName}
+
+    def add_tags(self, ResourceArn, Tags):
+        self.tags[ResourceArn] = {tag['Key']: tag['Value'] for tag in Tags}
+
+class FakeS3:
+    """Listing pages and JSON manifests, recording the objects put"""
+
+    def __init__(self, pages=(), manifests=None):
+        self.pages = pages
+        self.manifests = manifests or {}
+        self.puts = {}
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        return self.pages
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.manifests:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'missing'}}, 'GetObject')
+        return {'Body': io.BytesIO(json.dumps(self.manifests[Key]).encode('utf-8'))}
+
+    def put_object(self, Bucket, Key, Body):
+        self.puts[Key] = json.loads(Body)
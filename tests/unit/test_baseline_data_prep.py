@@ -0,0 +1,63 @@
+import io
+import random
+from collections import Counter
+
+from workflow.monitoring import baseline_data_prep
+
+class FakeS3:
+    def __init__(self, objects):
+        self.objects = objects
+        self.deleted = []
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        yield {'Contents': [{'Key': k} for k in sorted(self.objects) if k.startswith(Prefix)]}
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete['Objects']:
+            self.deleted.append(obj['Key'])
+            del self.objects[obj['Key']]
+
+def csv(rows, start=0):
+    lines = ['Target,a'] + ['{},{}'.format(label, start + i) for i, label in enumerate(rows)]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def test_sample_keeps_proportions_and_rare_classes():
+    reservoir = baseline_data_prep.StratifiedReservoir(100, 5, random.Random(0))
+    for i in range(10000):
+        label = b'2' if i % 1000 == 0 else (b'0' if i % 2 else b'1')
+        reservoir.add(label, b'%d' % i)
+    lines = reservoir.result()
+    assert len(lines) == 100
+    assert lines == sorted(lines, key=int)
+    labels = Counter(b'2' if int(l) % 1000 == 0 else (b'0' if int(l) % 2 else b'1') for l in lines)
+    assert labels[b'2'] == 5
+    assert 40 <= labels[b'0'] <= 55 and 40 <= labels[b'1'] <= 55
+
+def test_main_writes_one_bounded_csv(mocker):
+    mocker.patch.object(baseline_data_prep, 'SAMPLE_ROWS', 50)
+    mocker.patch.object(baseline_data_prep, 'MIN_PER_CLASS', 3)
+    s3 = FakeS3({
+        'p/data/val/part-0.part': csv(['0'] * 80 + ['1'] * 2),
+        'p/data/val/part-1.part': csv(['0'] * 80 + ['2'], start=100),
+        'p/monitoring/baselining/data/part-0.csv': b'stale',
+    })
+    baseline_data_prep.main('bucket', 'p', s3=s3)
+    assert s3.deleted == ['p/monitoring/baselining/data/part-0.csv']
+    lines = s3.objects['p/monitoring/baselining/data/baseline.csv'].decode('utf-8').splitlines()
+    assert lines[0] == 'Target,a'
+    assert len(lines) == 51
+    labels = Counter(line.split(',')[0] for line in lines[1:])
+    assert labels['1'] == 2 and labels['2'] == 1
+
+def test_lines_are_streamed_across_chunks():
+    s3 = FakeS3({'k': b'a,b\r\n1,2\r\n3,4'})
+    assert list(baseline_data_prep.iter_lines(s3, 'bucket', 'k', chunk_size=3)) == [b'a,b\r', b'1,2\r', b'3,4']
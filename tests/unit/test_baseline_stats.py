@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+import pytest
+
+from workflow.monitoring import baseline_stats
+
+@pytest.fixture()
+def csv_files(tmp_path):
+    rng = np.random.RandomState(0)
+    paths = []
+    for i in range(2):
+        rows = ['Target,amount,protocol,flag']
+        for j in range(500):
+            amount = '' if j % 50 == 0 else '{:.3f}'.format(rng.rand() * 100)
+            rows.append('{},{},{},{}'.format(j % 3, amount, ('tcp', 'udp')[j % 2], -1 if j == 7 else j))
+        path = tmp_path / 'part-{}.csv'.format(i)
+        path.write_text('\n'.join(rows) + '\n')
+        paths.append(str(path))
+    return paths
+
+def test_kll_quantiles_are_close_and_mergeable():
+    values = np.random.RandomState(0).rand(200000)
+    left, right = baseline_stats.KLL(k=200), baseline_stats.KLL(k=200)
+    left.update(values[:100000])
+    right.update(values[100000:])
+    left.merge(right)
+    assert sum(len(level) for level in left.levels) < 2000
+    for q in (0.1, 0.5, 0.9):
+        assert abs(left.quantile(q) - q) < 0.02
+    assert sum(b['count'] for b in left.histogram(0, 1)) == pytest.approx(200000, rel=0.01)
+
+def test_statistics_match_a_single_pass(csv_files):
+    # Small partitions split the files mid line, which must not change the result
+    columns, rows = baseline_stats.compute(csv_files, workers=2, partition_bytes=997)
+    assert rows == 1000
+    by_name = {c.name: c for c in columns}
+    assert [c.inferred_type() for c in columns] == ['Integral', 'Fractional', 'String', 'Integral']
+
+    amounts = []
+    for path in csv_files:
+        for line in open(path).read().splitlines()[1:]:
+            if line.split(',')[1]:
+                amounts.append(float(line.split(',')[1]))
+    amount = by_name['amount'].statistics()['numerical_statistics']
+    assert amount['common'] == {'num_present': 980, 'num_missing': 20}
+    assert amount['mean'] == pytest.approx(np.mean(amounts))
+    assert amount['std_dev'] == pytest.approx(np.std(amounts))
+    assert amount['min'] == min(amounts) and amount['max'] == max(amounts)
+
+    protocol = by_name['protocol'].statistics()['string_statistics']
+    assert protocol['distribution']['categorical']['buckets'] == [
+        {'value': 'tcp', 'count': 500}, {'value': 'udp', 'count': 500}]
+
+def test_write_statistics_and_constraints(csv_files, tmp_path):
+    columns, rows = baseline_stats.compute(csv_files, workers=1)
+    statistics_path, constraints_path = baseline_stats.write(columns, rows, str(tmp_path / 'results'))
+    statistics = json.load(open(statistics_path))
+    assert statistics['dataset'] == {'item_count': 1000}
+    kll = statistics['features'][1]['numerical_statistics']['distribution']['kll']
+    assert len(kll['buckets']) == baseline_stats.HISTOGRAM_BUCKETS
+    assert kll['sketch']['parameters'] == {'c': 0.64, 'k': float(baseline_stats.KLL_K)}
+
+    features = {f['name']: f for f in json.load(open(constraints_path))['features']}
+    assert features['amount']['completeness'] == pytest.approx(0.98)
+    assert features['amount']['num_constraints'] == {'is_non_negative': True}
+    assert features['flag']['num_constraints'] == {'is_non_negative': False}
+    assert features['protocol']['string_constraints'] == {'domains': ['tcp', 'udp']}
+
+def test_infinity_is_counted_as_missing(tmp_path):
+    rate = baseline_stats.Column('Flow Byts/s')
+    rate.update(baseline_stats.pd.Series(['1.5', 'Infinity', '-inf', None, '2.5']))
+    infinite = baseline_stats.Column('Flow Pkts/s')
+    infinite.update(baseline_stats.pd.Series(['inf', 'Infinity']))
+
+    statistics = rate.statistics()['numerical_statistics']
+    assert statistics['common'] == {'num_present': 2, 'num_missing': 3}
+    assert (statistics['mean'], statistics['min'], statistics['max']) == (2.0, 1.5, 2.5)
+    assert infinite.constraints()['completeness'] == 0.0
+    statistics_path, _ = baseline_stats.write([rate, infinite], 5, str(tmp_path))
+    json.loads(open(statistics_path).read(), parse_constant=pytest.fail) # No Infinity or NaN
@@ -0,0 +1,63 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+from regression import batch
+
+class FakeRuntime:
+    """Echo the feature index back as predictions, failing payloads containing 'bad' or 'slow'"""
+
+    def __init__(self):
+        self.bodies = []
+
+    def invoke_endpoint(self, EndpointName, Body, ContentType, Accept):
+        self.bodies.append(Body)
+        if 'slow' in Body:
+            raise ReadTimeoutError(endpoint_url='https://runtime.sagemaker')
+        if 'bad' in Body:
+            raise ClientError({'Error': {'Code': 'ModelError', 'Message': 'bad record'}}, 'InvokeEndpoint')
+        rows = Body.split('\n')
+        body = '[' + ','.join(row.split(':')[0] for row in rows) + ']'
+        return {'Body': io.BytesIO(body.encode('utf-8'))}
+
+@pytest.fixture()
+def executor():
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        yield pool
+
+def test_chunk_records_respects_bytes_and_count():
+    records = ['1:1'] * 10 # 4 bytes each with newline
+    assert batch.chunk_records(records, max_bytes=12, max_records=100) == [(0, 3), (3, 6), (6, 9), (9, 10)]
+    assert batch.chunk_records(records, max_bytes=1000, max_records=4) == [(0, 4), (4, 8), (8, 10)]
+    assert batch.chunk_records(['x' * 50, '1:1'], max_bytes=10) == [(0, 1), (1, 2)]
+    assert batch.chunk_records([]) == []
+
+def test_parse_predictions_formats():
+    assert batch.parse_predictions(b'[1.5, 2.5]') == [1.5, 2.5]
+    assert batch.parse_predictions(b'{"predictions": [{"score": 3}]}') == [3]
+    assert batch.parse_predictions(b'1.5\n2.5\n') == [1.5, 2.5]
+
+def test_invoke_batch_keeps_order_and_reports_chunk_errors(mocker, executor):
+    mocker.patch.object(batch, 'MAX_RECORDS_PER_CHUNK', 2)
+    sm = FakeRuntime()
+    records = ['{}:1'.format(i) for i in range(7)]
+    records[3] = 'bad'
+
+    predictions, errors = batch.invoke_batch(sm, executor, 'endpoint', records, 'text/libsvm')
+
+    assert len(sm.bodies) == 4
+    assert predictions == [0, 1, None, None, 4, 5, 6]
+    assert errors == [{"chunk": 1, "start": 2, "end": 4, "message": "bad record"}]
+
+def test_invoke_batch_reports_a_timed_out_chunk(mocker, executor):
+    mocker.patch.object(batch, 'MAX_RECORDS_PER_CHUNK', 2)
+    records = ['{}:1'.format(i) for i in range(6)]
+    records[4] = 'slow'
+
+    predictions, errors = batch.invoke_batch(FakeRuntime(), executor, 'endpoint', records, 'text/libsvm')
+
+    assert predictions == [0, 1, 2, 3, None, None]
+    assert errors == [{"chunk": 2, "start": 4, "end": 6,
+                       "message": 'Read timeout on endpoint URL: "https://runtime.sagemaker"'}]
@@ -0,0 +1,86 @@
+import threading
+
+from regression import cache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class DictTier:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def put(self, key, value, ttl):
+        self.values[key] = value
+
+def test_key_changes_with_commit_and_ignores_whitespace():
+    key = cache.make_key('endpoint', 'abc1234', 'text/libsvm', 'payload', '1:1  2:0.5\r\n')
+    assert key == cache.make_key('endpoint', 'abc1234', 'text/libsvm', 'payload', '1:1 2:0.5')
+    assert key != cache.make_key('endpoint', 'def5678', 'text/libsvm', 'payload', '1:1 2:0.5')
+    assert key != cache.make_key('endpoint', 'abc1234', 'text/libsvm', 'record', '1:1 2:0.5')
+
+def test_lru_eviction_by_entries():
+    predictions = cache.PredictionCache(max_entries=2, max_bytes=1024 * 1024, ttl=60)
+    predictions.put('a', 1.0)
+    predictions.put('b', 2.0)
+    assert predictions.get('a') == 1.0
+    predictions.put('c', 3.0)
+
+    assert predictions.get('b') is None
+    assert predictions.get('a') == 1.0
+    stats = predictions.stats()
+    assert stats['evictions'] == 1
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+
+def test_memory_bound_and_ttl():
+    clock = FakeClock()
+    predictions = cache.PredictionCache(max_entries=100, max_bytes=200, ttl=10, clock=clock)
+    predictions.put('a', 'x' * 100)
+    predictions.put('b', 'y' * 100)
+    assert predictions.get('a') is None
+    assert predictions.stats()['bytes'] <= 200
+
+    clock.now = 11
+    assert predictions.get('b') is None
+    assert predictions.stats()['expirations'] == 1
+
+def test_second_tier_hits_are_promoted():
+    tier = DictTier()
+    predictions = cache.PredictionCache(max_entries=10, max_bytes=1024, ttl=60, second_tier=tier)
+    tier.values['a'] = 1.0
+
+    assert predictions.get('a') == 1.0
+    assert predictions.get('a') == 1.0
+    assert predictions.stats()['tier2_hits'] == 1
+    assert predictions.stats()['hits'] == 1
+
+    predictions.put('b', 2.0)
+    assert tier.values['b'] == 2.0
+
+def test_list_values_are_sized_by_their_items():
+    predictions = cache.PredictionCache(max_entries=100, max_bytes=10000, ttl=60)
+    predictions.put('a', [0.123456789] * 1000) # ~12 KB serialized, yet sys.getsizeof is ~8 KB
+    assert predictions.get('a') is None
+    predictions.put('b', [1.5] * 100)
+    assert predictions.stats()['bytes'] == 1 + len('[' + ','.join(['1.5'] * 100) + ']')
+
+def test_counters_are_consistent_across_threads():
+    predictions = cache.PredictionCache(max_entries=10, max_bytes=1024, ttl=60, second_tier=DictTier())
+
+    def lookups():
+        for i in range(2000):
+            predictions.get('missing-{}'.format(i))
+
+    threads = [threading.Thread(target=lookups) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert predictions.stats()['misses'] == 8000
@@ -0,0 +1,144 @@
+import datetime
+import time
+
+import pytest
+
+from regression import capacity, post_traffic_hook, runtime
+
+NOW = datetime.datetime(2026, 1, 1, 12, 0, tzinfo=datetime.timezone.utc)
+MINUTES = [NOW - datetime.timedelta(minutes=m) for m in range(3)]
+
+class CloudWatch:
+    """Answer GetMetricData from a dict of (endpoint, metric) to values per minute, in two pages"""
+
+    def __init__(self, series):
+        self.series = series
+        self.calls = []
+
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime, NextToken=None):
+        self.calls.append(NextToken)
+        results = []
+        for query in MetricDataQueries:
+            stat = query['MetricStat']
+            endpoint_name = stat['Metric']['Dimensions'][0]['Value']
+            values = self.series.get((endpoint_name, stat['Metric']['MetricName']), [])
+            results.append({'Id': query['Id'], 'Timestamps': MINUTES[:len(values)], 'Values': values})
+        if NextToken is None:
+            return {'MetricDataResults': results[:2], 'NextToken': 'page2'}
+        return {'MetricDataResults': results[2:]}
+
+class SageMaker:
+    def __init__(self, statuses, instance_count=1):
+        self.statuses = list(statuses)
+        self.instance_count = instance_count
+        self.updates = []
+
+    def describe_endpoint(self, EndpointName):
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        return {
+            'EndpointName': EndpointName,
+            'EndpointConfigName': EndpointName,
+            'EndpointStatus': status,
+            'ProductionVariants': [{'VariantName': 'AllTraffic', 'CurrentInstanceCount': self.instance_count}]
+        }
+
+    def update_endpoint_weights_and_capacities(self, EndpointName, DesiredWeightsAndCapacities):
+        self.updates.append(DesiredWeightsAndCapacities[0]['DesiredInstanceCount'])
+        return {}
+
+class CodeDeploy:
+    def __init__(self):
+        self.statuses = []
+
+    def put_lifecycle_event_hook_execution_status(self, deploymentId, lifecycleEventHookExecutionId, status):
+        self.statuses.append(status)
+        return {}
+
+BLUE = capacity.Variant('sam-sagemaker-blue', 'AllTraffic')
+GREEN = capacity.Variant('sam-sagemaker-green', 'AllTraffic')
+
+def test_get_traffic_reads_both_variants_across_pages():
+    cw = CloudWatch({
+        ('sam-sagemaker-blue', 'Invocations'): [100.0, 300.0],
+        ('sam-sagemaker-blue', 'ModelLatency'): [2000.0, 4000.0],
+        ('sam-sagemaker-green', 'Invocations'): [200.0],
+    })
+    traffic = capacity.get_traffic(cw, [BLUE, GREEN], now=NOW)
+    assert cw.calls == [None, 'page2']
+    assert traffic[BLUE]['invocations'] == {MINUTES[0]: 100.0, MINUTES[1]: 300.0}
+    assert traffic[BLUE]['latency_ms'] == {MINUTES[0]: 2.0, MINUTES[1]: 4.0}
+    assert traffic[GREEN]['invocations'] == {MINUTES[0]: 200.0}
+
+def test_plan_sizes_for_the_combined_peak():
+    traffic = {
+        BLUE: {'invocations': {MINUTES[0]: 100.0, MINUTES[1]: 300.0}, 'latency_ms': {}},
+        GREEN: {'invocations': {MINUTES[0]: 250.0}, 'latency_ms': {}},
+    }
+    plan = capacity.plan(traffic, max_capacity=10, period=60)
+    assert plan.peak_invocations_per_minute == 350.0
+    # 3.5 instances by throughput with 20% headroom
+    assert plan.capacity == 5
+    assert capacity.plan(traffic, max_capacity=2, period=60).capacity == 2
+
+def test_plan_accounts_for_slow_models():
+    traffic = {BLUE: {'invocations': {MINUTES[0]: 600.0}, 'latency_ms': {MINUTES[0]: 200.0}}}
+    plan = capacity.plan(traffic, max_capacity=10, period=60)
+    # 10 requests/second at 200ms is 2 in flight, half an instance, vs 6 by throughput
+    assert plan.concurrency_instances == 0.5
+    assert plan.capacity == 8
+
+def test_plan_without_traffic_uses_the_minimum():
+    assert capacity.plan({}, max_capacity=4).capacity == capacity.MIN_CAPACITY
+
+def test_wait_in_service_backs_off():
+    sm = SageMaker(['Updating', 'Updating', 'InService'])
+    delays = []
+    response = capacity.wait_in_service(sm, 'sam-sagemaker-blue', time.time() + 60, sleep=delays.append)
+    assert response['EndpointStatus'] == 'InService'
+    assert delays == [capacity.WAIT_INITIAL_SECONDS, capacity.WAIT_INITIAL_SECONDS * 2]
+
+def test_wait_in_service_stops_at_the_deadline():
+    sm = SageMaker(['Updating'])
+    response = capacity.wait_in_service(sm, 'sam-sagemaker-blue', time.time() - 1, sleep=pytest.fail)
+    assert response['EndpointStatus'] == 'Updating'
+
+@pytest.fixture()
+def hook_clients(monkeypatch, mocker):
+    monkeypatch.setenv('ENDPOINT_NAME', 'sam-sagemaker-blue')
+    monkeypatch.setenv('VARIANT_NAME', 'AllTraffic')
+    monkeypatch.setenv('INSTANCE_COUNT', '1')
+    mocker.patch.object(capacity, 'MAX_CAPACITY', 4)
+    mocker.patch.object(capacity, 'LIVE_ENDPOINT_NAME', 'sam-sagemaker-green')
+    mocker.patch.object(capacity, 'WAIT_INITIAL_SECONDS', 0.01)
+    runtime.reset()
+    clients = {
+        'sagemaker': SageMaker(['Updating', 'InService']),
+        'cloudwatch': CloudWatch({('sam-sagemaker-green', 'Invocations'): [180.0]}),
+        'codedeploy': CodeDeploy(),
+    }
+    mocker.patch.object(runtime, 'client', side_effect=clients.get)
+    yield clients
+    runtime.reset()
+
+def test_hook_resizes_cooldown_endpoint(hook_clients):
+    ret = post_traffic_hook.lambda_handler({'DeploymentId': 'd', 'LifecycleEventHookExecutionId': 'x'}, '')
+    assert ret['statusCode'] == 200
+    assert hook_clients['sagemaker'].updates == [3]
+    assert hook_clients['codedeploy'].statuses == ['Succeeded']
+
+def test_hook_caps_cooldown_at_the_max_capacity(hook_clients, monkeypatch, mocker):
+    mocker.patch.object(capacity, 'MAX_CAPACITY', 2)
+    post_traffic_hook.lambda_handler({'DeploymentId': 'd', 'LifecycleEventHookExecutionId': 'x'}, '')
+    assert hook_clients['sagemaker'].updates == [2]
+
+    monkeypatch.setenv('INSTANCE_COUNT', '5')
+    runtime.reset()
+    post_traffic_hook.lambda_handler({'DeploymentId': 'd', 'LifecycleEventHookExecutionId': 'x'}, '')
+    assert hook_clients['sagemaker'].updates == [2, 5]
+
+def test_hook_fails_when_endpoint_never_in_service(hook_clients):
+    hook_clients['sagemaker'].statuses = ['Failed']
+    ret = post_traffic_hook.lambda_handler({'DeploymentId': 'd', 'LifecycleEventHookExecutionId': 'x'}, '')
+    assert ret['statusCode'] == 400
+    assert hook_clients['sagemaker'].updates == []
+    assert hook_clients['codedeploy'].statuses == ['Failed']
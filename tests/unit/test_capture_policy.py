@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+xgboost = pytest.importorskip('xgboost')
+
+from workflow.training import capture_policy
+
+class FakeHook:
+    def __init__(self):
+        self.steps = []
+        self.train_data = None
+        self.validation_data = None
+
+    def after_iteration(self, model, epoch, evals_log):
+        self.steps.append((epoch, self.validation_data is not None))
+        return False
+
+def test_expensive_captures_are_dropped_before_rounds():
+    policy = capture_policy.CapturePolicy(budget_pct=5, max_interval=8)
+    assert policy.capture(0) is True
+    policy.record(0, 1.0, capture_seconds=0.5, full=True)
+    assert policy.full_every == 2 and policy.interval == 1
+    assert policy.capture(1) is False
+    policy.record(1, 1.0, capture_seconds=0.5, full=False)
+    assert policy.interval == 2
+    assert policy.capture(2) is None
+
+def test_interval_narrows_when_under_budget():
+    policy = capture_policy.CapturePolicy(budget_pct=5)
+    policy.interval = 4
+    policy.record(0, 100.0, capture_seconds=0.1, full=False)
+    assert policy.interval == 2
+
+def test_required_steps_are_always_captured_in_full():
+    policy = capture_policy.CapturePolicy(budget_pct=5, required_steps=[3])
+    policy.record(0, 1.0, capture_seconds=1.0, full=False)
+    assert policy.capture(1) is None
+    assert policy.capture(3) is True
+
+def test_budgeted_hook_samples_rounds():
+    X = np.random.RandomState(0).rand(100, 4)
+    dtrain = xgboost.DMatrix(X, label=X[:, 0])
+    hook = FakeHook()
+    policy = capture_policy.CapturePolicy(budget_pct=0, max_interval=4, required_steps=[9])
+    xgboost.train({}, dtrain, 10, callbacks=[capture_policy.BudgetedHook(hook, policy, dtrain, dtrain)])
+    steps = [step for step, full in hook.steps]
+    assert steps[0] == 0 and steps[-1] == 9
+    assert len(steps) < 10
+    assert hook.steps[-1] == (9, True)
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from workflow.training import data_loader
+
+@pytest.fixture()
+def channel(tmp_path):
+    (tmp_path / 'part-000.csv').write_text('Target,a,b\n1,0.5,2\n0,1.5,3\n')
+    # A blank line and no trailing newline
+    (tmp_path / 'part-001.csv').write_text('Target,a,b\n2,2.5,4\n\n3,3.5,5')
+    return tmp_path
+
+def test_count_rows(channel):
+    assert data_loader.count_rows(str(channel / 'part-000.csv')) == 2
+    assert data_loader.count_rows(str(channel / 'part-001.csv')) == 3
+
+def test_load_into_float32_arrays(channel):
+    files = data_loader.list_files(str(channel))
+    features, labels = data_loader.load(files, workers=2, chunk_rows=1)
+    assert features.dtype == np.float32 and labels.dtype == np.float32
+    assert features.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(labels, [1, 0, 2, 3])
+    np.testing.assert_array_equal(features, [[0.5, 2], [1.5, 3], [2.5, 4], [3.5, 5]])
+
+def test_load_rejects_mismatched_headers(channel):
+    (channel / 'part-002.csv').write_text('Target,b,a\n1,2,3\n')
+    with pytest.raises(ValueError, match='Header'):
+        data_loader.load(data_loader.list_files(str(channel)))
+
+def test_load_requires_label_column(channel):
+    with pytest.raises(ValueError, match='Label column'):
+        data_loader.load(data_loader.list_files(str(channel)), label_column='Label')
+
+def test_load_dmatrix(channel):
+    pytest.importorskip('xgboost')
+    dmatrix = data_loader.load_dmatrix(str(channel))
+    assert (dmatrix.num_row(), dmatrix.num_col()) == (4, 2)
+    np.testing.assert_array_equal(dmatrix.get_label(), [1, 0, 2, 3])
@@ -0,0 +1,143 @@
+import base64
+import io
+import json
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from workflow.monitoring import baseline_stats, drift
+
+class FakeS3:
+    def __init__(self, objects):
+        self.objects = objects
+        self.reads = []
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix, StartAfter=''):
+        yield {'Contents': [{'Key': k} for k in sorted(self.objects) if k.startswith(Prefix) and k > StartAfter]}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'missing'}}, 'GetObject')
+        self.reads.append(Key)
+        body = self.objects[Key]
+        return {'Body': io.BytesIO(body if isinstance(body, bytes) else body.encode('utf-8'))}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+class FakeCloudWatch:
+    def __init__(self):
+        self.metrics = []
+
+    def put_metric_data(self, Namespace, MetricData):
+        self.metrics.extend(MetricData)
+
+def record(features, prediction, time, base64_encode=False):
+    data = '\n'.join(','.join(str(v) for v in row) for row in features)
+    endpoint_input = {'observedContentType': 'text/csv', 'mode': 'INPUT', 'data': data, 'encoding': 'CSV'}
+    if base64_encode:
+        endpoint_input.update(data=base64.b64encode(data.encode('utf-8')).decode('utf-8'), encoding='BASE64')
+    return json.dumps({
+        'captureData': {
+            'endpointInput': endpoint_input,
+            'endpointOutput': {'observedContentType': 'text/csv', 'mode': 'OUTPUT', 'data': prediction,
+                               'encoding': 'CSV'},
+        },
+        'eventMetadata': {'eventId': 'id', 'inferenceTime': time},
+        'eventVersion': '0',
+    })
+
+def capture(rng, shift, minute, count=200):
+    lines = [record([[int(rng.randint(0, 3)), round(rng.rand() + shift, 3)]], str(float(rng.randint(0, 3))),
+                    '2020-01-01T10:{:02d}:{:02d}Z'.format(minute, i % 60), base64_encode=i % 2 == 0)
+             for i in range(count)]
+    return '\n'.join(lines) + '\n'
+
+def baseline(tmp_path):
+    rng = np.random.RandomState(0)
+    rows = ['Target,protocol,amount'] + ['{},{},{:.3f}'.format(rng.randint(0, 3), rng.randint(0, 3), rng.rand())
+                                         for _ in range(2000)]
+    path = tmp_path / 'baseline.csv'
+    path.write_text('\n'.join(rows) + '\n')
+    columns, rows = baseline_stats.compute([str(path)], workers=1)
+    return {
+        'p/monitoring/baselining/results/statistics.json': json.dumps(baseline_stats.statistics(columns, rows)),
+        'p/monitoring/baselining/results/constraints.json': json.dumps(baseline_stats.constraints(columns)),
+    }
+
+def test_parse_records_splits_multi_row_requests():
+    lines = [record([[1, 0.5], [2, 0.25]], '1.0,2.0', '2020-01-01T10:04:59Z'),
+             record([[0]], '', '2020-01-01T10:05:00Z', base64_encode=True),
+             json.dumps({'captureData': {'endpointInput': {'observedContentType': 'application/x-npy'}},
+                         'eventMetadata': {'inferenceTime': '2020-01-01T10:05:00Z'}})]
+    frame, skipped = drift.parse_records(lines, ['protocol', 'amount'])
+    assert skipped == 1
+    assert frame['protocol'].tolist() == [1, 2, 0]
+    assert frame['amount'].tolist()[:2] == [0.5, 0.25] and frame['amount'].isna().tolist()[2]
+    assert frame['Target'].tolist()[:2] == [1.0, 2.0] and frame['Target'].isna().tolist()[2]
+    assert frame['window'].tolist() == [1577872800, 1577872800, 1577873100]
+
+def test_parse_records_reads_libsvm_capture():
+    endpoint_input = {'observedContentType': 'text/libsvm', 'mode': 'INPUT', 'data': '0:1 1:0.5\n1:0.25', 'encoding': 'CSV'}
+    lines = [json.dumps({
+        'captureData': {
+            'endpointInput': endpoint_input,
+            'endpointOutput': {'observedContentType': 'application/json', 'mode': 'OUTPUT', 'data': '[3.0, 4.0]',
+                               'encoding': 'JSON'},
+        },
+        'eventMetadata': {'eventId': 'id', 'inferenceTime': '2020-01-01T10:04:59Z'},
+        'eventVersion': '0',
+    }), record([[2, 0.75]], '5.0', '2020-01-01T10:05:00Z')]
+    frame, skipped = drift.parse_records(lines, ['protocol', 'amount'])
+    assert skipped == 0
+    assert frame['protocol'].tolist()[::2] == [1, 2] and frame['protocol'].isna().tolist()[1]
+    assert frame['amount'].tolist() == [0.5, 0.25, 0.75]
+    assert frame['Target'].tolist() == [3.0, 4.0, 5.0]
+    assert frame['window'].tolist() == [1577872800, 1577872800, 1577873100]
+
+def test_runs_only_read_new_capture_and_detect_drift(tmp_path):
+    rng = np.random.RandomState(1)
+    prefix = 'p/datacapture/endpoint/AllTraffic/2020/01/01/10/'
+    s3 = FakeS3(baseline(tmp_path))
+    s3.objects[prefix + '00-00-000-a.jsonl'] = capture(rng, 0.0, 0)
+    cloudwatch = FakeCloudWatch()
+
+    report, found = drift.run(s3, 'bucket', 'p', 'endpoint', cloudwatch=cloudwatch)
+    assert report['objects'] == 1 and report['records'] == 200
+    assert found == []
+    assert {m['MetricName'] for m in cloudwatch.metrics} == {
+        'feature_baseline_drift_Target', 'feature_baseline_drift_protocol', 'feature_baseline_drift_amount'}
+
+    # The next run reads only the new object, and its window is merged with the first
+    s3.objects[prefix + '06-00-000-b.jsonl'] = capture(rng, 0.8, 6, count=600)
+    s3.reads = []
+    report, found = drift.run(s3, 'bucket', 'p', 'endpoint')
+    assert [key for key in s3.reads if key.startswith(prefix)] == [prefix + '06-00-000-b.jsonl']
+    assert report['rows'] == 800 and report['windows'] == ['1577872800', '1577873100']
+    assert [(v['feature_name'], v['constraint_check_type']) for v in found] == [('amount', 'baseline_drift_check')]
+    assert 'p/monitoring/drift/endpoint/AllTraffic/reports/2020/01/01/10/05/constraint_violations.json' in s3.objects
+    state = json.loads(s3.objects['p/monitoring/drift/endpoint/AllTraffic/state.json'])
+    assert {c['sketch']['parameters']['k'] for w in state['windows'].values() for c in w} == {float(drift.KLL_K)}
+
+    report, found = drift.run(s3, 'bucket', 'p', 'endpoint')
+    assert report['objects'] == 0 and report['rows'] == 800
+
+def test_violations_check_type_completeness_and_domain():
+    statistics = {'features': []}
+    constraints = {
+        'features': [
+            {'name': 'count', 'inferred_type': 'Integral', 'completeness': 1.0},
+            {'name': 'protocol', 'inferred_type': 'String', 'completeness': 1.0,
+             'string_constraints': {'domains': ['tcp', 'udp']}},
+        ],
+        'monitoring_config': {'datatype_check_threshold': 1.0, 'domain_content_threshold': 1.0},
+    }
+    count, protocol = baseline_stats.Column('count'), baseline_stats.Column('protocol')
+    count.update(drift.pd.Series(['1', '2.5', None]))
+    protocol.update(drift.pd.Series(['tcp', 'icmp']))
+    found, _ = drift.violations([count, protocol], statistics, constraints)
+    assert [(v['feature_name'], v['constraint_check_type']) for v in found] == [
+        ('count', 'data_type_check'), ('count', 'completeness_check'), ('protocol', 'categorical_values_check')]
@@ -0,0 +1,38 @@
+import pytest
+
+from workflow.training import fingerprint
+from .fakes import FakeSageMaker
+
+OBJECTS = {'p/data/train/a.csv': {'etag': 'e1', 'size': 1}, 'p/data/val/b.csv': {'etag': 'e2', 'size': 1}}
+
+@pytest.fixture()
+def source(tmp_path):
+    (tmp_path / 'train_xgboost.py').write_text('print(1)\n')
+    (tmp_path / '__pycache__').mkdir()
+    (tmp_path / '__pycache__' / 'train_xgboost.pyc').write_bytes(b'compiled')
+    return tmp_path
+
+def test_fingerprint_changes_with_data_source_and_hyperparameters(source):
+    value = fingerprint.compute(OBJECTS, str(source), {'eta': '0.2'})
+    assert value == fingerprint.compute(dict(reversed(list(OBJECTS.items()))), str(source), {'eta': '0.2'})
+    assert value != fingerprint.compute(dict(OBJECTS, **{'p/data/train/a.csv': {'etag': 'e3', 'size': 1}}),
+                                        str(source), {'eta': '0.2'})
+    assert value != fingerprint.compute(OBJECTS, str(source), {'eta': '0.3'})
+
+    (source / '__pycache__' / 'train_xgboost.pyc').write_bytes(b'recompiled')
+    assert value == fingerprint.compute(OBJECTS, str(source), {'eta': '0.2'})
+    (source / 'train_xgboost.py').write_text('print(2)\n')
+    assert value != fingerprint.compute(OBJECTS, str(source), {'eta': '0.2'})
+
+def test_reuses_the_latest_completed_run_with_a_model():
+    sm = FakeSageMaker(trials=[('t3', 'job-3'), ('t2', 'job-2'), ('t1', 'job-1')],
+                       jobs={'job-3': 'Failed', 'job-2': 'Completed', 'job-1': 'Completed'},
+                       models=['job-1'])
+    reuse = fingerprint.find_reusable(sm, 'abc')
+    assert reuse == fingerprint.Reuse('job-1', 's3://b/p/model/job-1/output/model.tar.gz', 't1')
+    assert fingerprint.find_reusable(FakeSageMaker(), 'abc') is None
+
+def test_tag_trial_records_the_fingerprint_and_job():
+    sm = FakeSageMaker()
+    fingerprint.tag_trial(sm, 'abcdef0', 'abc', 'job-1')
+    assert sm.tags['arn:trial/abcdef0'] == {fingerprint.FINGERPRINT_TAG: 'abc', fingerprint.JOB_TAG: 'job-1'}
@@ -0,0 +1,149 @@
+import io
+import json
+import time
+
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+
+from regression import golden, pre_traffic_hook, runtime
+
+# Validation rows of three classes, where the live model predicted the label for all but the last
+GOLDEN_SET = {'name': 'cicids2018', 'version': 'job-1', 'content_type': 'text/csv', 'records': [
+    {'payload': '{},0.5,{}'.format(i, i * 2), 'label': float(i % 3), 'expected': float(i % 3)} for i in range(19)
+] + [{'payload': '19,0.5,38', 'label': 1.0, 'expected': 2.0}]}
+CLASSES = {r['payload']: r['label'] for r in GOLDEN_SET['records']}
+
+class GoldenRuntime:
+    """Predict the golden label, shifted by offset classes, failing the first n requests"""
+
+    def __init__(self, offset=0, delay=0.0, failures=0, error=None):
+        self.offset = offset
+        self.delay = delay
+        self.failures = failures
+        self.error = error or ClientError({'Error': {'Code': 'ModelError', 'Message': 'model error'}},
+                                          'InvokeEndpoint')
+
+    def invoke_endpoint(self, EndpointName, Body, ContentType, Accept):
+        time.sleep(self.delay)
+        if self.failures > 0:
+            self.failures -= 1
+            raise self.error
+        body = json.dumps([(CLASSES[Body] + self.offset) % 3])
+        return {'Body': io.BytesIO(body.encode('utf-8'))}
+
+class CodeDeploy:
+    def __init__(self):
+        self.statuses = []
+
+    def put_lifecycle_event_hook_execution_status(self, deploymentId, lifecycleEventHookExecutionId, status):
+        self.statuses.append(status)
+        return {'lifecycleEventHookExecutionId': lifecycleEventHookExecutionId}
+
+class Context:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+def run(sm, remaining_ms=30000):
+    results, timed_out = golden.replay(sm, 'sam-sagemaker-green', GOLDEN_SET,
+                                       golden.deadline(Context(remaining_ms), reserve_ms=0))
+    return golden.evaluate(GOLDEN_SET, results, timed_out)
+
+def test_golden_set_passes():
+    summary = run(GoldenRuntime())
+    assert summary['passed'], summary['failures']
+    assert summary['requests'] == len(GOLDEN_SET['records']) * golden.GOLDEN_ROUNDS
+    assert summary['accuracy'] == 1.0 and summary['agreement'] == 0.95
+    assert summary['p99_ms'] is not None
+
+def test_disagreeing_with_the_live_model_fails():
+    summary = run(GoldenRuntime(offset=1))
+    assert not summary['passed']
+    assert summary['failures'] == ['agreement 0.050 below {}'.format(golden.GOLDEN_MIN_AGREEMENT)]
+
+def test_labels_without_expected_only_gate_accuracy_when_set(mocker):
+    records = [{'payload': r['payload'], 'label': r['label']} for r in GOLDEN_SET['records']]
+    first_deploy = dict(GOLDEN_SET, records=records)
+    results = [golden.Result(i, (r['label'] + 1) % 3, 1.0, None) for i, r in enumerate(records)]
+    assert golden.evaluate(first_deploy, results)['passed']
+    mocker.patch.object(golden, 'GOLDEN_MIN_ACCURACY', 0.5)
+    assert golden.evaluate(first_deploy, results)['failures'] == ['accuracy 0.000 below 0.5']
+
+def test_botocore_errors_are_counted_per_request():
+    error = ReadTimeoutError(endpoint_url='https://runtime.sagemaker')
+    summary = run(GoldenRuntime(failures=2, error=error))
+    assert summary['errors'] == 1
+    assert summary['failures'][0].startswith('1 errors, first: Read timeout')
+
+def test_latency_slo_and_errors_fail(mocker):
+    mocker.patch.object(golden, 'LATENCY_SLO_P50_MS', 1.0)
+    # The warm up request takes the first failure, the second lands in the replay
+    summary = run(GoldenRuntime(delay=0.005, failures=2))
+    assert not summary['passed']
+    assert summary['errors'] == 1
+    assert any(f.startswith('1 errors, first:') for f in summary['failures'])
+    assert any(f.startswith('p50 latency') for f in summary['failures'])
+
+def test_replay_stops_at_the_deadline():
+    summary = run(GoldenRuntime(delay=0.05), remaining_ms=100)
+    assert not summary['passed']
+    assert summary['timed_out'] + summary['errors'] > 0
+
+class GoldenS3:
+    def get_object(self, Bucket, Key):
+        assert (Bucket, Key) == ('bucket', 'prefix/model/job-1/golden.json')
+        return {'Body': io.BytesIO(json.dumps(GOLDEN_SET).encode('utf-8'))}
+
+def hook(monkeypatch, mocker, sm, golden_set='s3://bucket/prefix/model/job-1/golden.json'):
+    monkeypatch.setenv('ENDPOINT_NAME', 'sam-sagemaker-green')
+    mocker.patch.object(golden, 'GOLDEN_SET', golden_set)
+    runtime.reset()
+    cd = CodeDeploy()
+    clients = {'sagemaker-runtime': sm, 'codedeploy': cd, 's3': GoldenS3()}
+    mocker.patch.object(runtime, 'client', side_effect=clients.get)
+    ret = pre_traffic_hook.lambda_handler(
+        {'DeploymentId': 'd-B8ECPZ0I1', 'LifecycleEventHookExecutionId': 'XXXX'}, Context(30000))
+    runtime.reset()
+    return ret, cd.statuses
+
+def test_hook_marks_deployment_failed(monkeypatch, mocker):
+    ret, statuses = hook(monkeypatch, mocker, GoldenRuntime(offset=1))
+    assert ret['statusCode'] == 400
+    assert ret['message'].startswith('Golden set cicids2018/job-1 failed: agreement 0.050')
+    assert statuses == ['Failed']
+
+def test_hook_reports_failed_on_connection_errors(monkeypatch, mocker):
+    error = EndpointConnectionError(endpoint_url='https://runtime.sagemaker')
+    ret, statuses = hook(monkeypatch, mocker, GoldenRuntime(failures=1000, error=error))
+    assert ret['message'].startswith('Golden set cicids2018/job-1 failed: ')
+    assert 'Could not connect' in ret['message']
+    assert statuses == ['Failed']
+
+def test_hook_reports_failed_on_any_error(monkeypatch, mocker):
+    mocker.patch.object(golden, 'evaluate', side_effect=KeyError('records'))
+    ret, statuses = hook(monkeypatch, mocker, GoldenRuntime())
+    assert ret['message'] == "Golden set check error: KeyError('records')"
+    assert statuses == ['Failed']
+
+def test_hook_reports_a_missing_golden_set(monkeypatch, mocker):
+    mocker.patch.object(GoldenS3, 'get_object', side_effect=ReadTimeoutError(endpoint_url='https://s3'))
+    ret, statuses = hook(monkeypatch, mocker, GoldenRuntime())
+    assert ret['message'].startswith('Unable to load golden set: Read timeout')
+    assert statuses == ['Failed']
+
+class LatencyRuntime(GoldenRuntime):
+    def invoke_endpoint(self, EndpointName, Body, ContentType, Accept):
+        assert (Body, ContentType) == (golden.LATENCY_PAYLOAD, 'text/libsvm')
+        time.sleep(self.delay)
+        return {'Body': io.BytesIO(b'[3.0]')}
+
+def test_hook_without_a_golden_set_only_checks_latency(monkeypatch, mocker, capsys):
+    ret, statuses = hook(monkeypatch, mocker, LatencyRuntime(), golden_set='')
+    assert ret['statusCode'] == 200 and statuses == ['Succeeded']
+    assert 'skipping the correctness check' in capsys.readouterr().out
+
+    mocker.patch.object(golden, 'LATENCY_SLO_P50_MS', 1)
+    ret, statuses = hook(monkeypatch, mocker, LatencyRuntime(delay=0.01), golden_set='')
+    assert ret['message'].startswith('Golden set latency/unconfigured failed: p50 latency')
+    assert statuses == ['Failed']
@@ -0,0 +1,61 @@
+import io
+import json
+
+from botocore.exceptions import ReadTimeoutError
+
+from workflow.training import golden_set
+
+VALIDATION = 'a,Target,b\n' + ''.join('{},{},{}\n'.format(i, i % 3, i * 2) for i in range(30))
+
+class FakeS3:
+    def __init__(self, objects):
+        self.objects = objects
+        self.puts = {}
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        return [{'Contents': [{'Key': k} for k in sorted(self.objects) if k.startswith(Prefix)]}]
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[Key].encode('utf-8'))}
+
+    def put_object(self, Bucket, Key, Body):
+        self.puts[Key] = json.loads(Body)
+
+class FakeRuntime:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def invoke_endpoint(self, EndpointName, Body, ContentType, Accept):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        # Predict the first column modulo 3, as CSV
+        body = '\n'.join(str(float(int(line.split(',')[0]) % 3)) for line in Body.split('\n'))
+        return {'Body': io.BytesIO(body.encode('utf-8'))}
+
+def test_samples_each_class_and_drops_the_label(mocker):
+    mocker.patch.object(golden_set, 'NUM_CLASSES', 3)
+    s3 = FakeS3({'prefix/data/val/val.csv': VALIDATION, 'prefix/data/train/train.csv': VALIDATION})
+    rows = golden_set.sample(s3, 'bucket', 'prefix/data/val/', per_class=2)
+    assert rows == [('0,0', 0.0), ('1,2', 1.0), ('2,4', 2.0), ('3,6', 0.0), ('4,8', 1.0), ('5,10', 2.0)]
+
+def test_build_records_the_live_predictions(mocker):
+    mocker.patch.object(golden_set, 'CHUNK_ROWS', 4)
+    s3 = FakeS3({'prefix/data/val/val.csv': VALIDATION})
+    sm_runtime = FakeRuntime()
+    uri = golden_set.build(s3, sm_runtime, 'bucket', 'prefix', 'stack-blue', 'job-1')
+    assert uri == 's3://bucket/prefix/model/job-1/golden.json'
+    golden = s3.puts['prefix/model/job-1/golden.json']
+    assert golden['version'] == 'job-1' and golden['content_type'] == 'text/csv'
+    assert len(golden['records']) == 30 and sm_runtime.calls == 8
+    assert all(r['expected'] == r['label'] for r in golden['records'])
+
+def test_build_without_a_live_endpoint_has_labels_only():
+    s3 = FakeS3({'prefix/data/val/val.csv': VALIDATION})
+    golden_set.build(s3, FakeRuntime(ReadTimeoutError(endpoint_url='x')), 'bucket', 'prefix', 'stack-blue', 'job-1')
+    records = s3.puts['prefix/model/job-1/golden.json']['records']
+    assert records and not any('expected' in r for r in records)
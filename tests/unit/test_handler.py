@@ -116,7 +116,7 @@ def apigw_event():
             "domainName": "656imtvqec.execute-api.ap-southeast-2.amazonaws.com",
             "apiId": "656imtvqec"
         },
-        "body": "{\"data\":\"1:1 2:0.555 3:0.435 4:0.145 5:0.9205 6:0.404 7:0.2275 8:0.255\"}",
+        "body": "{\"data\":\"0:1 1:0.555 2:0.435 3:0.145 4:0.9205 5:0.404 6:0.2275 7:0.255\"}",
         "isBase64Encoded": False
         }
 
@@ -129,3 +129,121 @@ def test_regression_handler(apigw_event, mocker):
     assert ret["statusCode"] == 200
     assert "prediction" in ret["body"]
     # assert "location" in data.dict_keys()
+
+class EchoRuntime:
+    """Return one prediction per posted row, counting rows sent to the endpoint"""
+
+    def __init__(self):
+        self.rows = 0
+
+    def invoke_endpoint(self, EndpointName, Body, ContentType, Accept):
+        import io
+        rows = Body.split('\n')
+        self.rows += len(rows)
+        body = json.dumps([float(row.split(' ')[1].split(':')[1]) for row in rows])
+        return {'Body': io.BytesIO(body.encode('utf-8'))}
+
+@pytest.fixture()
+def stub_runtime(monkeypatch, mocker):
+    from regression import cache, runtime
+    monkeypatch.setenv('COMMIT_ID', 'abc1234')
+    monkeypatch.setenv('ENDPOINT_NAME', 'sam-sagemaker-blue')
+    runtime.reset()
+    cache.reset()
+    sm = EchoRuntime()
+    mocker.patch.object(runtime, 'client', return_value=sm)
+    yield sm
+    runtime.reset()
+    cache.reset()
+
+def test_regression_handler_batch_caches_records(apigw_event, stub_runtime):
+    records = ['1:1 2:0.{} 3:0.4'.format(i) for i in range(5)]
+    apigw_event['body'] = json.dumps({'data': records})
+
+    ret = app.lambda_handler(apigw_event, "")
+    data = json.loads(ret["body"])
+    assert ret["statusCode"] == 200
+    assert data["predictions"] == [0.0, 0.1, 0.2, 0.3, 0.4]
+    assert stub_runtime.rows == 5
+
+    apigw_event['body'] = json.dumps({'data': records + ['1:1 2:0.9 3:0.4']})
+    ret = app.lambda_handler(apigw_event, "")
+    data = json.loads(ret["body"])
+    assert data["predictions"][-1] == 0.9
+    assert stub_runtime.rows == 6
+
+def test_regression_handler_returns_prediction_array(apigw_event, stub_runtime):
+    ret = app.lambda_handler(apigw_event, "")
+    data = json.loads(ret["body"])
+    assert ret["headers"]["Content-Type"] == "application/json"
+    assert data["predictions"] == [0.555]
+
+def test_regression_handler_rejects_invalid_payload(apigw_event, stub_runtime):
+    apigw_event['body'] = json.dumps({'data': '1:1 9:0.5'})
+    ret = app.lambda_handler(apigw_event, "")
+    assert ret["statusCode"] == 400
+    assert json.loads(ret["body"])["errors"][0]["message"] == 'feature index out of range 0-7'
+    assert stub_runtime.rows == 0
+
+def test_regression_handler_rejects_bodies_without_records(apigw_event, stub_runtime):
+    for body in ({}, {'data': ''}, {'data': None}, []):
+        apigw_event['body'] = json.dumps(body)
+        ret = app.lambda_handler(apigw_event, "")
+        assert ret["statusCode"] == 400, body
+        assert json.loads(ret["body"])["errors"]
+    assert stub_runtime.rows == 0
+
+def test_regression_handler_batch_of_invalid_records_is_a_bad_request(apigw_event, stub_runtime):
+    apigw_event['body'] = json.dumps({'data': ['1:1 9:1', 'x']})
+    ret = app.lambda_handler(apigw_event, "")
+    assert ret["statusCode"] == 400
+    assert [e["message"] for e in json.loads(ret["body"])["errors"]] == [
+        'feature index out of range 0-7', 'no features']
+    assert stub_runtime.rows == 0
+
+def test_regression_handler_rejects_records_that_are_not_strings(apigw_event, stub_runtime):
+    for data in ([1, 2], [[1, 2, 3]], [None]):
+        apigw_event['body'] = json.dumps({'data': data})
+        ret = app.lambda_handler(apigw_event, "")
+        assert ret["statusCode"] == 400, data
+        assert {e["message"] for e in json.loads(ret["body"])["errors"]} == {'record is not a string'}
+
+    apigw_event['body'] = json.dumps({'data': ['0:1 1:0.5', 5]})
+    ret = app.lambda_handler(apigw_event, "")
+    data = json.loads(ret["body"])
+    assert ret["statusCode"] == 200
+    assert data["predictions"] == [0.5, None]
+    assert data["errors"] == [{"record": 1, "message": "record is not a string"}]
+    assert stub_runtime.rows == 1
+
+def test_regression_handler_converts_json_instances(apigw_event, stub_runtime):
+    apigw_event['headers']['Content-Type'] = 'application/json'
+    apigw_event['body'] = json.dumps({'instances': [[1, 0.25, 0, 0, 0, 0, 0, 0], [1, 2]]})
+    ret = app.lambda_handler(apigw_event, "")
+    data = json.loads(ret["body"])
+    assert data["predictions"] == [0.25, None]
+    assert data["errors"] == [{"record": 1, "message": "expected 8 features"}]
+
+def test_regression_handler_emits_stage_metrics(apigw_event, stub_runtime, capsys):
+    app.lambda_handler(apigw_event, "")
+    lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    doc = json.loads(lines[-1])
+    assert doc["CommitId"] == "abc1234"
+    assert {"ParseLatency", "ConvertLatency", "InvokeLatency", "ReadLatency", "SerializeLatency"} <= set(doc)
+    assert doc["ContentType"] == "text/libsvm"
+
+def test_regression_handler_reports_unsupported_content_types_as_other(apigw_event, stub_runtime, capsys):
+    apigw_event['headers']['Content-Type'] = 'text/x-client-{}'.format(id(apigw_event))
+    app.lambda_handler(apigw_event, "")
+    lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    assert json.loads(lines[-1])["ContentType"] == "other"
+
+def test_regression_handler_compares_shadow_requests_before_returning(apigw_event, stub_runtime, mocker):
+    from regression import shadow
+    mocker.patch.object(shadow, 'SHADOW_SAMPLE_RATE', 1.0)
+    mocker.patch.object(shadow, '_paused_until', 0.0)
+    mocker.patch.object(shadow, 'stats', shadow.ShadowStats())
+    ret = app.lambda_handler(apigw_event, "")
+    assert ret["statusCode"] == 200
+    assert stub_runtime.rows == 2 # primary and candidate
+    assert shadow.stats.summary()['agreement'] == 1.0
@@ -0,0 +1,90 @@
+import pickle
+import tarfile
+
+import numpy as np
+import pytest
+
+from regression import app, local_model, runtime
+
+xgboost = pytest.importorskip('xgboost')
+
+class FakeS3:
+    def __init__(self, archive):
+        self.archive = archive
+        self.downloads = 0
+
+    def download_file(self, bucket, key, filename):
+        self.downloads += 1
+        with open(self.archive, 'rb') as src, open(filename, 'wb') as dst:
+            dst.write(src.read())
+
+@pytest.fixture()
+def booster():
+    X = np.random.rand(50, 8)
+    return xgboost.train({'objective': 'reg:squarederror'}, xgboost.DMatrix(X, label=X[:, 0]), 2)
+
+@pytest.fixture()
+def model_archive(tmp_path, booster):
+    with open(str(tmp_path / 'model.bin'), 'wb') as f:
+        pickle.dump(booster, f)
+    archive = str(tmp_path / 'model.tar.gz')
+    with tarfile.open(archive, 'w:gz') as tar:
+        tar.add(str(tmp_path / 'model.bin'), arcname='model.bin')
+    return archive
+
+@pytest.fixture(autouse=True)
+def local_mode(tmp_path, mocker):
+    mocker.patch.object(local_model, 'INFERENCE_MODE', 'local')
+    mocker.patch.object(local_model, 'MODEL_DATA_URL', 's3://bucket/model/job/output/model.tar.gz')
+    mocker.patch.object(local_model, 'MODEL_CACHE_DIR', str(tmp_path / 'cache'))
+    local_model.reset()
+    yield
+    local_model.reset()
+
+def test_model_is_downloaded_once_and_scores_rows(model_archive):
+    s3 = FakeS3(model_archive)
+    model = local_model.get_model(s3, 'abc1234')
+    assert local_model.get_model(s3, 'abc1234') is model
+    assert s3.downloads == 1
+
+    features = np.full((2, 8), 0.5)
+    features[1, 3] = np.nan
+    predictions = local_model.predict(model, features)
+    assert len(predictions) == 2
+
+    # A new container reuses the artifact cached on local disk
+    local_model.reset()
+    local_model.get_model(s3, 'abc1234')
+    assert s3.downloads == 1
+
+def test_failed_load_falls_back_and_backs_off(tmp_path):
+    s3 = FakeS3(str(tmp_path / 'missing.tar.gz'))
+    assert local_model.get_model(s3, 'abc1234') is None
+    assert local_model.get_model(s3, 'abc1234') is None
+    assert s3.downloads == 1
+
+def test_can_serve_small_requests_only():
+    assert local_model.can_serve(1)
+    assert not local_model.can_serve(local_model.LOCAL_MAX_ROWS + 1)
+    assert not local_model.can_serve(0)
+
+def test_native_model_is_preferred(tmp_path, booster):
+    model_dir = tmp_path / 'model'
+    model_dir.mkdir()
+    booster.save_model(str(model_dir / 'model.ubj'))
+    (model_dir / 'model.bin').write_bytes(b'not a pickle')
+    model = local_model.load(str(model_dir))
+    features = np.full((1, 8), 0.5)
+    assert local_model.predict(model, features) == booster.predict(xgboost.DMatrix(features)).tolist()
+
+def test_local_predictions_match_the_endpoint_libsvm_columns(tmp_path, mocker, model_archive, booster):
+    mocker.patch.object(runtime, 'client', return_value=FakeS3(model_archive))
+    config = runtime.Config('abc1234', 'endpoint', None, None, None, False)
+    rows = ['0:0.1 1:0.2 2:0.3 3:0.4 4:0.5 5:0.6 6:0.7 7:0.8', '3:0.9 7:0.05', '0:0.3 4:0.6']
+    local = app.predict_local(config, rows, 'text/libsvm')
+
+    # The endpoint reads the libsvm text into a DMatrix, with index i as column i
+    path = tmp_path / 'rows.libsvm'
+    path.write_text(''.join('0 {}\n'.format(row) for row in rows))
+    remote = booster.predict(xgboost.DMatrix('{}?format=libsvm'.format(path)))
+    assert np.allclose(local, remote)
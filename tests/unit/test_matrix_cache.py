@@ -0,0 +1,102 @@
+import itertools
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from workflow.training import data_loader, matrix_cache
+
+class FakeS3:
+    """Objects stored as local files, with an increasing LastModified on every write"""
+
+    def __init__(self, root):
+        self.root = root
+        self.objects = {}
+        self.clock = itertools.count()
+
+    def upload_file(self, filename, bucket, key):
+        path = os.path.join(self.root, key.replace('/', '_'))
+        shutil.copy(filename, path)
+        self.objects[key] = (next(self.clock), path)
+
+    def download_file(self, bucket, key, filename):
+        shutil.copy(self.objects[key][1], filename)
+
+    def copy_object(self, Bucket, Key, CopySource, MetadataDirective):
+        self.objects[Key] = (next(self.clock), self.objects[CopySource['Key']][1])
+
+    def delete_object(self, Bucket, Key):
+        del self.objects[Key]
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        yield {'Contents': [{'Key': key, 'LastModified': modified}
+                            for key, (modified, _) in sorted(self.objects.items()) if key.startswith(Prefix)]}
+
+@pytest.fixture()
+def files(tmp_path):
+    channel = tmp_path / 'train'
+    channel.mkdir()
+    (channel / 'part-000.csv').write_text('Target,a,b\n1,0.5,2\n0,1.5,3\n')
+    (channel / 'part-001.csv').write_text('Target,a,b\n2,2.5,4\n')
+    return data_loader.list_files(str(channel))
+
+def test_key_depends_on_content_and_schema(files):
+    key = matrix_cache.cache_key(files)
+    assert key == matrix_cache.cache_key(files)
+    assert key != matrix_cache.cache_key(files, label_column='a')
+    with open(files[1], 'a') as f:
+        f.write('3,3.5,5\n')
+    assert key != matrix_cache.cache_key(files)
+
+def test_hit_memory_maps_the_parsed_arrays(files, tmp_path, mocker):
+    cache = matrix_cache.MatrixCache(str(tmp_path / 'cache'))
+    features, labels = cache.load(files)
+    parse = mocker.spy(data_loader, 'load')
+    cached_features, cached_labels = cache.load(files)
+    assert parse.call_count == 0
+    assert isinstance(cached_features, np.memmap)
+    np.testing.assert_array_equal(cached_features, features)
+    np.testing.assert_array_equal(cached_labels, [1, 0, 2])
+
+def test_corrupt_entry_is_reparsed(files, tmp_path, mocker):
+    cache = matrix_cache.MatrixCache(str(tmp_path / 'cache'), verify='full')
+    cache.load(files)
+    key = matrix_cache.cache_key(files)
+    path = os.path.join(cache.directory, key, 'labels.npy')
+    with open(path, 'r+b') as f:
+        f.seek(-4, os.SEEK_END)
+        f.write(b'\xff\xff\xff\xff')
+    assert cache.get(key) is None
+    parse = mocker.spy(data_loader, 'load')
+    np.testing.assert_array_equal(cache.load(files)[1], [1, 0, 2])
+    assert parse.call_count == 1
+
+def test_least_recently_used_entries_are_evicted(files, tmp_path):
+    cache = matrix_cache.MatrixCache(str(tmp_path / 'cache'))
+    cache.put('old', np.zeros((10, 2), np.float32), np.zeros(10, np.float32))
+    cache.put('new', np.zeros((10, 2), np.float32), np.zeros(10, np.float32))
+    os.utime(os.path.join(cache.directory, 'old', matrix_cache.MANIFEST), (1, 1))
+    # Room for two entries
+    cache.max_bytes = cache.entries()[0][1] * 2 + 100
+    cache.put('newest', np.zeros((10, 2), np.float32), np.zeros(10, np.float32))
+    assert sorted(key for _, _, key in cache.entries()) == ['new', 'newest']
+
+def test_least_recently_used_s3_entries_are_evicted(files, tmp_path, mocker):
+    s3 = FakeS3(str(tmp_path))
+    mocker.patch('boto3.client', return_value=s3)
+    cache = matrix_cache.MatrixCache(str(tmp_path / 'cache'), s3_uri='s3://bucket/prefix/cache/matrix',
+                                     max_s3_entries=2)
+    for key in ('old', 'new'):
+        cache.put(key, np.zeros((10, 2), np.float32), np.zeros(10, np.float32))
+
+    # Another job downloads the older entry, which marks it as recently used
+    other = matrix_cache.MatrixCache(str(tmp_path / 'other'), s3_uri='s3://bucket/prefix/cache/matrix')
+    assert other.get('old') is not None
+
+    cache.put('newest', np.zeros((10, 2), np.float32), np.zeros(10, np.float32))
+    assert sorted(key for _, key in cache.s3_entries(s3)) == ['newest', 'old']
+    assert not [key for key in s3.objects if key.startswith('prefix/cache/matrix/new/')]
@@ -0,0 +1,29 @@
+import json
+
+from regression import metrics
+
+def test_document_is_embedded_metric_format():
+    doc = metrics.document(
+        {"EndpointName": "endpoint", "CommitId": "abc1234"},
+        {"InvokeLatency": (12.5, metrics.MILLISECONDS)},
+        properties={"StatusCode": 200})
+
+    directive = doc["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Dimensions"] == [["EndpointName", "CommitId"]]
+    assert directive["Metrics"] == [{"Name": "InvokeLatency", "Unit": "Milliseconds"}]
+    assert doc["InvokeLatency"] == 12.5
+    assert doc["CommitId"] == "abc1234"
+    assert doc["StatusCode"] == 200
+
+def test_emit_stages(capsys):
+    timer = metrics.StageTimer()
+    with timer.stage('parse'):
+        pass
+    timer.add('invoke', 10.0)
+    timer.add('invoke', 5.0)
+    metrics.emit_stages(timer, {"EndpointName": "endpoint"}, {"Rows": 3})
+
+    doc = json.loads(capsys.readouterr().out)
+    names = [m["Name"] for m in doc["_aws"]["CloudWatchMetrics"][0]["Metrics"]]
+    assert names == ["ParseLatency", "InvokeLatency", "Latency", "Rows"]
+    assert doc["InvokeLatency"] == 15.0
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from regression import payload
+
+ROW = '0:1 1:0.555 2:0.435 3:0.145 4:0.9205 5:0.404 6:0.2275 7:0.255'
+
+def test_parse_libsvm_rejects_bad_rows():
+    lines = [ROW, '15 0:2 2:0.1', '0:1 8:2', '0:x', '', '0:1 0:2', '1:0.5 foo']
+    features, valid, errors = payload.parse(lines, payload.LIBSVM)
+
+    assert valid.tolist() == [True, True, False, False, False, False, False]
+    assert errors == {
+        2: 'feature index out of range 0-7',
+        3: 'feature value is not a finite number',
+        4: 'no features',
+        5: 'duplicate feature index',
+        6: 'unexpected token without a feature index',
+    }
+    assert features[0, 4] == 0.9205
+    assert np.isnan(features[1, 1]) and features[1, 2] == 0.1
+
+def test_parse_csv_checks_width_and_values():
+    lines = ['1,2,3,4,5,6,7,8', '1,,3,4,5,6,7,8', '1,2', 'a,2,3,4,5,6,7,8']
+    features, valid, errors = payload.parse(lines, payload.CSV)
+
+    assert valid.tolist() == [True, True, False, False]
+    assert errors == {2: 'expected 8 features', 3: 'feature value is not a finite number'}
+    assert np.isnan(features[1, 1])
+
+def test_parse_instances():
+    features, valid, errors = payload.parse([[1] * 8, {'features': [2] * 8}, [1, 2]], payload.JSON)
+    assert valid.tolist() == [True, True, False]
+    assert features[1].tolist() == [2.0] * 8
+
+def test_rows_without_features_are_rejected():
+    for records, content_type in (([''], payload.LIBSVM), (['', '  '], payload.LIBSVM),
+                                  ([',,,,,,,'], payload.CSV), ([[None] * 8, {'features': [None] * 8}], payload.JSON)):
+        features, valid, errors = payload.parse(records, content_type)
+        assert not valid.any() and set(errors.values()) == {'no features'}
+    assert payload.prepare([], payload.LIBSVM) == ([], [], [])
+
+    rows, index, errors = payload.prepare([',,,,,,,', '1,,,,,,,'], payload.CSV, payload.LIBSVM)
+    assert rows == ['0:1.0'] and index == [1]
+    assert errors == [{"record": 0, "message": "no features"}]
+
+def test_conversions_round_trip():
+    features, valid, errors = payload.parse([ROW, '0:2 2:0.1'], payload.LIBSVM)
+
+    csv = payload.to_csv(features)
+    assert csv == ['1.0,0.555,0.435,0.145,0.9205,0.404,0.2275,0.255', '2.0,,0.1,,,,,']
+    assert payload.to_libsvm(payload.parse(csv, payload.CSV)[0]) == [
+        '0:1.0 1:0.555 2:0.435 3:0.145 4:0.9205 5:0.404 6:0.2275 7:0.255', '0:2.0 2:0.1']
+    assert payload.to_instances(features)[1][:3] == [2.0, None, 0.1]
+
+def test_prepare_converts_valid_records_only():
+    rows, index, errors = payload.prepare(['x', '1,2,3,4,5,6,7,8'], payload.CSV, payload.LIBSVM)
+    assert rows == ['0:1.0 1:2.0 2:3.0 3:4.0 4:5.0 5:6.0 6:7.0 7:8.0']
+    assert index == [1]
+    assert errors == [{"record": 0, "message": "expected 8 features"}]
+
+    rows, index, errors = payload.prepare([ROW], payload.LIBSVM, payload.LIBSVM)
+    assert rows == [ROW]
+
+def test_records_that_are_not_strings_are_rejected():
+    for content_type in (payload.LIBSVM, payload.CSV):
+        features, valid, errors = payload.parse([1, [1, 2, 3], None, ROW], content_type)
+        assert valid.tolist() == [False, False, False, content_type == payload.LIBSVM]
+        assert [errors[i] for i in range(3)] == ['record is not a string'] * 3
+
+def test_converted_libsvm_predicts_like_csv(tmp_path):
+    xgboost = pytest.importorskip('xgboost')
+    X = np.random.rand(50, 8)
+    booster = xgboost.train({'objective': 'reg:squarederror'}, xgboost.DMatrix(X, label=X[:, 3]), 5)
+
+    csv = payload.to_csv(X[:5])
+    rows, index, errors = payload.prepare(csv, payload.CSV, payload.LIBSVM)
+    path = tmp_path / 'rows.libsvm'
+    path.write_text(''.join('0 {}\n'.format(row) for row in rows))
+    from_libsvm = booster.predict(xgboost.DMatrix('{}?format=libsvm'.format(path)))
+    from_csv = booster.predict(xgboost.DMatrix(payload.parse(csv, payload.CSV)[0]))
+    assert np.allclose(from_libsvm, from_csv)
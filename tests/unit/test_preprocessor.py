@@ -0,0 +1,64 @@
+import base64
+import json
+
+import numpy as np
+
+from workflow.schedule import preprocessor
+
+class Capture:
+    def __init__(self, data, observed_content_type, encoding='CSV'):
+        self.data = data
+        self.observed_content_type = observed_content_type
+        self.encoding = encoding
+
+class InferenceRecord:
+    def __init__(self, endpoint_input, endpoint_output):
+        self.endpoint_input = endpoint_input
+        self.endpoint_output = endpoint_output
+
+def capture(data, content_type, output, output_type='application/json'):
+    return {'captureData': {
+        'endpointInput': {'observedContentType': content_type, 'mode': 'INPUT',
+                          'data': base64.b64encode(data.encode('utf-8')).decode('utf-8'), 'encoding': 'BASE64'},
+        'endpointOutput': {'observedContentType': output_type, 'mode': 'OUTPUT', 'data': output, 'encoding': 'JSON'},
+    }}
+
+def test_batch_parses_csv_and_libsvm_rows():
+    records = [
+        capture('1,2,3\n4,,6,7', 'text/csv', '1.0,2.0', 'text/csv'),
+        capture('5 0:0.5 2:2\n1:8', 'text/libsvm', '{"predictions": [{"score": 3}, {"score": 4}]}'),
+        capture('9,x,8', 'text/csv; charset=utf-8', '[0.25, 0.75]'),
+    ]
+    batch = preprocessor.preprocess_batch(records, ['a', 'b', 'c'])
+    assert batch.columns == ['a', 'b', 'c', 'prediction0', 'prediction1']
+    assert batch.record.tolist() == [0, 0, 1, 1, 2]
+    np.testing.assert_array_equal(batch.values, [
+        [1, 2, 3, 1, np.nan],
+        [4, np.nan, 6, 2, np.nan],
+        [0.5, np.nan, 2, 3, np.nan],
+        [np.nan, 8, np.nan, 4, np.nan],
+        [9, np.nan, 8, 0.25, 0.75],
+    ])
+
+def test_batch_with_empty_libsvm_input():
+    batch = preprocessor.preprocess_batch([capture('', 'text/libsvm', '[1.0]')], ['a', 'b'])
+    np.testing.assert_array_equal(batch.values, [[np.nan, np.nan, 1.0]])
+
+    records = [capture(' \n', 'text/libsvm', '[1.0, 2.0]'), capture('1:3', 'text/libsvm', '[4.0]')]
+    batch = preprocessor.preprocess_batch(records, ['a', 'b'])
+    assert batch.record.tolist() == [0, 1]
+    np.testing.assert_array_equal(batch.values, [[np.nan, np.nan, 1.0, 2.0], [np.nan, 3.0, 4.0, np.nan]])
+
+def test_handler_flattens_an_inference_record(mocker):
+    mocker.patch.object(preprocessor, 'PREDICTION_COLUMNS', ['Target'])
+    record = InferenceRecord(Capture('1.5,,3', 'text/csv'), Capture('7.0', 'text/csv'))
+    flat = preprocessor.preprocess_handler(record)
+    assert flat == {'feature0': 1.5, 'feature2': 3.0, 'Target': 7.0}
+    assert json.dumps(flat)
+
+    record = InferenceRecord(Capture('0:1\n1:2', 'text/libsvm'),
+                             Capture('[[0.1, 0.9], [0.8, 0.2]]', 'application/json'))
+    assert preprocessor.preprocess_handler(record) == [
+        {'feature0': 1.0, 'Target': 0.1, 'prediction1': 0.9},
+        {'feature1': 2.0, 'Target': 0.8, 'prediction1': 0.2},
+    ]
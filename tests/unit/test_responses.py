@@ -0,0 +1,41 @@
+import base64
+import json
+
+from regression import responses
+
+def test_negotiate_accept_header():
+    assert responses.negotiate(None) == responses.JSON
+    assert responses.negotiate('*/*') == responses.JSON
+    assert responses.negotiate('text/csv') == responses.CSV
+    assert responses.negotiate('application/x-ndjson;q=0.5, text/csv;q=0.9') == responses.CSV
+    assert responses.negotiate('image/png, application/jsonlines') == responses.JSONLINES
+    assert responses.negotiate('image/png') == responses.JSON
+
+def test_header_is_case_insensitive():
+    event = {'headers': {'accept': 'text/csv'}}
+    assert responses.header(event, 'Accept') == 'text/csv'
+    assert responses.header({'headers': None}, 'Accept', 'x') == 'x'
+
+def test_json_predictions_are_an_array():
+    ret = responses.format_predictions(responses.JSON, [1.5, None], 'abc1234', 'endpoint')
+    assert ret['headers']['Content-Type'] == responses.JSON
+    assert json.loads(ret['body'])['predictions'] == [1.5, None]
+
+def test_compact_formats_carry_errors_in_headers():
+    errors = [{"chunk": 0, "start": 1, "end": 2, "message": "bad"}]
+    ret = responses.format_predictions(responses.CSV, [1.5, None], 'abc1234', 'endpoint', errors=errors)
+    assert ret['body'] == '1.5\n'
+    assert json.loads(ret['headers']['X-Prediction-Errors']) == errors
+    assert ret['headers']['X-Model-Version'] == 'abc1234'
+
+    ret = responses.format_predictions(responses.NDJSON, [1.5, None], 'abc1234', 'endpoint')
+    assert ret['body'] == '1.5\nnull'
+
+def test_passthrough_keeps_endpoint_bytes():
+    ret = responses.passthrough(b'1.5\n2.5', responses.CSV, 'abc1234', 'endpoint')
+    assert ret['body'] == '1.5\n2.5'
+    assert ret['isBase64Encoded'] is False
+
+    ret = responses.passthrough(b'\x93NUMPY', 'application/x-npy', 'abc1234', 'endpoint')
+    assert base64.b64decode(ret['body']) == b'\x93NUMPY'
+    assert ret['isBase64Encoded'] is True
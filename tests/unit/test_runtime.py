@@ -0,0 +1,39 @@
+import pytest
+
+from regression import runtime
+
+@pytest.fixture(autouse=True)
+def fresh_runtime(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'ap-southeast-2')
+    monkeypatch.setenv('COMMIT_ID', 'abc1234')
+    monkeypatch.setenv('ENDPOINT_NAME', 'sam-sagemaker-blue')
+    runtime.reset()
+    yield
+    runtime.reset()
+
+def test_config_is_parsed_once(monkeypatch):
+    config = runtime.get_config()
+    assert config.commit_id == 'abc1234'
+    assert config.endpoint_name == 'sam-sagemaker-blue'
+    assert config.log_events is False
+
+    monkeypatch.setenv('COMMIT_ID', 'changed')
+    assert runtime.get_config() is config
+
+def test_client_is_created_lazily_and_cached(mocker):
+    create = mocker.spy(runtime, '_create_client')
+    assert create.call_count == 0
+
+    sm = runtime.client('sagemaker-runtime')
+    assert runtime.client('sagemaker-runtime') is sm
+    assert create.call_count == 1
+
+    config = sm.meta.config
+    assert config.connect_timeout == 1
+    assert config.read_timeout == 5
+    assert config.tcp_keepalive is True
+    assert config.retries['mode'] == 'standard'
+
+def test_log_event_skips_serialization_by_default(capsys):
+    runtime.log_event('message', {'body': 'secret'})
+    assert 'secret' not in capsys.readouterr().out
@@ -0,0 +1,80 @@
+import io
+import json
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+from workflow.training import data_prep, s3_sync
+
+class FakeS3:
+    """In memory buckets of {key: (etag, size)}, where large copies get a multipart ETag"""
+    def __init__(self, buckets, multipart_threshold=100):
+        self.buckets = buckets
+        self.multipart_threshold = multipart_threshold
+        self.copies = []
+        self.lock = threading.Lock()
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        keys = sorted(k for k in self.buckets.get(Bucket, {}) if k.startswith(Prefix))
+        # Two pages, as listings are paginated
+        for page in (keys[:2], keys[2:]):
+            yield {'Contents': [{'Key': k, 'ETag': '"{}"'.format(self.buckets[Bucket][k][0]),
+                                 'Size': self.buckets[Bucket][k][1]} for k in page]}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.buckets.get(Bucket, {}):
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'missing'}}, 'GetObject')
+        return {'Body': io.BytesIO(self.buckets[Bucket][Key][2])}
+
+    def put_object(self, Bucket, Key, Body):
+        self.buckets.setdefault(Bucket, {})[Key] = ('put', len(Body), Body.encode('utf-8'))
+
+    def copy(self, CopySource, Bucket, Key, Config=None):
+        etag, size = self.buckets[CopySource['Bucket']][CopySource['Key']][:2]
+        if size > self.multipart_threshold:
+            etag = etag + '-2'
+        with self.lock:
+            self.copies.append(Key)
+            self.buckets.setdefault(Bucket, {})[Key] = (etag, size)
+
+@pytest.fixture()
+def s3():
+    return FakeS3({data_prep.source_bucket_name: {
+        'aim362/data/train/a.csv': ('e1', 10),
+        'aim362/data/train/b.csv': ('e2', 500),
+        'aim362/data/val/c.csv': ('e3', 20),
+    }})
+
+def test_copies_only_missing_and_changed_objects(s3):
+    stats = data_prep.main('target', 'prefix', s3=s3)
+    assert stats['copied'] == 3 and stats['copied_bytes'] == 530
+    assert sorted(s3.copies) == ['prefix/data/train/a.csv', 'prefix/data/train/b.csv', 'prefix/data/val/c.csv']
+
+    # The multipart copy of b.csv has a different ETag, but matches the manifest
+    s3.copies = []
+    stats = data_prep.main('target', 'prefix', s3=s3)
+    assert stats['copied'] == 0 and stats['skipped'] == 3
+
+    s3.buckets[data_prep.source_bucket_name]['aim362/data/train/a.csv'] = ('e4', 10)
+    s3.buckets[data_prep.source_bucket_name]['aim362/data/train/d.csv'] = ('e5', 10)
+    stats = data_prep.main('target', 'prefix', s3=s3)
+    assert sorted(s3.copies) == ['prefix/data/train/a.csv', 'prefix/data/train/d.csv']
+    manifest = json.loads(s3.buckets['target']['prefix/data/' + s3_sync.MANIFEST][2])
+    assert manifest['train/a.csv'] == 'e4' and manifest['train/b.csv'] == 'e2'
+
+def test_diff_compares_size_and_etag():
+    source = {'a': {'etag': 'e1', 'size': 1}, 'b': {'etag': 'e2', 'size': 2}, 'c': {'etag': 'e3', 'size': 3}}
+    target = {'a': {'etag': 'e1', 'size': 1}, 'b': {'etag': 'e2-1', 'size': 2}, 'c': {'etag': 'x-1', 'size': 4}}
+    assert s3_sync.diff(source, target, {'b': 'e2', 'c': 'e3'}) == ['c']
+    assert s3_sync.diff(source, target, {}) == ['b', 'c']
+
+def test_failed_copies_fail_the_sync(s3, mocker):
+    mocker.patch.object(s3, 'copy', side_effect=ClientError({'Error': {'Code': 'AccessDenied', 'Message': ''}},
+                                                            'CopyObject'))
+    with pytest.raises(RuntimeError):
+        s3_sync.sync(s3, data_prep.source_bucket_name, 'aim362/data/', 'target', 'prefix/data/')
+    assert json.loads(s3.buckets['target']['prefix/data/' + s3_sync.MANIFEST][2]) == {}
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+from regression import shadow
+
+@pytest.fixture(autouse=True)
+def reset_shadow(mocker):
+    mocker.patch.object(shadow, 'SHADOW_SAMPLE_RATE', 1.0)
+    mocker.patch.object(shadow, '_paused_until', 0.0)
+    mocker.patch.object(shadow, 'stats', shadow.ShadowStats())
+
+def test_candidate_is_the_other_blue_green_endpoint(mocker):
+    assert shadow.candidate_endpoint('sam-sagemaker-blue') == 'sam-sagemaker-green'
+    assert shadow.candidate_endpoint('sam-sagemaker-green') == 'sam-sagemaker-blue'
+    assert shadow.candidate_endpoint('other') is None
+    mocker.patch.object(shadow, 'SHADOW_ENDPOINT_NAME', 'candidate')
+    assert shadow.candidate_endpoint('other') == 'candidate'
+
+def test_agreement_within_tolerance():
+    assert shadow.agreement([1.0, 2.0, None], [1.0, 2.5, 3.0]) == (1, 3)
+    assert shadow.agreement([1.0], [1.0, 2.0]) == (0, 1)
+
+def test_mirror_records_side_by_side_stats():
+    calls = []
+
+    def invoke(sm, endpoint_name, rows, content_type):
+        calls.append(endpoint_name)
+        return [1.0, 2.0]
+
+    future = shadow.mirror(None, 'sam-sagemaker-blue', ['1:1', '1:2'], 'text/libsvm', invoke)
+    primary = shadow.Variant('sam-sagemaker-blue', 12.0, [1.0, 3.0])
+    candidate = shadow.compare(future, primary, time.time() + 5)
+
+    assert calls == ['sam-sagemaker-green']
+    assert candidate.predictions == [1.0, 2.0]
+    summary = shadow.stats.summary()
+    assert summary['requests'] == 1
+    assert summary['agreement'] == 0.5
+    assert summary['mean_latency_ms']['primary'] == 12.0
+
+def test_candidate_errors_pause_mirroring():
+    errors = [ClientError({'Error': {'Code': 'ValidationError', 'Message': 'Could not find endpoint'}}, 'InvokeEndpoint'),
+              ReadTimeoutError(endpoint_url='https://runtime.sagemaker')]
+
+    def invoke(sm, endpoint_name, rows, content_type):
+        raise errors.pop(0)
+
+    primary = shadow.Variant('sam-sagemaker-blue', 12.0, [1.0])
+    for expected in (1, 2):
+        future = shadow.mirror(None, 'sam-sagemaker-blue', ['1:1'], 'text/libsvm', invoke)
+        assert shadow.compare(future, primary, time.time() + 5) is None
+        assert shadow.stats.errors == expected
+    assert not shadow.should_mirror('sam-sagemaker-blue')
+
+def test_candidate_missing_the_deadline_is_not_compared():
+    release = threading.Event()
+
+    def invoke(sm, endpoint_name, rows, content_type):
+        release.wait(5)
+        return [1.0]
+
+    future = shadow.mirror(None, 'sam-sagemaker-blue', ['1:1'], 'text/libsvm', invoke)
+    primary = shadow.Variant('sam-sagemaker-blue', 12.0, [1.0])
+    assert shadow.compare(future, primary, time.time() + 0.05) is None
+    release.set()
+    assert shadow.stats.summary()['timeouts'] == 1
+    assert shadow.stats.requests == 0
+
+def test_compare_waits_at_most_the_max_wait(mocker):
+    mocker.patch.object(shadow, 'SHADOW_MAX_WAIT_MS', 20)
+    release = threading.Event()
+
+    def invoke(sm, endpoint_name, rows, content_type):
+        release.wait(5)
+        return [1.0]
+
+    future = shadow.mirror(None, 'sam-sagemaker-blue', ['1:1'], 'text/libsvm', invoke)
+    primary = shadow.Variant('sam-sagemaker-blue', 12.0, [1.0])
+    start = time.time()
+    assert shadow.compare(future, primary, time.time() + 30) is None
+    assert time.time() - start < 1
+    release.set()
+    assert shadow.stats.timeouts == 1
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+xgboost = pytest.importorskip('xgboost')
+if not hasattr(xgboost, 'DataIter'):
+    pytest.skip('streaming needs XGBoost 1.5', allow_module_level=True)
+
+from workflow.training import streaming
+
+HEADER = 'Target,a,b\n'
+ROWS = ['1,0.5,2\n', '0,1.5,3\n', '2,2.5,4\n']
+
+def test_file_mode_batches(tmp_path):
+    (tmp_path / 'part-000.csv').write_text(HEADER + ROWS[0] + ROWS[1])
+    (tmp_path / 'part-001.csv').write_text(HEADER + '\n' + ROWS[2].strip())
+    it = streaming.ChannelIter(str(tmp_path), str(tmp_path / 'cache'), batch_rows=2)
+    assert not it.pipe
+    batches = list(it.batches())
+    assert [len(labels) for features, labels in batches] == [2, 1]
+    np.testing.assert_array_equal(batches[0][0], [[0.5, 2], [1.5, 3]])
+    np.testing.assert_array_equal(batches[1][1], [2])
+    assert batches[0][0].dtype == np.float32
+
+def test_pipe_mode_reads_the_next_epoch_after_reset(tmp_path):
+    # Pipe mode concatenates the S3 objects, so headers repeat within an epoch
+    for epoch in range(3):
+        (tmp_path / 'train_{}'.format(epoch)).write_text(HEADER + ROWS[0] + HEADER + ROWS[epoch])
+    it = streaming.ChannelIter(str(tmp_path / 'train'), str(tmp_path / 'cache'), batch_rows=10)
+    assert it.pipe
+    seen = []
+    for _ in range(2):
+        while it.next(lambda data, label: seen.append(label.tolist())):
+            pass
+        it.reset()
+    assert seen == [[1, 1], [1, 0]]
+
+def test_stream_dmatrix_trains(tmp_path):
+    channel = tmp_path / 'train'
+    channel.mkdir()
+    rng = np.random.RandomState(0)
+    data = np.column_stack([rng.randint(0, 3, 300), rng.rand(300, 4)])
+    np.savetxt(str(channel / 'part-000.csv'), data, delimiter=',', fmt='%.5g',
+               header='Target,a,b,c,d', comments='')
+    dtrain = streaming.stream_dmatrix(str(channel), cache_dir=str(tmp_path), batch_rows=100)
+    assert (dtrain.num_row(), dtrain.num_col()) == (300, 4)
+    bst = xgboost.train({'objective': 'multi:softmax', 'num_class': 3}, dtrain, num_boost_round=2)
+    assert len(bst.predict(dtrain)) == 300
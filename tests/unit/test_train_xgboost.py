@@ -0,0 +1,78 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+xgboost = pytest.importorskip('xgboost')
+
+from workflow.training import train_xgboost
+
+@pytest.fixture()
+def bst():
+    X = np.random.RandomState(0).rand(100, 4)
+    y = (X[:, 0] * 3).astype(int)
+    return xgboost.train({'objective': 'multi:softmax', 'num_class': 3}, xgboost.DMatrix(X, label=y), 3)
+
+def test_model_fn_prefers_the_native_model(bst, tmp_path, mocker):
+    train_xgboost.save_model(bst, str(tmp_path))
+    assert sorted(os.listdir(str(tmp_path))) == sorted([train_xgboost.MODEL_FILES['native'], 'model.bin'])
+    load = mocker.spy(train_xgboost, 'load_model')
+    model = train_xgboost.model_fn(str(tmp_path))
+    assert load.call_args[0][1] == 'native'
+
+    X = np.random.RandomState(1).rand(5, 4)
+    X[0, 1] = np.nan
+    np.testing.assert_array_equal(train_xgboost.predict_fn(X, model), bst.predict(xgboost.DMatrix(X)))
+
+def test_predict_fn_accepts_the_default_input_fn_dmatrix(bst, tmp_path):
+    # The container's default input_fn parses CSV and libsvm requests into a DMatrix
+    train_xgboost.save_model(bst, str(tmp_path))
+    model = train_xgboost.model_fn(str(tmp_path))
+    dmatrix = xgboost.DMatrix(np.random.RandomState(1).rand(5, 4))
+    np.testing.assert_array_equal(train_xgboost.predict_fn(dmatrix, model), bst.predict(dmatrix))
+
+def test_model_fn_falls_back_to_the_pickle(bst, tmp_path):
+    train_xgboost.save_model(bst, str(tmp_path), ['pickle'])
+    assert isinstance(train_xgboost.model_fn(str(tmp_path)), xgboost.Booster)
+    with pytest.raises(ValueError):
+        train_xgboost.model_fn(str(tmp_path / 'missing'))
+
+def test_compiled_model_is_skipped_without_treelite(bst, tmp_path, mocker):
+    mocker.patch.object(train_xgboost, 'compile_predictor', side_effect=ImportError('No module named treelite'))
+    train_xgboost.save_model(bst, str(tmp_path), ['compiled', 'native'])
+    assert os.listdir(str(tmp_path)) == [train_xgboost.MODEL_FILES['native']]
+
+def test_round_profiler_records_every_round(capsys):
+    X = np.random.RandomState(0).rand(100, 4)
+    profiler = train_xgboost.RoundProfiler(100)
+    xgboost.train({}, xgboost.DMatrix(X, label=X[:, 0]), 3, callbacks=[profiler])
+    assert len(profiler.rounds) == 3
+    assert all(r['rows_per_sec'] > 0 and r['peak_rss_mb'] > 0 for r in profiler.rounds)
+    assert 'round: 2; round_seconds: ' in capsys.readouterr().out
+
+def test_trains_without_smdebug(mocker):
+    mocker.patch.dict('sys.modules', {'smdebug': None, 'smdebug.xgboost': None})
+    args = train_xgboost.parse_args([])
+    assert train_xgboost.debug_callbacks(args, None, None) == (None, [])
+
+def test_warm_start_continues_the_live_model(bst, tmp_path):
+    import tarfile
+    model_dir = tmp_path / 'model'
+    model_dir.mkdir()
+    train_xgboost.save_model(bst, str(model_dir))
+    channel = tmp_path / 'channel'
+    channel.mkdir()
+    (tmp_path / 'outside').write_text('x')
+    with tarfile.open(str(channel / 'model.tar.gz'), 'w:gz') as tar:
+        for name in os.listdir(str(model_dir)):
+            tar.add(str(model_dir / name), arcname=name)
+        tar.add(str(tmp_path / 'outside'), arcname='../escaped') # Skipped rather than written outside
+
+    live = train_xgboost.load_warm_start(str(channel))
+    assert not (tmp_path / 'escaped').exists() and not os.path.exists(os.path.join(tempfile.gettempdir(), 'escaped'))
+    X = np.random.RandomState(2).rand(20, 4)
+    dnew = xgboost.DMatrix(X, label=(X[:, 0] * 3).astype(int))
+    params = {'objective': 'multi:softmax', 'num_class': 3}
+    continued = train_xgboost.train(params, dnew, dnew, 2, xgb_model=live, verbose_eval=False)
+    assert continued.num_boosted_rounds() == bst.num_boosted_rounds() + 2
@@ -0,0 +1,192 @@
+import json
+import threading
+from collections import namedtuple
+
+import pytest
+from botocore.exceptions import ClientError
+
+from workflow.training import training
+from . import fakes
+
+CONFIG = training.parse_args(['bucket', 'prefix', 'role', 'arn:workflow', 'stack', 'abcdef0123456'])
+
+UploadedCode = namedtuple('UploadedCode', ['s3_prefix'])
+Execution = namedtuple('Execution', ['execution_arn'])
+
+def not_found(operation):
+    return ClientError({'Error': {'Code': 'ResourceNotFound', 'Message': 'not found'}}, operation)
+
+class FakeCodePipeline:
+    def get_pipeline_state(self, name):
+        return {'stageStates': [{'latestExecution': {'pipelineExecutionId': 'exec-1'}}]}
+
+class FakeSSM:
+    def __init__(self, live=None):
+        self.live = live
+
+    def get_parameter(self, Name):
+        if self.live is None:
+            raise not_found('GetParameter')
+        return {'Parameter': {'Value': self.live}}
+
+class FakeSageMaker(fakes.FakeSageMaker):
+    def __init__(self, endpoints=(), **kwargs):
+        super().__init__(**kwargs)
+        self.endpoints = endpoints
+
+    def describe_endpoint(self, EndpointName):
+        if EndpointName not in self.endpoints:
+            raise not_found('DescribeEndpoint')
+        return {'EndpointName': EndpointName, 'EndpointConfigName': 'job-0'}
+
+    def describe_endpoint_config(self, EndpointConfigName):
+        return {'ProductionVariants': [{'ModelName': EndpointConfigName}]}
+
+    def describe_model(self, ModelName):
+        return {'PrimaryContainer': {'ModelDataUrl': 's3://bucket/prefix/model/{}/output/model.tar.gz'.format(ModelName)}}
+
+class FakeS3(fakes.FakeS3):
+    """Training objects a and b, with a live model trained on a only"""
+    def __init__(self):
+        contents = [{'Key': 'prefix/data/train/{}.csv'.format(k), 'ETag': '"etag-{}"'.format(k), 'Size': size}
+                    for k, size in (('a', 100), ('b', 10))]
+        live = {'chain': 0, 'objects': {'prefix/data/train/a.csv': 'etag-a'},
+                'hyperparameters': training.hyperparameters(CONFIG)}
+        super().__init__([{'Contents': contents}], {'prefix/model/job-0/data_manifest.json': live})
+
+class FakeStepFunctions:
+    """Serves the previous definition for the first stale calls"""
+    def __init__(self, workflow, stale=1):
+        self.workflow = workflow
+        self.stale = stale
+        self.calls = 0
+
+    def describe_state_machine(self, stateMachineArn):
+        self.calls += 1
+        if self.calls <= self.stale:
+            return {'definition': '{"previous": true}'}
+        return {'definition': self.workflow.definition.to_json()}
+
+class FakeDefinition:
+    def __init__(self, update_endpoint, plan=None, reuse=None):
+        self.update_endpoint = update_endpoint
+        self.plan = plan
+        self.reuse = reuse
+
+    def to_json(self):
+        return json.dumps({'update_endpoint': self.update_endpoint})
+
+class FakeWorkflow:
+    def __init__(self):
+        self.definition = None
+        self.inputs = None
+
+    def update(self, definition):
+        self.definition = definition
+
+    def execute(self, inputs):
+        self.inputs = inputs
+        return Execution('arn:execution')
+
+class FakeEstimator:
+    def prepare_workflow_for_training(self, job_name):
+        self.uploaded_code = UploadedCode('s3://bucket/prefix/code/{}'.format(job_name))
+
+@pytest.fixture()
+def fakes(mocker):
+    mocker.patch.object(training, 'get_job_name', return_value='job-1')
+    mocker.patch.object(training, 'WORKFLOW_POLL_SECONDS', 0.01)
+    mocker.patch.object(training.golden_set, 'build', return_value='s3://bucket/prefix/model/job-1/golden.json')
+    workflow = FakeWorkflow()
+    # Building the estimator and attaching the workflow must overlap to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    def estimator_factory(config):
+        barrier.wait()
+        return FakeEstimator()
+
+    def attach(workflow_arn):
+        barrier.wait()
+        return workflow
+
+    return workflow, estimator_factory, attach
+
+def run(fakes, tmp_path, ssm, sm):
+    workflow, estimator_factory, attach = fakes
+    clients = {
+        'codepipeline': FakeCodePipeline(),
+        'ssm': ssm,
+        'sagemaker': sm,
+        'sagemaker-runtime': object(),
+        'stepfunctions': FakeStepFunctions(workflow),
+        's3': FakeS3(),
+    }
+    arn = training.run(CONFIG, clients, estimator_factory, attach,
+                       lambda estimator, job_name, *args: FakeDefinition(*args), str(tmp_path))
+    return arn, clients
+
+def test_first_run_creates_the_blue_endpoint(fakes, tmp_path):
+    arn, clients = run(fakes, tmp_path, FakeSSM(), FakeSageMaker())
+    workflow = fakes[0]
+    assert arn == 'arn:execution'
+    assert workflow.definition.update_endpoint is False
+    assert workflow.definition.plan.mode == 'full' and workflow.definition.reuse is None
+    assert workflow.inputs['EndpointName'] == 'stack-blue'
+    assert workflow.inputs['TrainLocation'] == 's3://bucket/prefix/data/train'
+    assert clients['stepfunctions'].calls == 2
+
+    deploy = json.loads((tmp_path / 'deploy.json').read_text())['Parameters']
+    assert deploy['CommitId'] == 'abcdef0'
+    assert deploy['CoolDownEndpointName'] == 'stack-green'
+    assert deploy['ModelDataUrl'] == 's3://bucket/prefix/model/job-1/output/model.tar.gz'
+    assert deploy['GoldenSetUri'] == 's3://bucket/prefix/model/job-1/golden.json'
+    training.golden_set.build.assert_called_once_with(clients['s3'], clients['sagemaker-runtime'], 'bucket',
+                                                      'prefix', 'stack-green', 'job-1')
+    assert 'export STEPFUNCTION_ARN=arn:execution' in (tmp_path / 'training.vars').read_text()
+
+def test_updates_the_endpoint_that_is_not_live(fakes, tmp_path):
+    run(fakes, tmp_path, FakeSSM(live='stack-green'), FakeSageMaker(endpoints=['stack-blue']))
+    workflow = fakes[0]
+    assert workflow.inputs['EndpointName'] == 'stack-blue'
+    assert workflow.definition.update_endpoint is True
+
+def test_warm_starts_from_the_live_model(fakes, tmp_path, mocker):
+    mocker.patch.object(training.warm_start, 'TRAINING_MODE', 'auto')
+    arn, clients = run(fakes, tmp_path, FakeSSM(live='stack-green'), FakeSageMaker(endpoints=['stack-green']))
+    workflow = fakes[0]
+    assert workflow.definition.plan.mode == 'warm'
+    assert workflow.definition.plan.model_data_url == 's3://bucket/prefix/model/job-0/output/model.tar.gz'
+    assert workflow.inputs['TrainLocation'] == 's3://bucket/prefix/model/job-1/train.manifest'
+    assert clients['s3'].puts['prefix/model/job-1/train.manifest'][1:] == ['b.csv']
+    assert clients['s3'].puts['prefix/model/job-1/data_manifest.json']['chain'] == 1
+
+def test_reuses_a_matching_completed_run(fakes, tmp_path):
+    sm = FakeSageMaker(trials=[('abcdef0', 'job-0')], jobs={'job-0': 'Completed'}, models=['job-0'])
+    arn, clients = run(fakes, tmp_path, FakeSSM(), sm)
+    workflow = fakes[0]
+    assert arn == 'arn:execution'
+    assert workflow.definition.reuse.job_name == 'job-0'
+    assert not clients['s3'].puts
+
+    # The rest of the pipeline sees the reused model
+    deploy = json.loads((tmp_path / 'deploy.json').read_text())['Parameters']
+    assert deploy['ModelDataUrl'] == 's3://b/p/model/job-0/output/model.tar.gz'
+    assert 'export TRAINING_JOB_NAME=job-0' in (tmp_path / 'training.vars').read_text()
+    assert sm.tags['arn:trial/abcdef0'][training.fingerprint.JOB_TAG] == 'job-0'
+
+def test_golden_set_failure_stops_before_executing(fakes, tmp_path):
+    training.golden_set.build.side_effect = ValueError('No validation rows for the golden set')
+    with pytest.raises(ValueError):
+        run(fakes, tmp_path, FakeSSM(), FakeSageMaker())
+    workflow = fakes[0]
+    assert workflow.definition is None and workflow.inputs is None
+    assert not (tmp_path / 'deploy.json').exists()
+
+def test_wait_for_definition_gives_up_at_the_deadline():
+    workflow = FakeWorkflow()
+    workflow.update(FakeDefinition(True))
+    sfn = FakeStepFunctions(workflow, stale=100)
+    sleeps = []
+    assert not training.wait_for_definition(sfn, 'arn', workflow.definition.to_json(),
+                                            until=training.time.time() + 2, sleep=sleeps.append)
+    assert sleeps and sleeps == sorted(sleeps)
@@ -0,0 +1,76 @@
+import csv
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+xgboost = pytest.importorskip('xgboost')
+
+from workflow.training import matrix_cache, tune_local
+
+def write_channel(path, rows, seed):
+    path.mkdir()
+    rng = np.random.RandomState(seed)
+    features = rng.rand(rows, 4)
+    labels = (features[:, 0] * 3).astype(int)
+    np.savetxt(str(path / 'part-000.csv'), np.column_stack([labels, features]), delimiter=',',
+               fmt='%.5g', header='Target,a,b,c,d', comments='')
+    return str(path)
+
+def test_rungs_grow_by_the_halving_factor():
+    assert tune_local.rungs(10, 270, 3) == [10, 30, 90, 270]
+    assert tune_local.rungs(10, 100, 3) == [10, 30, 90]
+
+def test_sample_stays_in_the_space():
+    rng = random.Random(0)
+    for _ in range(20):
+        params = tune_local.sample(tune_local.SEARCH_SPACE, rng)
+        assert 3 <= params['max_depth'] <= 10 and isinstance(params['max_depth'], int)
+        assert 0.01 <= params['eta'] <= 0.3
+
+def test_better_orders_by_metric_direction():
+    assert sorted([0.2, 0.1], key=tune_local.better('merror')) == [0.1, 0.2]
+    assert sorted([0.8, 0.9], key=tune_local.better('auc')) == [0.9, 0.8]
+
+def test_successive_halving_promotes_the_best_trials(tmp_path):
+    cache = matrix_cache.MatrixCache(str(tmp_path / 'cache'))
+    paths = []
+    for name, seed in (('train', 0), ('validation', 1)):
+        channel = write_channel(tmp_path / name, 200, seed)
+        features, labels = cache.load(tune_local.data_loader.list_files(channel))
+        paths.append((features.filename, labels.filename))
+
+    configs = [{'max_depth': d, 'eta': 0.3} for d in (1, 2, 3, 4)]
+    params = {'objective': 'multi:softmax', 'num_class': 3, 'eval_metric': 'merror', 'tree_method': 'hist'}
+    with ProcessPoolExecutor(max_workers=1, initializer=tune_local._init_worker, initargs=(paths, 1)) as pool:
+        results = tune_local.successive_halving(pool, params, configs, [2, 4], 2, 50, 'merror')
+
+    assert sorted(results) == [0, 1, 2, 3]
+    promoted = [t for t, r in results.items() if r['rung'] == 1]
+    assert len(promoted) == 2
+    assert all(results[t]['rounds'] == 4 for t in promoted)
+
+    output = str(tmp_path / 'tuning.csv')
+    ranked = tune_local.write_results(output, results, configs, 'merror')
+    with open(output) as f:
+        rows = list(csv.DictReader(f))
+    assert [int(row['trial']) for row in rows] == [r['trial'] for r in ranked]
+    assert rows[0]['rung'] == '1' and 'max_depth' in rows[0]
+
+def test_shareable_paths_writes_arrays_that_are_not_memory_mapped(tmp_path, mocker):
+    cache = matrix_cache.MatrixCache(str(tmp_path / 'cache'))
+    mocker.patch.object(cache, 'put', side_effect=lambda *args: None) # eg. the cache disk is full
+    channel = write_channel(tmp_path / 'train', 50, 0)
+    features, labels = cache.load(tune_local.data_loader.list_files(channel))
+    assert not hasattr(features, 'filename')
+
+    scratch = tmp_path / 'scratch'
+    scratch.mkdir()
+    paths = tune_local.shareable_paths((features, labels), str(scratch))
+    assert len(set(paths)) == 2
+    np.testing.assert_array_equal(np.load(paths[0], mmap_mode='r'), features)
+    np.testing.assert_array_equal(np.load(paths[1], mmap_mode='r'), labels)
+
+    mapped = matrix_cache.MatrixCache(str(tmp_path / 'mapped')).load(tune_local.data_loader.list_files(channel))
+    assert tune_local.shareable_paths(mapped, str(scratch)) == (mapped[0].filename, mapped[1].filename)
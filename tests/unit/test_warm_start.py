@@ -0,0 +1,63 @@
+import pytest
+
+from workflow.training import warm_start
+from .fakes import FakeS3
+
+MODEL_URL = 's3://bucket/prefix/model/job-1/output/model.tar.gz'
+HYPERPARAMETERS = {'objective': 'multi:softmax', 'num_class': '15'}
+
+def objects(**sizes):
+    return {'prefix/data/train/{}.csv'.format(k): {'etag': 'etag-' + k, 'size': v} for k, v in sizes.items()}
+
+def manifest(objs, chain=0, **hyperparameters):
+    return {'chain': chain, 'objects': {k: v['etag'] for k, v in objs.items()},
+            'hyperparameters': dict(HYPERPARAMETERS, **hyperparameters)}
+
+def test_warm_starts_on_only_the_new_objects():
+    previous = objects(a=100, b=100)
+    current = dict(previous, **objects(c=50))
+    plan = warm_start.plan(current, manifest(previous, chain=1), MODEL_URL, HYPERPARAMETERS, mode='auto')
+    assert plan.mode == 'warm'
+    assert plan.new_keys == ['prefix/data/train/c.csv']
+    assert plan.chain == 2 and plan.model_data_url == MODEL_URL
+
+@pytest.mark.parametrize('current, previous, kwargs, reason', [
+    (objects(a=100, c=50), manifest(objects(a=100, b=100)), {}, 'changed or removed'),
+    (objects(a=100, c=150), manifest(objects(a=100)), {}, 'new data is 60%'),
+    (objects(a=100, c=10), manifest(objects(a=100), chain=5), {}, 'already 5 warm starts'),
+    (objects(a=100, c=10), manifest(objects(a=100), num_class='3'), {}, 'num_class changed'),
+    (objects(a=100), manifest(objects(a=100)), {}, 'no new objects'),
+    (objects(a=100, c=10), None, {}, 'no live model'),
+    (objects(a=100, c=10), manifest(objects(a=100)), {'mode': 'full'}, 'training mode is full'),
+])
+def test_falls_back_to_full_retraining(current, previous, kwargs, reason):
+    plan = warm_start.plan(current, previous, MODEL_URL, HYPERPARAMETERS, **dict({'mode': 'auto'}, **kwargs))
+    assert plan.mode == 'full'
+    assert reason in plan.reason
+    assert plan.new_keys == sorted(current)
+
+def test_warm_mode_ignores_the_size_and_chain_limits():
+    plan = warm_start.plan(objects(a=100, c=150), manifest(objects(a=100), chain=9), MODEL_URL,
+                           HYPERPARAMETERS, mode='warm')
+    assert plan.mode == 'warm'
+
+def test_manifests_are_written_next_to_the_job():
+    s3 = FakeS3()
+    current = dict(objects(a=100), **objects(c=10))
+    plan = warm_start.Plan('warm', '1 new objects', ['prefix/data/train/c.csv'], 1, MODEL_URL)
+    url = warm_start.write_manifests(s3, 'bucket', 'prefix/model/job-2', 'prefix/data/train', current, plan,
+                                     HYPERPARAMETERS)
+    assert url == 's3://bucket/prefix/model/job-2/train.manifest'
+    assert s3.puts['prefix/model/job-2/train.manifest'] == [{'prefix': 's3://bucket/prefix/data/train/'}, 'c.csv']
+    assert s3.puts['prefix/model/job-2/data_manifest.json']['objects']['prefix/data/train/a.csv'] == 'etag-a'
+
+    # The job's data manifest is what the next run loads from the live model
+    s3.manifests = {'prefix/model/job-2/data_manifest.json': s3.puts['prefix/model/job-2/data_manifest.json']}
+    loaded = warm_start.load_manifest(s3, 's3://bucket/prefix/model/job-2/output/model.tar.gz')
+    assert loaded['chain'] == 1
+    assert warm_start.load_manifest(s3, MODEL_URL) is None
+
+def test_list_objects_skips_folders():
+    s3 = FakeS3(pages=[{'Contents': [{'Key': 'p/', 'ETag': '"d"', 'Size': 0},
+                                     {'Key': 'p/a.csv', 'ETag': '"e"', 'Size': 3}]}, {}])
+    assert warm_start.list_objects(s3, 'bucket', 'p/') == {'p/a.csv': {'etag': 'e', 'size': 3}}
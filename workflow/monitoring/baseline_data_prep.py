@@ -1,33 +1,128 @@
 import boto3
-from botocore.exceptions import ClientError
+import os
+import random
 import time
 import sys
 
-bucket_name = sys.argv[1]
-prefix = sys.argv[2]
-
-start = time.time()
-print('Baseline prep started...')
-
-# Creating a copy of validation set for baseline
-
-s3 = boto3.resource('s3')
-
-bucket_key_prefix = prefix + "/data/val/"
-bucket = s3.Bucket(bucket_name)
-
-for s3_object in bucket.objects.filter(Prefix=bucket_key_prefix):
-    target_key = s3_object.key.replace('data/val/', 'monitoring/baselining/data/').replace('.part', '.csv')
-    copy_source = {
-        'Bucket': bucket_name,
-        'Key': s3_object.key
-    }
-    try:
-        obj = s3.Object(bucket_name, target_key).load()
-        print('Already Copied {0}'.format(target_key))
-    except ClientError as e:
-        print('Copying {0} to {1} ...'.format(s3_object.key, target_key))
-        s3.Bucket(bucket_name).copy(copy_source, target_key)
-        
-end = time.time()
-print('Baseline prep complete in: {}'.format(end - start))
\ No newline at end of file
+# Build a bounded size baseline dataset from the validation set.
+# The validation objects are streamed once, line by line, and a stratified
+# reservoir sample of at most BASELINE_SAMPLE_ROWS rows is written as a single
+# CSV with a header, so baselining costs the same however large the data is.
+# A reservoir over all rows keeps the class proportions, and a small
+# reservoir per Target class guarantees up to BASELINE_MIN_PER_CLASS rows of
+# every class, so rare classes still appear in the baseline statistics.
+# Memory is bounded by the sample size, not the size of the source.
+
+SAMPLE_ROWS = int(os.environ.get('BASELINE_SAMPLE_ROWS', '50000'))
+MIN_PER_CLASS = int(os.environ.get('BASELINE_MIN_PER_CLASS', '200'))
+SEED = int(os.environ.get('BASELINE_SEED', '0'))
+LABEL_COLUMN = 'Target'
+BASELINE_FILE = 'baseline.csv'
+
+class StratifiedReservoir:
+    """Uniform sample of rows with a minimum per label, in bounded memory"""
+
+    def __init__(self, size, min_per_label, rng=None):
+        self.size = size
+        self.min_per_label = min(min_per_label, size)
+        self.rng = rng or random.Random(SEED)
+        self.rows = 0
+        self.sample = [] # (row, label, line)
+        self.labels = {} # label -> [count, [(row, line)]]
+
+    def _offer(self, reservoir, capacity, seen, item):
+        # Algorithm R: keep the item with probability capacity / seen
+        if len(reservoir) < capacity:
+            reservoir.append(item)
+        else:
+            i = self.rng.randrange(seen)
+            if i < capacity:
+                reservoir[i] = item
+
+    def add(self, label, line):
+        self.rows += 1
+        self._offer(self.sample, self.size, self.rows, (self.rows, label, line))
+        stratum = self.labels.setdefault(label, [0, []])
+        stratum[0] += 1
+        self._offer(stratum[1], self.min_per_label, stratum[0], (self.rows, line))
+
+    def result(self):
+        """Return the sampled lines in source order, with the minimum per label first in priority"""
+        chosen = {}
+        for count, reservoir in self.labels.values():
+            chosen.update(reservoir)
+        # Fill the rest of the sample from the uniform reservoir, which is already in random order
+        for row, label, line in self.sample:
+            if len(chosen) >= self.size:
+                break
+            chosen.setdefault(row, line)
+        if len(chosen) > self.size:
+            # More labels than size allows a minimum for, so keep a random subset
+            chosen = dict(self.rng.sample(sorted(chosen.items()), self.size))
+        return [chosen[row] for row in sorted(chosen)]
+
+    def counts(self):
+        return {label: stratum[0] for label, stratum in self.labels.items()}
+
+def list_keys(s3, bucket, prefix):
+    return sorted(obj['Key'] for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix)
+                  for obj in page.get('Contents', []) if not obj['Key'].endswith('/'))
+
+def iter_lines(s3, bucket, key, chunk_size=1 << 20):
+    """Yield the lines of an object without reading it all into memory"""
+    body = s3.get_object(Bucket=bucket, Key=key)['Body']
+    pending = b''
+    for chunk in iter(lambda: body.read(chunk_size), b''):
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+def build(s3, bucket, keys, size=None, min_per_label=None, label_column=LABEL_COLUMN, rng=None):
+    """Return the (header, sampled lines) of the CSV objects at keys"""
+    size = SAMPLE_ROWS if size is None else size
+    min_per_label = MIN_PER_CLASS if min_per_label is None else min_per_label
+    reservoir = StratifiedReservoir(size, min_per_label, rng)
+    header = None
+    for key in keys:
+        lines = iter_lines(s3, bucket, key)
+        file_header = next(lines, b'').rstrip(b'\r')
+        if header is None:
+            header = file_header
+            label_index = header.decode('utf-8').split(',').index(label_column)
+        elif file_header != header:
+            raise ValueError('Header of {} does not match'.format(key))
+        for line in lines:
+            line = line.rstrip(b'\r')
+            if line:
+                reservoir.add(line.split(b',', label_index + 1)[label_index], line)
+    if header is None:
+        raise ValueError('No objects to sample')
+    print('sampled {} of {} rows, by {}: {}'.format(
+        min(size, reservoir.rows), reservoir.rows, label_column,
+        {k.decode('utf-8'): v for k, v in sorted(reservoir.counts().items())}))
+    return header, reservoir.result()
+
+def main(bucket_name, prefix, s3=None):
+    start = time.time()
+    print('Baseline prep started...')
+    s3 = s3 or boto3.client('s3')
+
+    # Sample the validation set for baseline
+    source_prefix = prefix + "/data/val/"
+    target_prefix = prefix + "/monitoring/baselining/data/"
+    header, lines = build(s3, bucket_name, list_keys(s3, bucket_name, source_prefix))
+    s3.put_object(Bucket=bucket_name, Key=target_prefix + BASELINE_FILE, Body=b'\n'.join([header] + lines) + b'\n')
+
+    # Remove full copies written by earlier runs, as the baseline job reads every object under the prefix
+    stale = [{'Key': key} for key in list_keys(s3, bucket_name, target_prefix) if key != target_prefix + BASELINE_FILE]
+    for i in range(0, len(stale), 1000):
+        s3.delete_objects(Bucket=bucket_name, Delete={'Objects': stale[i:i + 1000]})
+
+    end = time.time()
+    print('Baseline prep complete in: {}'.format(end - start))
+
+if __name__ == '__main__':
+    main(sys.argv[1], sys.argv[2])
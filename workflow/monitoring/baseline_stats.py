@@ -0,0 +1,330 @@
+import io
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Local baseline statistics and constraints in the DefaultModelMonitor format.
+# Computes the statistics.json and constraints.json a baselining processing
+# job would suggest, without waiting for one. Every file is split into byte
+# ranges that are parsed in chunks by a process pool. Each range builds a
+# Column per feature holding counts, streaming moments and a KLL quantile
+# sketch for numbers, or value counts for strings, and the partial Columns
+# are merged. Types are inferred as Integral, Fractional or String.
+#
+# Usage: python workflow/monitoring/baseline_stats.py <csv files...> --output <dir>
+
+KLL_K = int(os.environ.get('BASELINE_KLL_K', '2048'))
+KLL_C = 0.64
+CHUNK_ROWS = 50000
+PARTITION_BYTES = int(os.environ.get('BASELINE_PARTITION_BYTES', str(64 * 1024 ** 2)))
+HISTOGRAM_BUCKETS = 10
+MAX_DISTINCT = 1000 # String values counted before the distinct count becomes a lower bound
+MAX_DOMAIN = 20 # Suggest a domain constraint for strings with at most this many values
+
+class KLL:
+    """Mergeable KLL quantile sketch, with levels of items of weight 2 ** level"""
+
+    def __init__(self, k=None, c=KLL_C, seed=0):
+        self.k = k or KLL_K
+        self.c = c
+        self.levels = [np.empty(0)]
+        self.rng = np.random.RandomState(seed)
+
+    def capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * self.c ** depth)))
+
+    def update(self, values):
+        self.levels[0] = np.concatenate([self.levels[0], np.asarray(values, dtype=np.float64)])
+        self.compress()
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.compress()
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # Keep an odd item out, and promote every other item at a random offset
+                keep, items = items[:len(items) % 2], items[len(items) % 2:]
+                promoted = items[self.rng.randint(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def weighted(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='mergesort')
+        return items[order], weights[order]
+
+    def quantile(self, q):
+        items, weights = self.weighted()
+        if len(items) == 0:
+            return None
+        cumulative = np.cumsum(weights)
+        return float(items[np.searchsorted(cumulative, q * cumulative[-1])])
+
+    def cdf(self, values):
+        """Return the approximate fraction of items at or below each of values"""
+        items, weights = self.weighted()
+        if len(items) == 0:
+            return np.zeros(len(values))
+        cumulative = np.concatenate([[0.0], np.cumsum(weights)])
+        return cumulative[np.searchsorted(items, values, side='right')] / cumulative[-1]
+
+    def to_dict(self):
+        return {'parameters': {'c': self.c, 'k': float(self.k)}, 'data': [level.tolist() for level in self.levels]}
+
+    @classmethod
+    def from_dict(cls, sketch):
+        """Load a sketch in the statistics.json format"""
+        kll = cls(k=int(sketch['parameters']['k']), c=sketch['parameters']['c'])
+        kll.levels = [np.asarray(level, dtype=np.float64) for level in sketch['data']] or [np.empty(0)]
+        return kll
+
+    def histogram(self, low, high, buckets=HISTOGRAM_BUCKETS):
+        """Return equal width buckets between low and high, with the approximate count in each"""
+        items, weights = self.weighted()
+        edges = np.linspace(low, high, buckets + 1) if high > low else np.array([low, high])
+        counts, _ = np.histogram(items, bins=edges, weights=weights)
+        return [{'lower_bound': float(edges[i]), 'upper_bound': float(edges[i + 1]), 'count': float(counts[i])}
+                for i in range(len(counts))]
+
+class Column:
+    """Mergeable statistics for one feature"""
+
+    def __init__(self, name, k=None):
+        self.name = name
+        self.present = 0
+        self.missing = 0
+        self.numeric = 0
+        self.integral = True
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = KLL(k)
+        self.values = {} # Non numeric values and their counts
+        self.distinct_overflow = False
+
+    def update(self, raw):
+        """Add a chunk of raw string values, where NaN and non finite numbers are missing"""
+        numbers = pd.to_numeric(raw, errors='coerce').to_numpy(dtype=np.float64)
+        # Infinity, as in the CSE-CIC-IDS2018 flow rates, would break the moments and the JSON output
+        present = raw.notna().to_numpy() & ~np.isinf(numbers)
+        self.present += int(present.sum())
+        self.missing += int(len(raw) - present.sum())
+        ok = np.isfinite(numbers)
+        values = numbers[ok]
+        strings = raw[present & ~ok]
+        if len(values):
+            self._update_moments(len(values), float(values.mean()), float(((values - values.mean()) ** 2).sum()))
+            self.total += float(values.sum())
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+            self.integral = self.integral and bool(np.all(np.mod(values, 1) == 0))
+            self.sketch.update(values)
+        if len(strings):
+            self._update_values(strings.value_counts().items())
+
+    def _update_moments(self, n, mean, m2):
+        # Chan et al. parallel combination of mean and sum of squared deviations
+        total = self.numeric + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.numeric * n / total
+        self.numeric = total
+
+    def _update_values(self, counts):
+        for value, count in counts:
+            if value in self.values or len(self.values) < MAX_DISTINCT:
+                self.values[value] = self.values.get(value, 0) + int(count)
+            else:
+                self.distinct_overflow = True
+
+    def merge(self, other):
+        self.present += other.present
+        self.missing += other.missing
+        if other.numeric:
+            self._update_moments(other.numeric, other.mean, other.m2)
+            self.total += other.total
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self.integral = self.integral and other.integral
+            self.sketch.merge(other.sketch)
+        self._update_values(other.values.items())
+        self.distinct_overflow = self.distinct_overflow or other.distinct_overflow
+
+    def to_dict(self):
+        state = {k: v for k, v in self.__dict__.items() if k not in ('sketch', 'values', 'min', 'max')}
+        # Infinite bounds of a column without numbers are not valid JSON
+        state.update(min=self.min if self.numeric else None, max=self.max if self.numeric else None,
+                     sketch=self.sketch.to_dict(), values=sorted(self.values.items()))
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        column = cls(state['name'])
+        column.__dict__.update({k: v for k, v in state.items() if k not in ('sketch', 'values', 'min', 'max')})
+        if state['numeric']:
+            column.min, column.max = state['min'], state['max']
+        column.sketch = KLL.from_dict(state['sketch'])
+        column.values = dict((value, count) for value, count in state['values'])
+        return column
+
+    def inferred_type(self):
+        if self.values or not self.numeric:
+            return 'String'
+        return 'Integral' if self.integral else 'Fractional'
+
+    def statistics(self):
+        common = {'num_present': self.present, 'num_missing': self.missing}
+        feature = {'name': self.name, 'inferred_type': self.inferred_type()}
+        if feature['inferred_type'] == 'String':
+            buckets = [{'value': str(v), 'count': c} for v, c in sorted(self.values.items(), key=lambda i: -i[1])]
+            feature['string_statistics'] = {
+                'common': common,
+                'distinct_count': float(len(self.values)),
+                'distribution': {'categorical': {'buckets': buckets}},
+            }
+            return feature
+        feature['numerical_statistics'] = {
+            'common': common,
+            'mean': self.mean,
+            'sum': self.total,
+            'std_dev': math.sqrt(self.m2 / self.numeric),
+            'min': self.min,
+            'max': self.max,
+            'distribution': {'kll': {
+                'buckets': self.sketch.histogram(self.min, self.max),
+                'sketch': self.sketch.to_dict(),
+            }},
+        }
+        return feature
+
+    def constraints(self):
+        rows = self.present + self.missing
+        feature = {
+            'name': self.name,
+            'inferred_type': self.inferred_type(),
+            'completeness': self.present / float(rows) if rows else 1.0,
+        }
+        if feature['inferred_type'] != 'String':
+            feature['num_constraints'] = {'is_non_negative': self.min >= 0}
+        elif not self.distinct_overflow and len(self.values) <= MAX_DOMAIN:
+            feature['string_constraints'] = {'domains': sorted(str(v) for v in self.values)}
+        return feature
+
+def partitions(path, size=None):
+    """Split a file into (path, start, end) byte ranges"""
+    size = size or PARTITION_BYTES
+    length = os.path.getsize(path)
+    return [(path, start, min(start + size, length)) for start in range(0, max(length, 1), size)]
+
+def read_header(path):
+    with open(path) as f:
+        return f.readline().rstrip('\r\n').split(',')
+
+def _read_range(path, start, end):
+    """Return the lines that start in [start, end), skipping the header"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        if start == 0:
+            f.readline() # Header
+        else:
+            f.seek(start - 1)
+            f.readline() # The line in progress belongs to the previous range
+        data = f.read(max(end - f.tell(), 0))
+        if data and not data.endswith(b'\n'):
+            data += f.readline() # Finish the last line that starts in this range
+    return data
+
+def compute_partition(path, start, end, columns):
+    columns_stats = [Column(name) for name in columns]
+    data = _read_range(path, start, end)
+    if data.strip():
+        reader = pd.read_csv(io.BytesIO(data), header=None, names=columns, dtype=str, chunksize=CHUNK_ROWS,
+                             keep_default_na=False, na_values=[''])
+        for chunk in reader:
+            for stats, name in zip(columns_stats, columns):
+                stats.update(chunk[name])
+    return columns_stats
+
+def compute(paths, workers=None, partition_bytes=None):
+    """Return the merged Columns and row count of the CSV files at paths, which share a header"""
+    columns = read_header(paths[0])
+    for path in paths[1:]:
+        if read_header(path) != columns:
+            raise ValueError('Header of {} does not match'.format(path))
+    ranges = [r for path in paths for r in partitions(path, partition_bytes)]
+    merged = [Column(name) for name in columns]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for result in executor.map(compute_partition, *zip(*ranges), [columns] * len(ranges)):
+            for total, part in zip(merged, result):
+                total.merge(part)
+    rows = merged[0].present + merged[0].missing if merged else 0
+    return merged, rows
+
+def statistics(columns, rows):
+    return {
+        'version': 0.0,
+        'dataset': {'item_count': rows},
+        'features': [c.statistics() for c in columns],
+    }
+
+def constraints(columns):
+    return {
+        'version': 0.0,
+        'features': [c.constraints() for c in columns],
+        'monitoring_config': {
+            'evaluate_constraints': 'Enabled',
+            'emit_metrics': 'Enabled',
+            'datatype_check_threshold': 1.0,
+            'domain_content_threshold': 1.0,
+            'distribution_constraints': {
+                'perform_comparison': 'Enabled',
+                'comparison_threshold': 0.1,
+                'comparison_method': 'Robust',
+            },
+        },
+    }
+
+def write(columns, rows, output_dir):
+    """Write statistics.json and constraints.json to output_dir, returning their paths"""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, document in (('statistics.json', statistics(columns, rows)), ('constraints.json', constraints(columns))):
+        paths.append(os.path.join(output_dir, name))
+        with open(paths[-1], 'w') as f:
+            json.dump(document, f, indent=2)
+    return paths
+
+def main():
+    import argparse
+    import time
+    parser = argparse.ArgumentParser()
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--output', default='.')
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+    start = time.time()
+    columns, rows = compute(args.paths, args.workers)
+    print('\n'.join(write(columns, rows, args.output)))
+    print('Baseline statistics for {} rows in: {:.3f}s'.format(rows, time.time() - start))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+import argparse
+import datetime
+import json
+import os
+import time
+
+import boto3
+import numpy as np
+import pandas as pd
+from botocore.exceptions import ClientError
+
+try:
+    from . import baseline_stats
+    from ..schedule import preprocessor
+except ImportError:  # drift.py runs as a top level script, with workflow/schedule on the PYTHONPATH
+    import baseline_stats
+    import preprocessor
+
+# Incremental drift detection over endpoint data capture.
+# The hourly monitoring schedule reads all of the last hour's capture on every
+# run. Instead each run here lists only the capture objects after those already
+# processed, parses their CSV and libsvm records as one batch with the schedule's
+# preprocessor (the regression function sends libsvm by default) and adds them to
+# the per feature Columns of baseline_stats.py (moments, KLL sketches and value
+# counts). Columns are kept per window of DRIFT_WINDOW_SECONDS of inference time
+# in a state object, so a run costs in proportion to the new records only.
+# Window sketches use a smaller k (DRIFT_KLL_K) than the baseline, as the state
+# is rewritten every run and the drift distance only needs about 1% rank error.
+# The last DRIFT_WINDOWS windows are merged and compared with the baseline
+# statistics and constraints, writing constraint_violations.json in the
+# DefaultModelMonitor format and the drift distance per feature to CloudWatch.
+# The pipeline's DriftProject runs it on a schedule against the live endpoint,
+# see drift_buildspec.yaml.
+#
+# Usage: python workflow/monitoring/drift.py <bucket> <prefix> <endpoint name> [--interval seconds]
+
+WINDOW_SECONDS = int(os.environ.get('DRIFT_WINDOW_SECONDS', '300'))
+DRIFT_WINDOWS = int(os.environ.get('DRIFT_WINDOWS', '12')) # Windows merged for comparison, ie. the last hour
+KLL_K = int(os.environ.get('DRIFT_KLL_K', '200'))
+CAPTURE_PREFIX = os.environ.get('DATA_CAPTURE_PREFIX', '{prefix}/datacapture')
+LOOKBACK_HOURS = 2 # Capture objects can land late, so hours are listed again until this old
+LABEL_COLUMN = 'Target'
+CSV = 'text/csv'
+LIBSVM = 'text/libsvm'
+NAMESPACE = 'SamSageMaker/Drift'
+
+def capture_prefix(prefix, endpoint_name, variant):
+    # Keys sort by inference time within a variant: <variant>/yyyy/mm/dd/hh/<mm-ss-ms>-<id>.jsonl
+    return '{}/{}/{}/'.format(CAPTURE_PREFIX.format(prefix=prefix), endpoint_name, variant)
+
+def load_json(s3, bucket, key, default=None):
+    try:
+        return json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+    except ClientError as e:
+        if default is None or e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+            raise
+        return default
+
+def new_keys(s3, bucket, prefix, state):
+    """Return the capture keys after state's listing position that have not been processed"""
+    processed = set(state['processed'])
+    keys = []
+    kwargs = {'Bucket': bucket, 'Prefix': prefix}
+    if state['start_after']:
+        kwargs['StartAfter'] = state['start_after']
+    for page in s3.get_paginator('list_objects_v2').paginate(**kwargs):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []) if obj['Key'] not in processed)
+    return keys
+
+def advance(state, prefix, keys):
+    """Record keys as processed, and forget those older than the lookback from the newest"""
+    processed = sorted(set(state['processed']) | set(keys))
+    if not processed:
+        return
+    try:
+        newest = datetime.datetime.strptime(processed[-1][len(prefix):len(prefix) + 13], '%Y/%m/%d/%H')
+    except ValueError:
+        state['processed'] = processed # Not a capture key layout, so keep every key
+        return
+    cutoff = prefix + (newest - datetime.timedelta(hours=LOOKBACK_HOURS)).strftime('%Y/%m/%d/%H')
+    state['start_after'] = max(state['start_after'] or '', cutoff)
+    state['processed'] = [key for key in processed if key > cutoff]
+
+def parse_records(lines, inputs):
+    """Return a frame of the input features, label and window of CSV and libsvm capture records, and a skipped count"""
+    records, times, skipped = [], [], 0
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        content_type = record['captureData'].get('endpointInput', {}).get('observedContentType', '')
+        if not content_type.startswith((CSV, LIBSVM)):
+            skipped += 1 # Only the feature formats the baseline can be compared with
+            continue
+        records.append(record)
+        times.append(record['eventMetadata']['inferenceTime'])
+    if not records:
+        return pd.DataFrame(columns=list(inputs) + [LABEL_COLUMN, 'window']), skipped
+    batch = preprocessor.preprocess_batch(records, inputs)
+    frame = pd.DataFrame(batch.values[:, :len(inputs)], columns=list(inputs))
+    # A multi row request gets one prediction per row, the first prediction column is the label
+    frame[LABEL_COLUMN] = batch.values[:, len(inputs)] if batch.values.shape[1] > len(inputs) else np.nan
+    elapsed = pd.to_datetime(pd.Series(np.array(times)[batch.record]), utc=True) - pd.Timestamp(0, tz='UTC')
+    seconds = (elapsed // pd.Timedelta(seconds=1)).values
+    frame['window'] = seconds // WINDOW_SECONDS * WINDOW_SECONDS
+    return frame, skipped
+
+def update_windows(windows, frame, names):
+    """Add the frame's rows to the Columns of each of their windows in state"""
+    for window, rows in frame.groupby('window'):
+        key = str(int(window))
+        columns = [baseline_stats.Column.from_dict(c) for c in windows[key]] if key in windows else \
+            [baseline_stats.Column(name, KLL_K) for name in names]
+        for column in columns:
+            column.update(rows[column.name])
+        windows[key] = [c.to_dict() for c in columns]
+
+def recent(windows, names, count=None):
+    """Drop windows older than the last count, returning the merged Columns of the rest"""
+    count = count or DRIFT_WINDOWS
+    keep = sorted(windows, key=int)[-count:]
+    for key in list(windows):
+        if key not in keep:
+            del windows[key]
+    merged = [baseline_stats.Column(name, KLL_K) for name in names]
+    for key in keep:
+        for total, state in zip(merged, windows[key]):
+            total.merge(baseline_stats.Column.from_dict(state))
+    return merged
+
+def distance(column, baseline):
+    """Return the maximum difference between the column and baseline feature distributions"""
+    if 'numerical_statistics' in baseline:
+        sketch = baseline['numerical_statistics']['distribution']['kll']['sketch']
+        reference = baseline_stats.KLL.from_dict(sketch)
+        points = np.concatenate([reference.weighted()[0], column.sketch.weighted()[0]])
+        if not column.numeric or not len(points):
+            return None
+        return float(np.max(np.abs(reference.cdf(points) - column.sketch.cdf(points))))
+    buckets = baseline['string_statistics']['distribution']['categorical']['buckets']
+    expected = {b['value']: b['count'] for b in buckets}
+    observed = {str(v): c for v, c in column.values.items()}
+    if not observed or not expected:
+        return None
+    totals = sum(expected.values()), sum(observed.values())
+    return max(abs(expected.get(v, 0) / totals[0] - observed.get(v, 0) / totals[1])
+               for v in set(expected) | set(observed))
+
+def violations(columns, statistics, constraints):
+    """Return the DefaultModelMonitor constraint violations of columns, and the drift distance per feature"""
+    config = constraints.get('monitoring_config', {})
+    comparison = config.get('distribution_constraints', {})
+    baselines = {f['name']: f for f in statistics['features']}
+    found, distances = [], {}
+
+    def violation(name, check, description):
+        found.append({'feature_name': name, 'constraint_check_type': check, 'description': description})
+
+    for column, constraint in zip(columns, constraints['features']):
+        name = column.name
+        if not column.present + column.missing:
+            continue
+        if constraint['inferred_type'] != 'String':
+            conforming = column.numeric / float(column.present) if column.present else 1.0
+            if constraint['inferred_type'] == 'Integral' and not column.integral:
+                conforming = 0.0
+            if conforming < config.get('datatype_check_threshold', 1.0):
+                violation(name, 'data_type_check', 'Data type match requirement is not met. Expected data type: '
+                          '{}, Expected match: {}%. Observed: Only {}% of data is {}.'.format(
+                              constraint['inferred_type'], config.get('datatype_check_threshold', 1.0) * 100,
+                              round(conforming * 100, 2), constraint['inferred_type']))
+        completeness = column.present / float(column.present + column.missing)
+        if completeness < constraint.get('completeness', 0.0):
+            violation(name, 'completeness_check', 'Data completeness is {}, less than the baseline {}'.format(
+                round(completeness, 4), constraint['completeness']))
+        domains = constraint.get('string_constraints', {}).get('domains')
+        if domains and column.values:
+            known = sum(c for v, c in column.values.items() if str(v) in domains) / float(sum(column.values.values()))
+            if known < config.get('domain_content_threshold', 1.0):
+                violation(name, 'categorical_values_check',
+                          'Only {}% of values are in the baseline domain'.format(round(known * 100, 2)))
+        if comparison.get('perform_comparison', 'Enabled') == 'Enabled' and name in baselines:
+            distances[name] = distance(column, baselines[name])
+            threshold = comparison.get('comparison_threshold', 0.1)
+            if distances[name] is not None and distances[name] > threshold:
+                violation(name, 'baseline_drift_check', 'Baseline drift distance: {} exceeds threshold: {}'.format(
+                    round(distances[name], 4), threshold))
+    return found, distances
+
+def publish(cloudwatch, endpoint_name, distances, timestamp):
+    metrics = [{
+        'MetricName': 'feature_baseline_drift_{}'.format(name),
+        'Dimensions': [{'Name': 'Endpoint', 'Value': endpoint_name}],
+        'Timestamp': timestamp,
+        'Value': value,
+    } for name, value in sorted(distances.items()) if value is not None]
+    for i in range(0, len(metrics), 20):
+        cloudwatch.put_metric_data(Namespace=NAMESPACE, MetricData=metrics[i:i + 20])
+
+def run(s3, bucket_name, prefix, endpoint_name, variant='AllTraffic', cloudwatch=None):
+    """Process the capture objects that are new since the last run, returning its report"""
+    start = time.time()
+    results_prefix = '{}/monitoring/baselining/results/'.format(prefix)
+    drift_prefix = '{}/monitoring/drift/'.format(prefix)
+    statistics = load_json(s3, bucket_name, results_prefix + 'statistics.json')
+    constraints = load_json(s3, bucket_name, results_prefix + 'constraints.json')
+    names = [f['name'] for f in constraints['features']]
+    inputs = [name for name in names if name != LABEL_COLUMN]
+
+    state_key = '{}{}/{}/state.json'.format(drift_prefix, endpoint_name, variant)
+    state = load_json(s3, bucket_name, state_key, {'start_after': None, 'processed': [], 'windows': {}})
+    source = capture_prefix(prefix, endpoint_name, variant)
+    keys = new_keys(s3, bucket_name, source, state)
+    lines = []
+    for key in keys:
+        lines.extend(s3.get_object(Bucket=bucket_name, Key=key)['Body'].read().decode('utf-8').splitlines())
+    frame, skipped = parse_records(lines, inputs)
+    update_windows(state['windows'], frame, names)
+    advance(state, source, keys)
+    columns = recent(state['windows'], names)
+    found, distances = violations(columns, statistics, constraints)
+
+    report = {
+        'objects': len(keys),
+        'records': len(frame),
+        'skipped': skipped,
+        'rows': columns[0].present + columns[0].missing if columns else 0,
+        'windows': sorted(state['windows'], key=int),
+        'seconds': round(time.time() - start, 3),
+    }
+    s3.put_object(Bucket=bucket_name, Key=state_key, Body=json.dumps(state))
+    if state['windows']:
+        window = datetime.datetime.fromtimestamp(int(report['windows'][-1]), datetime.timezone.utc)
+        key = '{}{}/{}/reports/{}/constraint_violations.json'.format(
+            drift_prefix, endpoint_name, variant, window.strftime('%Y/%m/%d/%H/%M'))
+        s3.put_object(Bucket=bucket_name, Key=key, Body=json.dumps({'violations': found}, indent=2))
+        if cloudwatch:
+            publish(cloudwatch, endpoint_name, distances, window)
+    print('drift', json.dumps(report), 'violations: {}'.format(len(found)))
+    for v in found:
+        print('{feature_name} {constraint_check_type}: {description}'.format(**v))
+    return report, found
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('bucket_name')
+    parser.add_argument('prefix')
+    parser.add_argument('endpoint_name')
+    parser.add_argument('--variant', default='AllTraffic')
+    parser.add_argument('--interval', type=int, help='seconds between runs, or run once')
+    args = parser.parse_args()
+    s3, cloudwatch = boto3.client('s3'), boto3.client('cloudwatch')
+    while True:
+        run(s3, args.bucket_name, args.prefix, args.endpoint_name, args.variant, cloudwatch)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+if __name__ == '__main__':
+    main()
@@ -9,8 +9,9 @@ from botocore.exceptions import ClientError
 
 import sagemaker
 from sagemaker.utils import name_from_base
-from sagemaker.model_monitor import DefaultModelMonitor
-from sagemaker.model_monitor.dataset_format import DatasetFormat
+
+# Compute the baseline locally with baseline_stats.py, or with a processing job
+BASELINE_ENGINE = os.environ.get('BASELINE_ENGINE', 'local')
 
 ## Arguments ##
 
@@ -35,22 +36,45 @@ baseline_results_path = 's3://{0}/{1}/monitoring/baselining/results'.format(buck
 print(baseline_data_path)
 print(baseline_results_path)
 
-my_default_monitor = DefaultModelMonitor(
-    role=execution_role,
-    instance_count=1,
-    instance_type='ml.c5.4xlarge',
-    volume_size_in_gb=20,
-    max_runtime_in_seconds=3600,
-)
-
-my_default_monitor.suggest_baseline(
-    job_name=job_name, 
-    baseline_dataset=baseline_data_path,
-    dataset_format=DatasetFormat.csv(header=True),
-    output_s3_uri=baseline_results_path,
-    logs=False, # Disable to avoid noisy logging, only meaningful when wait=True
-    wait=True
-)
+if BASELINE_ENGINE == 'local':
+    # Write the same statistics.json and constraints.json without waiting for a processing job
+    import tempfile
+    import baseline_stats
+
+    s3 = boto3.client('s3')
+    data_prefix = '{}/monitoring/baselining/data/'.format(prefix)
+    results_prefix = '{}/monitoring/baselining/results/'.format(prefix)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket_name, Prefix=data_prefix):
+            for obj in page.get('Contents', []):
+                if not obj['Key'].endswith('/'):
+                    paths.append(os.path.join(tmp, str(len(paths))))
+                    s3.download_file(bucket_name, obj['Key'], paths[-1])
+        columns, rows = baseline_stats.compute(paths)
+        for path in baseline_stats.write(columns, rows, os.path.join(tmp, 'results')):
+            s3.upload_file(path, bucket_name, results_prefix + os.path.basename(path))
+    print('Baseline statistics for {} rows written to: {}'.format(rows, baseline_results_path))
+else:
+    from sagemaker.model_monitor import DefaultModelMonitor
+    from sagemaker.model_monitor.dataset_format import DatasetFormat
+
+    my_default_monitor = DefaultModelMonitor(
+        role=execution_role,
+        instance_count=1,
+        instance_type='ml.m5.xlarge', # The baseline is a bounded sample, see baseline_data_prep.py
+        volume_size_in_gb=20,
+        max_runtime_in_seconds=3600,
+    )
+
+    my_default_monitor.suggest_baseline(
+        job_name=job_name,
+        baseline_dataset=baseline_data_path,
+        dataset_format=DatasetFormat.csv(header=True),
+        output_s3_uri=baseline_results_path,
+        logs=False, # Disable to avoid noisy logging, only meaningful when wait=True
+        wait=True
+    )
 
 # save environment variables
 
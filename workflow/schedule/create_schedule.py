@@ -4,8 +4,7 @@ import time
 import json
 import os
 import sagemaker
-from sagemaker.processing import ProcessingJob
-from sagemaker.model_monitor import DefaultModelMonitor, BaseliningJob, CronExpressionGenerator
+from sagemaker.model_monitor import DefaultModelMonitor, CronExpressionGenerator
 
 # Load arguments
 
@@ -18,26 +17,25 @@ endpoint_name = sys.argv[5]
 # Upload pre-processor scripts
 
 start = time.time()
-print('Loading monitor baseline for job: {}'.format(processing_job_name))
+print('Loading monitor baseline for: {}'.format(processing_job_name))
 
 code_prefix = '{}/code'.format(prefix)
 s3_code_preprocessor_uri = 's3://{}/{}/{}'.format(bucket_name, code_prefix, 'preprocessor.py')
 s3_code_postprocessor_uri = 's3://{}/{}/{}'.format(bucket_name, code_prefix, 'postprocessor.py')
 reports_prefix = '{}/reports'.format(prefix)
 s3_report_path = 's3://{}/{}'.format(bucket_name, reports_prefix)
+# Written by suggest_baseline.py, either locally or by the baselining job
+baseline_results_path = 's3://{0}/{1}/monitoring/baselining/results'.format(bucket_name, prefix)
 
 print("Report path: {}".format(s3_report_path))
 print("Preproc Code path: {}".format(s3_code_preprocessor_uri))
 print("Postproc Code path: {}".format(s3_code_postprocessor_uri))
 
-# Load the processing job
-
-processing_job = ProcessingJob.from_processing_name(
-    processing_job_name=processing_job_name,
-    sagemaker_session=sagemaker.Session())
-
-from sagemaker.model_monitor import BaseliningJob
-baseline_job = BaseliningJob.from_processing_job(processing_job)
+# Name the preprocessor's columns after the baseline features, with the prediction as the label
+label_column = 'Target'
+constraints = json.loads(boto3.client('s3').get_object(
+    Bucket=bucket_name, Key='{}/monitoring/baselining/results/constraints.json'.format(prefix))['Body'].read())
+feature_columns = [f['name'] for f in constraints['features'] if f['name'] != label_column]
 
 my_default_monitor = DefaultModelMonitor(
     role=execution_role,
@@ -45,6 +43,10 @@ my_default_monitor = DefaultModelMonitor(
     instance_type='ml.m5.xlarge',
     volume_size_in_gb=20,
     max_runtime_in_seconds=3600,
+    env={
+        'FEATURE_COLUMNS': ','.join(feature_columns),
+        'PREDICTION_COLUMNS': label_column,
+    },
 )
 
 print('Starting monitor schedule for endpoint: {}'.format(endpoint_name))
@@ -58,11 +60,11 @@ s3.Bucket(bucket_name).Object(code_prefix+"/postprocessor.py").upload_file('work
 my_default_monitor.create_monitoring_schedule(
     monitor_schedule_name=processing_job_name,
     endpoint_input=endpoint_name,
-    #record_preprocessor_script=pre_processor_script,
+    record_preprocessor_script=s3_code_preprocessor_uri,
     post_analytics_processor_script=s3_code_postprocessor_uri,
     output_s3_uri=s3_report_path,
-    statistics=baseline_job.baseline_statistics(),
-    constraints=baseline_job.suggested_constraints(),
+    statistics='{}/statistics.json'.format(baseline_results_path),
+    constraints='{}/constraints.json'.format(baseline_results_path),
     schedule_cron_expression=CronExpressionGenerator.hourly(),
     enable_cloudwatch_metrics=True
 )
@@ -1,19 +1,183 @@
+import base64
 import json
-import random
+import os
+import warnings
+from collections import namedtuple
 
-# sample preprocess_handler (to be implemented by customer)
-# This is a trivial example, where we simply generate random values
-# But customers can read the data from inference_record and trasnform it into 
-# a flattened json structure
-def preprocess_handler(inference_record):
-    event_data = inference_record.event_data
-    input_data = {}
-    output_data = {}
+import numpy as np
+
+# Record preprocessor for the monitoring schedule.
+# Flattens each captured request and response into columns: the libsvm or CSV
+# input into feature columns and the JSON (or CSV) prediction output into
+# prediction columns, so they can be compared with the baseline. The column
+# names are built once from FEATURE_COLUMNS and PREDICTION_COLUMNS, which
+# create_schedule.py sets to the baseline's header, or default to feature0..
+# and prediction0.. . preprocess_handler is called by the monitoring job for one
+# inference record, and preprocess_batch parses many captured records at once:
+# every input line is tokenized in one pass with numpy and every output is
+# decoded with one json.loads, rather than a dict per record.
+
+LIBSVM = 'text/libsvm'
+CSV = 'text/csv'
+FEATURE_COUNT = int(os.environ.get('FEATURE_COUNT', '79'))
+FEATURE_COLUMNS = [c for c in os.environ.get('FEATURE_COLUMNS', '').split(',') if c] or \
+    ['feature{}'.format(i) for i in range(FEATURE_COUNT)]
+PREDICTION_COLUMNS = [c for c in os.environ.get('PREDICTION_COLUMNS', '').split(',') if c]
+
+# Row separator token, never produced by str.split()
+_SENTINEL = '\x00'
+
+Batch = namedtuple('Batch', ['columns', 'values', 'record'])
+
+def prediction_columns(count):
+    names = PREDICTION_COLUMNS[:count]
+    return names + ['prediction{}'.format(i) for i in range(len(names), count)]
+
+def _field(data, *names):
+    for name in names:
+        value = data.get(name) if isinstance(data, dict) else getattr(data, name, None)
+        if value is not None:
+            return value
+    return None
+
+def _capture(record):
+    """Return the (content type, text) of a record's input and output"""
+    if _field(record, 'endpointInput', 'endpoint_input') is None:
+        record = _field(record, 'captureData', 'event_data') or {}
+    parts = []
+    for names in (('endpointInput', 'endpoint_input'), ('endpointOutput', 'endpoint_output')):
+        data = _field(record, *names) or {}
+        text = _field(data, 'data') or ''
+        if _field(data, 'encoding') == 'BASE64':
+            text = base64.b64decode(text).decode('utf-8')
+        parts.append((_field(data, 'observedContentType', 'observed_content_type') or '', text.strip()))
+    return parts
+
+def _to_float(tokens):
+    """Convert strings to floats in one call, with NaN for values that are empty or not numbers"""
+    tokens = np.where(tokens == '', 'nan', tokens).tolist()
+    values = None
+    if tokens:
+        # Parse every value in one C call, falling back when any value is malformed
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            try:
+                values = np.fromstring(' '.join(tokens), sep=' ')
+            except ValueError:
+                pass
+    if values is None or len(values) != len(tokens):
+        values = np.array([_safe_float(t) for t in tokens], dtype=np.float64)
+    return values
 
-    input_data['feature0'] = random.randint(1, 3)
-    input_data['feature1'] = random.uniform(0, 1.6)
-    input_data['feature2'] = random.uniform(0, 1.6)
+def _safe_float(token):
+    try:
+        return float(token)
+    except ValueError:
+        return np.nan
 
-    output_data['prediction0'] = random.uniform(1, 30)
-    
-    return {**input_data, **output_data}
\ No newline at end of file
+def parse_csv(lines, n_features):
+    """Parse CSV lines into a (rows, n_features) array, with NaN for missing features"""
+    features = np.full((len(lines), n_features), np.nan)
+    if not lines:
+        return features
+    widths = np.char.count(np.array(lines, dtype=str), ',') + 1
+    tokens = np.array(','.join(lines).split(','))
+    row_ids = np.repeat(np.arange(len(lines)), widths)
+    cols = np.arange(len(tokens)) - np.repeat(np.cumsum(widths) - widths, widths)
+    keep = cols < n_features # Extra columns are dropped
+    features[row_ids[keep], cols[keep]] = _to_float(tokens[keep])
+    return features
+
+def parse_libsvm(lines, n_features):
+    """Parse libsvm lines, with 0 based feature indexes as read by XGBoost and an optional leading label"""
+    features = np.full((len(lines), n_features), np.nan)
+    if not lines:
+        return features
+    # Tokenize every row at once, marking row boundaries with a sentinel
+    tokens = np.array((' ' + _SENTINEL + ' ').join(lines).split() + [_SENTINEL])
+    boundary = tokens == _SENTINEL
+    if tokens[~boundary].size == 0:
+        return features # Only empty lines, eg. a request without a body
+    row_ids = np.cumsum(boundary)[~boundary]
+    parts = np.char.partition(tokens[~boundary], ':')
+    has_index = parts[:, 1] == ':'
+    indexes = _to_float(parts[has_index, 0])
+    values = _to_float(parts[has_index, 2])
+    keep = (indexes >= 0) & (indexes < n_features) & (indexes == np.floor(indexes))
+    features[row_ids[has_index][keep], indexes[keep].astype(np.int64)] = values[keep]
+    return features
+
+def _flatten(value):
+    if isinstance(value, dict):
+        # Built in algorithm output, eg. {"predicted_label": 1, "probabilities": [...]}, or {"score": 0.5}
+        return [x for v in value.values() for x in _flatten(v)]
+    if isinstance(value, (list, tuple)):
+        return [x for v in value for x in _flatten(v)]
+    return [_safe_float(value) if isinstance(value, str) else float(value)]
+
+def _prediction_rows(value, rows):
+    """Split a decoded output into one list of predictions per input row"""
+    if isinstance(value, dict) and 'predictions' in value:
+        value = value['predictions']
+    if isinstance(value, str):
+        lines = value.splitlines()
+        value = [line.split(',') for line in lines] if len(lines) == rows else value.split(',')
+    if isinstance(value, list) and len(value) == rows and rows > 1:
+        return [_flatten(v) for v in value]
+    if rows == 1:
+        return [_flatten(value)]
+    return [[] for _ in range(rows)] # Can't be matched to the input rows
+
+def parse_outputs(texts, rows):
+    """Parse output texts, each with rows[i] input rows, into a (sum(rows), predictions) array"""
+    try:
+        # One call for the common case of JSON or single value outputs
+        values = json.loads('[' + ','.join(texts) + ']') if all(texts) else None
+    except ValueError:
+        values = None
+    if values is None or len(values) != len(texts):
+        values = []
+        for text in texts:
+            try:
+                values.append(json.loads(text))
+            except ValueError:
+                values.append(text) # CSV
+    predictions = [p for value, n in zip(values, rows) for p in _prediction_rows(value, n)]
+    width = max([len(p) for p in predictions] or [0])
+    result = np.full((len(predictions), width), np.nan)
+    for i, p in enumerate(predictions):
+        result[i, :len(p)] = p
+    return result
+
+def preprocess_batch(records, feature_columns=None):
+    """Flatten captured records into feature and prediction columns
+
+    Records are capture dicts, as in the data capture JSONL, or inference
+    records. Returns a Batch of the column names, a (rows, columns) array with
+    NaN for missing values, and the index of the record each row came from.
+    """
+    feature_columns = feature_columns or FEATURE_COLUMNS
+    n_features = len(feature_columns)
+    inputs, outputs, rows = [], [], []
+    for record in records:
+        (content_type, text), (_, output) = _capture(record)
+        lines = text.splitlines() or ['']
+        inputs.append((content_type, lines))
+        outputs.append(output)
+        rows.append(len(lines))
+    record = np.repeat(np.arange(len(records)), rows)
+    features = np.full((len(record), n_features), np.nan)
+    for content_type, parse in ((CSV, parse_csv), (LIBSVM, parse_libsvm)):
+        selected = [content_type in c for c, _ in inputs]
+        lines = [line for (c, record_lines), s in zip(inputs, selected) if s for line in record_lines]
+        features[np.repeat(selected, rows)] = parse(lines, n_features)
+    predictions = parse_outputs(outputs, rows)
+    columns = list(feature_columns) + prediction_columns(predictions.shape[1])
+    return Batch(columns, np.hstack([features, predictions]), record)
+
+def preprocess_handler(inference_record):
+    """Return the flattened record, or a list of them for a multi row request, without missing values"""
+    batch = preprocess_batch([inference_record])
+    flat = [{c: v for c, v, missing in zip(batch.columns, row.tolist(), np.isnan(row)) if not missing}
+            for row in batch.values]
+    return flat[0] if len(flat) == 1 else flat
@@ -0,0 +1,98 @@
+import os
+import time
+
+import xgboost
+
+# Debugger capture that stays within an overhead budget.
+# Saving every tensor on every round makes the smdebug hook a large share of
+# training time on big datasets, mostly to compute and write predictions and
+# labels. BudgetedHook only invokes the hook on the rounds CapturePolicy
+# samples, and only sets the hook's data on "full" captures, as smdebug only
+# computes predictions, labels and feature importance when it has the data.
+# The policy measures round and capture time as training runs: when capture
+# exceeds budget_pct of training time it first makes full captures rarer, then
+# widens the capture interval, and it narrows them again while well under.
+# Required steps, such as those a debugger rule evaluates, are always captured in full.
+
+OVERHEAD_PCT = float(os.environ.get('DEBUG_OVERHEAD_PCT', '5'))
+MAX_INTERVAL = int(os.environ.get('DEBUG_MAX_INTERVAL', '64'))
+
+class CapturePolicy:
+    """Decide which rounds to capture, and which captures include the expensive tensors"""
+
+    def __init__(self, budget_pct=None, max_interval=None, required_steps=()):
+        self.budget_pct = OVERHEAD_PCT if budget_pct is None else budget_pct
+        self.max_interval = max_interval or MAX_INTERVAL
+        self.required_steps = set(required_steps)
+        self.interval = 1
+        self.full_every = 1
+        self.captures = 0
+        self.last_step = None
+        self.train_seconds = 0.0
+        self.capture_seconds = 0.0
+
+    def capture(self, step):
+        """Return None to skip step, otherwise whether to capture it in full"""
+        if step in self.required_steps:
+            return True
+        if self.last_step is not None and step - self.last_step < self.interval:
+            return None
+        return self.captures % self.full_every == 0
+
+    def overhead_pct(self):
+        return 100.0 * self.capture_seconds / max(self.train_seconds, 1e-9)
+
+    def record(self, step, train_seconds, capture_seconds=None, full=False):
+        """Record the time of a round, and of its capture if there was one"""
+        self.train_seconds += train_seconds
+        if capture_seconds is None:
+            return
+        self.captures += 1
+        self.last_step = step
+        self.capture_seconds += capture_seconds
+        overhead = self.overhead_pct()
+        if overhead > self.budget_pct:
+            # Drop the expensive tensors before dropping rounds
+            if full and self.full_every < self.max_interval:
+                self.full_every *= 2
+            else:
+                self.interval = min(self.interval * 2, self.max_interval)
+        elif overhead < self.budget_pct / 2:
+            if self.interval > 1:
+                self.interval //= 2
+            elif self.full_every > 1:
+                self.full_every //= 2
+
+class BudgetedHook(xgboost.callback.TrainingCallback):
+    """Invoke an smdebug hook on the rounds a CapturePolicy samples"""
+
+    def __init__(self, hook, policy, train_data=None, validation_data=None):
+        self.hook = hook
+        self.policy = policy
+        self.train_data = train_data
+        self.validation_data = validation_data
+        self.started = None
+
+    def before_iteration(self, model, epoch, evals_log):
+        self.started = time.time()
+        return False
+
+    def after_iteration(self, model, epoch, evals_log):
+        train_seconds = time.time() - self.started
+        full = self.policy.capture(epoch)
+        if full is None:
+            self.policy.record(epoch, train_seconds)
+            return False
+        start = time.time()
+        self.hook.train_data = self.train_data if full else None
+        self.hook.validation_data = self.validation_data if full else None
+        result = self.hook.after_iteration(model, epoch, evals_log)
+        self.policy.record(epoch, train_seconds, time.time() - start, full)
+        return bool(result)
+
+    def after_training(self, model):
+        print('debug capture overhead_pct: {:.2f}; captures: {}; interval: {}; full_every: {}'.format(
+            self.policy.overhead_pct(), self.policy.captures, self.policy.interval, self.policy.full_every))
+        if hasattr(self.hook, 'after_training'):
+            return self.hook.after_training(model)
+        return model
@@ -0,0 +1,114 @@
+import glob
+import os
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Parallel, memory lean loader for the training and validation channels.
+# Rows are counted first so the label and feature arrays can be allocated
+# once as float32, then every file is parsed in chunks straight into its
+# slice of those arrays. There are no per file frames, concatenated copies
+# or float64 intermediates, and the arrays are passed to xgboost.DMatrix
+# without a further copy. Files are parsed on a thread pool, as the pandas C
+# parser releases the GIL while tokenizing and converting numbers.
+
+LABEL_COLUMN = 'Target'
+CHUNK_ROWS = 100000
+DTYPE = np.float32
+
+def list_files(path):
+    """Return the channel files in a stable order"""
+    return sorted(glob.glob(os.path.join(path, '*.*')))
+
+def read_header(file):
+    with open(file) as f:
+        return f.readline().strip().split(',')
+
+def count_rows(file, block_size=1 << 20):
+    """Count data rows (lines after the header) without parsing"""
+    lines = 0
+    last = b'\n'
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1 # No trailing newline on the last row
+    return max(lines - 1, 0)
+
+def default_workers():
+    return os.cpu_count() or 1
+
+def load(files, label_column=LABEL_COLUMN, workers=None, chunk_rows=CHUNK_ROWS):
+    """Load CSV files with a header into float32 (features, labels) arrays
+
+    All files must share the header of the first file.
+    """
+    if not files:
+        raise ValueError('No files to load')
+    columns = read_header(files[0])
+    if label_column not in columns:
+        raise ValueError('Label column {} not in {}'.format(label_column, files[0]))
+    feature_columns = [c for c in columns if c != label_column]
+
+    workers = workers or default_workers()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        counts = list(executor.map(count_rows, files))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        features = np.empty((offsets[-1], len(feature_columns)), dtype=DTYPE)
+        labels = np.empty(offsets[-1], dtype=DTYPE)
+
+        def fill(i):
+            return _fill(files[i], columns, feature_columns, label_column,
+                         features[offsets[i]:offsets[i + 1]], labels[offsets[i]:offsets[i + 1]], chunk_rows)
+
+        filled = list(executor.map(fill, range(len(files))))
+
+    # Blank lines are counted but not parsed, so close any gaps in place
+    if filled != counts:
+        end = 0
+        for offset, rows in zip(offsets[:-1], filled):
+            features[end:end + rows] = features[offset:offset + rows]
+            labels[end:end + rows] = labels[offset:offset + rows]
+            end += rows
+        features, labels = features[:end], labels[:end]
+    return features, labels
+
+def _fill(file, columns, feature_columns, label_column, features, labels, chunk_rows):
+    """Parse file in chunks into the preallocated features and labels slices"""
+    if read_header(file) != columns:
+        raise ValueError('Header of {} does not match'.format(file))
+    dtype = {c: DTYPE for c in columns}
+    row = 0
+    for chunk in pd.read_csv(file, dtype=dtype, chunksize=chunk_rows, engine='c'):
+        rows = len(chunk)
+        if row + rows > len(features):
+            raise ValueError('{} has more rows than counted'.format(file))
+        labels[row:row + rows] = chunk[label_column].values
+        features[row:row + rows] = chunk[feature_columns].values
+        row += rows
+    return row
+
+def load_dmatrix(path, label_column=LABEL_COLUMN, workers=None, cache=None, **kwargs):
+    """Load a channel directory into an xgboost.DMatrix, printing load time and peak RSS
+
+    With a matrix_cache.MatrixCache, previously parsed files are memory mapped from the cache.
+    """
+    import xgboost
+    start = time.time()
+    files = list_files(path)
+    if cache is not None:
+        features, labels = cache.load(files, label_column, workers)
+    else:
+        features, labels = load(files, label_column, workers)
+    dmatrix = xgboost.DMatrix(features, label=labels, **kwargs)
+    print('loaded {} rows x {} features from {} in: {:.3f}s peak_rss_mb: {:.1f}'.format(
+        features.shape[0], features.shape[1], path, time.time() - start, peak_rss_mb()))
+    return dmatrix
+
+def peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is in KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
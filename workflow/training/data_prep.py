@@ -1,35 +1,29 @@
 import boto3
-from botocore.exceptions import ClientError
 import time
 import sys
 
-bucket_name = sys.argv[1]
-prefix = sys.argv[2]
-
-start = time.time()
-print('Data prep started...')
+try:
+    from . import s3_sync
+except ImportError:  # CodeBuild runs data_prep.py as a top level script
+    import s3_sync
 
 # Based on model monitor example using CSE-CIC-IDS2018 dataset
 # see also: https://github.com/aws-samples/reinvent2019-aim362-sagemaker-debugger-model-monitor
 
-s3 = boto3.resource('s3')
-
-source_bucket_name = "sagemaker-ap-southeast-2-691313291965" 
+source_bucket_name = "sagemaker-ap-southeast-2-691313291965"
 source_bucket_prefix = "aim362/data/"
-source_bucket = s3.Bucket(source_bucket_name)
 
-for s3_object in source_bucket.objects.filter(Prefix=source_bucket_prefix):
-    target_key = s3_object.key.replace(source_bucket_prefix, prefix+'/data/')
-    copy_source = {
-        'Bucket': source_bucket_name,
-        'Key': s3_object.key
-    }
-    try:
-        obj = s3.Object(bucket_name, target_key).load()
-        print('Already Copied {0}'.format(target_key))
-    except ClientError as e:    
-        print('Copying {0} to {1} ...'.format(s3_object.key, target_key))
-        s3.Bucket(bucket_name).copy(copy_source, target_key)
+def main(bucket_name, prefix, s3=None):
+    start = time.time()
+    print('Data prep started...')
+
+    # Copy only the objects that are missing or changed in the target
+    s3 = s3 or boto3.client('s3')
+    stats = s3_sync.sync(s3, source_bucket_name, source_bucket_prefix, bucket_name, prefix + '/data/')
+
+    end = time.time()
+    print('Data prep complete in: {}'.format(end - start))
+    return stats
 
-end = time.time()
-print('Data prep complete in: {}'.format(end - start))
\ No newline at end of file
+if __name__ == '__main__':
+    main(sys.argv[1], sys.argv[2])
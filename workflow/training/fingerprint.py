@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+from botocore.exceptions import ClientError
+
+# Skip training when nothing that affects the model has changed.
+# The fingerprint is a sha256 over the training and validation objects (key
+# and ETag), the training source uploaded as the estimator's source_dir and
+# the hyperparameters. training.py tags the commit's trial, created by
+# create_trial.py, with the fingerprint and the training job that produced its
+# model. A later run with the same fingerprint finds that trial, and if its job
+# completed and its model still exists, deploys that model instead of training.
+
+REUSE_MODEL = os.environ.get('REUSE_MODEL', 'true').lower() == 'true'
+FINGERPRINT_TAG = 'TrainingFingerprint'
+JOB_TAG = 'TrainingJobName'
+
+Reuse = namedtuple('Reuse', ['job_name', 'model_data_url', 'trial_name'])
+
+def source_files(source_dir):
+    """Return the files uploaded from source_dir, in a stable order"""
+    files = []
+    for root, dirs, names in os.walk(source_dir):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+        files.extend(os.path.join(root, name) for name in sorted(names) if not name.endswith('.pyc'))
+    return files
+
+def compute(objects, source_dir, hyperparameters):
+    """Return the sha256 of the data objects' ETags, the source and the hyperparameters"""
+    digest = hashlib.sha256()
+    for key in sorted(objects):
+        digest.update('{} {}\n'.format(key, objects[key]['etag']).encode('utf-8'))
+    for path in source_files(source_dir):
+        digest.update(os.path.relpath(path, source_dir).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    digest.update(json.dumps(hyperparameters, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+def find_reusable(sm, fingerprint):
+    """Return the most recent completed run with fingerprint whose model still exists, or None"""
+    try:
+        response = sm.search(
+            Resource='ExperimentTrial',
+            SearchExpression={'Filters': [
+                {'Name': 'Tags.{}'.format(FINGERPRINT_TAG), 'Operator': 'Equals', 'Value': fingerprint}]},
+            SortBy='CreationTime',
+            SortOrder='Descending',
+            MaxResults=10)
+    except ClientError as e:
+        print('search trials error', e)
+        return None
+    for result in response['Results']:
+        trial = result['Trial']
+        job_name = {tag['Key']: tag['Value'] for tag in trial.get('Tags', [])}.get(JOB_TAG)
+        if not job_name:
+            continue
+        try:
+            job = sm.describe_training_job(TrainingJobName=job_name)
+            if job['TrainingJobStatus'] != 'Completed':
+                print('not reusing {} job {}'.format(job['TrainingJobStatus'], job_name))
+                continue
+            sm.describe_model(ModelName=job_name) # The workflow names the model after the job
+        except ClientError as e:
+            print('not reusing job {}: {}'.format(job_name, e))
+            continue
+        return Reuse(job_name, job['ModelArtifacts']['S3ModelArtifacts'], trial['TrialName'])
+    return None
+
+def tag_trial(sm, trial_name, fingerprint, job_name):
+    """Record the fingerprint and the job that produced the model on the trial"""
+    try:
+        trial = sm.describe_trial(TrialName=trial_name)
+        sm.add_tags(ResourceArn=trial['TrialArn'], Tags=[
+            {'Key': FINGERPRINT_TAG, 'Value': fingerprint},
+            {'Key': JOB_TAG, 'Value': job_name},
+        ])
+    except ClientError as e:
+        print('tag trial error', e)
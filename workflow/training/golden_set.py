@@ -0,0 +1,98 @@
+import json
+import os
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+# Golden set for the pre traffic hook, built from the project's validation data.
+# The validation objects are streamed until GOLDEN_PER_CLASS rows of each
+# Target class are found (or GOLDEN_MAX_SCAN_ROWS rows are read). Each row is a
+# CSV payload without its label, and its expected value is the prediction of
+# the live endpoint, so the hook gates the new model on agreeing with the
+# current one. The first deployment, without a live endpoint, only has labels.
+# The set is versioned by the training job and written next to its model.
+
+GOLDEN_PER_CLASS = int(os.environ.get('GOLDEN_PER_CLASS', '10'))
+GOLDEN_MAX_SCAN_ROWS = int(os.environ.get('GOLDEN_MAX_SCAN_ROWS', '1000000'))
+NUM_CLASSES = 15
+LABEL_COLUMN = 'Target'
+CHUNK_ROWS = 100
+CONTENT_TYPE = 'text/csv'
+
+def iter_lines(s3, bucket, key, chunk_size=1 << 20):
+    """Yield the lines of an object without reading it all into memory"""
+    body = s3.get_object(Bucket=bucket, Key=key)['Body']
+    pending = b''
+    for chunk in iter(lambda: body.read(chunk_size), b''):
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip(b'\r').decode('utf-8')
+    if pending:
+        yield pending.rstrip(b'\r').decode('utf-8')
+
+def sample(s3, bucket, prefix, per_class=None, max_rows=None):
+    """Return (payload, label) pairs with up to per_class rows of each label, in the order read"""
+    per_class = per_class or GOLDEN_PER_CLASS
+    max_rows = max_rows or GOLDEN_MAX_SCAN_ROWS
+    keys = sorted(obj['Key'] for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix)
+                  for obj in page.get('Contents', []) if not obj['Key'].endswith('/'))
+    counts, rows, scanned = {}, [], 0
+    for key in keys:
+        lines = iter_lines(s3, bucket, key)
+        label_index = next(lines, '').split(',').index(LABEL_COLUMN)
+        for line in lines:
+            if scanned >= max_rows:
+                break
+            if not line:
+                continue
+            scanned += 1
+            values = line.split(',')
+            label = values.pop(label_index)
+            if counts.get(label, 0) < per_class:
+                counts[label] = counts.get(label, 0) + 1
+                rows.append((','.join(values), float(label)))
+            if len(counts) == NUM_CLASSES and all(c >= per_class for c in counts.values()):
+                return rows
+        if scanned >= max_rows:
+            break
+    print('golden set sampled {} rows of {} classes from {} rows'.format(len(rows), len(counts), scanned))
+    return rows
+
+def predict(sm_runtime, endpoint_name, payloads):
+    """Return the endpoint's predictions for payloads, or None when it can't be invoked"""
+    predictions = []
+    try:
+        for start in range(0, len(payloads), CHUNK_ROWS):
+            chunk = payloads[start:start + CHUNK_ROWS]
+            response = sm_runtime.invoke_endpoint(EndpointName=endpoint_name, Body='\n'.join(chunk),
+                                                  ContentType=CONTENT_TYPE, Accept=CONTENT_TYPE)
+            body = response['Body'].read().decode('utf-8').strip()
+            values = [float(v) for v in body.replace('\n', ',').split(',')]
+            if len(values) != len(chunk):
+                raise ValueError('Expected {} predictions got {}'.format(len(chunk), len(values)))
+            predictions.extend(values)
+    except (ClientError, BotoCoreError, ValueError) as e:
+        print('golden set without expected predictions from {}: {}'.format(endpoint_name, e))
+        return None
+    return predictions
+
+def build(s3, sm_runtime, bucket, prefix, live_endpoint_name, version):
+    """Write the golden set for version under the model prefix, returning its s3 uri"""
+    rows = sample(s3, bucket, '{}/data/val/'.format(prefix))
+    if not rows:
+        raise ValueError('No validation rows for the golden set')
+    expected = predict(sm_runtime, live_endpoint_name, [payload for payload, _ in rows])
+    records = [{'payload': payload, 'label': label} for payload, label in rows]
+    for record, value in zip(records, expected or []):
+        record['expected'] = value
+    golden = {
+        'name': 'cicids2018',
+        'version': version,
+        'content_type': CONTENT_TYPE,
+        'description': 'Validation rows per Target class, expected is the prediction of {}'.format(
+            live_endpoint_name if expected else 'no live endpoint'),
+        'records': records,
+    }
+    key = '{}/model/{}/golden.json'.format(prefix, version)
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(golden))
+    return 's3://{}/{}'.format(bucket, key)
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from . import data_loader
+except ImportError:  # SageMaker runs the entry point as a top level script
+    import data_loader
+
+# Content addressed cache of parsed training matrices.
+# The key is a sha256 over the content of every input file plus the parsing
+# schema, so a run with unchanged data skips CSV parsing and memory maps the
+# cached float32 .npy arrays instead. Entries live in <directory>/<key>/ with a
+# manifest holding the sha256 of each array, and are optionally mirrored to an
+# S3 prefix so they are shared across training jobs. The least recently used
+# entries are evicted once the directory exceeds max_bytes, and once the S3
+# prefix holds more than max_s3_entries, where an entry's last use is the
+# LastModified of its manifest, rewritten on every download.
+
+SCHEMA_VERSION = 1
+ARRAYS = ('features', 'labels')
+MANIFEST = 'manifest.json'
+MAX_BYTES = int(os.environ.get('MATRIX_CACHE_MAX_BYTES', str(20 * 1024 ** 3)))
+MAX_S3_ENTRIES = int(os.environ.get('MATRIX_CACHE_S3_MAX_ENTRIES', '4'))
+# size: check array sizes on every load, full: also check sha256 (always done after an S3 download)
+VERIFY = os.environ.get('MATRIX_CACHE_VERIFY', 'size')
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cache_key(files, label_column=data_loader.LABEL_COLUMN, workers=None):
+    """Return the sha256 of the input file contents and the parsing schema"""
+    with ThreadPoolExecutor(max_workers=workers or data_loader.default_workers()) as executor:
+        hashes = list(executor.map(file_sha256, files))
+    schema = {
+        'version': SCHEMA_VERSION,
+        'label_column': label_column,
+        'dtype': np.dtype(data_loader.DTYPE).str,
+        'files': [[os.path.basename(f), h] for f, h in zip(files, hashes)],
+    }
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode('utf-8')).hexdigest()
+
+class MatrixCache:
+    """Parsed (features, labels) arrays keyed by cache_key, with LRU size eviction"""
+
+    def __init__(self, directory, max_bytes=None, s3_uri=None, verify=None, max_s3_entries=None):
+        self.directory = directory
+        self.max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+        self.max_s3_entries = MAX_S3_ENTRIES if max_s3_entries is None else max_s3_entries
+        self.s3_uri = s3_uri.rstrip('/') if s3_uri else None
+        self.verify = verify or VERIFY
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self, files, label_column=data_loader.LABEL_COLUMN, workers=None):
+        """Return memory mapped arrays for files, parsing and storing them on a miss"""
+        start = time.time()
+        key = cache_key(files, label_column, workers)
+        cached = self.get(key)
+        if cached is not None:
+            print('matrix cache hit {} in: {:.3f}s'.format(key[:12], time.time() - start))
+            return cached
+        features, labels = data_loader.load(files, label_column, workers)
+        self.put(key, features, labels)
+        print('matrix cache miss {} in: {:.3f}s'.format(key[:12], time.time() - start))
+        # Return the memory mapped copies so the parsed arrays can be freed
+        return self.get(key) or (features, labels)
+
+    def get(self, key):
+        entry = os.path.join(self.directory, key)
+        verify = self.verify
+        if not os.path.exists(os.path.join(entry, MANIFEST)):
+            if not self.s3_uri or not self._download(key):
+                return None
+            verify = 'full' # Don't trust a download until its content is checked
+        try:
+            with open(os.path.join(entry, MANIFEST)) as f:
+                manifest = json.load(f)
+            for name in ARRAYS:
+                path = os.path.join(entry, name + '.npy')
+                if os.path.getsize(path) != manifest['arrays'][name]['bytes']:
+                    raise ValueError('{} size mismatch'.format(name))
+                if verify == 'full' and file_sha256(path) != manifest['arrays'][name]['sha256']:
+                    raise ValueError('{} checksum mismatch'.format(name))
+            arrays = tuple(np.load(os.path.join(entry, name + '.npy'), mmap_mode='r') for name in ARRAYS)
+        except (OSError, ValueError, KeyError) as e:
+            print('matrix cache entry {} invalid: {}'.format(key[:12], e))
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        os.utime(os.path.join(entry, MANIFEST)) # Mark as recently used
+        return arrays
+
+    def put(self, key, features, labels):
+        entry = os.path.join(self.directory, key)
+        staging = entry + '.partial'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        manifest = {'key': key, 'created': int(time.time()), 'shape': list(features.shape), 'arrays': {}}
+        for name, array in zip(ARRAYS, (features, labels)):
+            path = os.path.join(staging, name + '.npy')
+            np.save(path, array)
+            manifest['arrays'][name] = {'bytes': os.path.getsize(path), 'sha256': file_sha256(path)}
+        with open(os.path.join(staging, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+        # Rename so a partially written entry is never read
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(staging, entry)
+        if self.s3_uri:
+            self._upload(key)
+        self.evict(keep=key)
+
+    def entries(self):
+        """Return (last used, bytes, key) for each complete entry"""
+        entries = []
+        for key in os.listdir(self.directory):
+            manifest = os.path.join(self.directory, key, MANIFEST)
+            if os.path.exists(manifest):
+                entry = os.path.join(self.directory, key)
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                entries.append((os.path.getmtime(manifest), size, key))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+            total -= size
+            print('matrix cache evicted {}'.format(key[:12]))
+
+    def _s3_location(self, key, name):
+        bucket, _, prefix = self.s3_uri.replace('s3://', '', 1).partition('/')
+        return bucket, '/'.join(p for p in (prefix, key, name) if p)
+
+    def _upload(self, key):
+        import boto3 # Imported lazily, only needed with an S3 prefix
+        from boto3.exceptions import S3UploadFailedError
+        from botocore.exceptions import ClientError
+        s3 = boto3.client('s3')
+        try:
+            # Upload the manifest last so readers never see an incomplete entry
+            for name in [a + '.npy' for a in ARRAYS] + [MANIFEST]:
+                s3.upload_file(os.path.join(self.directory, key, name), *self._s3_location(key, name))
+            self.evict_s3(s3, keep=key)
+        except (ClientError, S3UploadFailedError) as e:
+            # The local entry is still usable, so a failed upload doesn't fail training
+            print('matrix cache upload error', e)
+
+    def s3_entries(self, s3):
+        """Return (last used, key) for each complete entry under the S3 prefix"""
+        bucket, prefix = self._s3_location('', '')
+        entries = []
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix and prefix + '/'):
+            for obj in page.get('Contents', []):
+                entry, _, name = obj['Key'][len(prefix):].strip('/').rpartition('/')
+                if name == MANIFEST and entry and '/' not in entry:
+                    entries.append((obj['LastModified'], entry))
+        return sorted(entries)
+
+    def evict_s3(self, s3, keep=None):
+        """Remove the least recently used entries until the S3 prefix holds max_s3_entries"""
+        entries = self.s3_entries(s3)
+        for _, key in entries[:max(0, len(entries) - self.max_s3_entries)]:
+            if key == keep:
+                continue
+            bucket, _ = self._s3_location(key, '')
+            # Delete the manifest first so readers never see an incomplete entry
+            for name in [MANIFEST] + [a + '.npy' for a in ARRAYS]:
+                s3.delete_object(Bucket=bucket, Key=self._s3_location(key, name)[1])
+            print('matrix cache evicted {} from S3'.format(key[:12]))
+
+    def _download(self, key):
+        import boto3
+        from botocore.exceptions import ClientError
+        s3 = boto3.client('s3')
+        staging = os.path.join(self.directory, key + '.partial')
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        try:
+            for name in [MANIFEST] + [a + '.npy' for a in ARRAYS]:
+                s3.download_file(*self._s3_location(key, name), os.path.join(staging, name))
+        except ClientError as e:
+            shutil.rmtree(staging, ignore_errors=True)
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                print('matrix cache download error', e)
+            return False
+        os.rename(staging, os.path.join(self.directory, key))
+        try:
+            # Copy the manifest onto itself to mark the entry as recently used
+            bucket, manifest = self._s3_location(key, MANIFEST)
+            s3.copy_object(Bucket=bucket, Key=manifest, CopySource={'Bucket': bucket, 'Key': manifest},
+                           MetadataDirective='REPLACE')
+        except ClientError as e:
+            print('matrix cache touch error', e)
+        self.evict(keep=key)
+        return True
@@ -0,0 +1,108 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+# Copy the objects under a source prefix that are missing or changed under a
+# target prefix. Both prefixes are listed once, rather than a HEAD request per
+# object, and the changed objects are copied server side on a bounded thread
+# pool, with large objects copied in parts. Objects are compared by key, size
+# and ETag. A multipart copy gets a different ETag to its source, so the
+# source ETag of every copied object is kept in a manifest under the target
+# prefix and compared instead.
+
+WORKERS = int(os.environ.get('S3_SYNC_WORKERS', '16'))
+MULTIPART_THRESHOLD = int(os.environ.get('S3_SYNC_MULTIPART_THRESHOLD', str(64 * 1024 ** 2)))
+MULTIPART_CHUNKSIZE = int(os.environ.get('S3_SYNC_MULTIPART_CHUNKSIZE', str(64 * 1024 ** 2)))
+MANIFEST = '_sync_manifest.json'
+
+def list_objects(s3, bucket, prefix):
+    """Return {key relative to prefix: {'etag', 'size'}} for the objects under prefix"""
+    objects = {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            key = obj['Key'][len(prefix):]
+            if key and not key.endswith('/') and key != MANIFEST:
+                objects[key] = {'etag': obj['ETag'].strip('"'), 'size': obj['Size']}
+    return objects
+
+def load_manifest(s3, bucket, prefix):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=prefix + MANIFEST)
+        return json.loads(response['Body'].read())
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+            print('sync manifest error', e)
+        return {}
+
+def diff(source, target, manifest):
+    """Return the keys in source that are missing or changed in target"""
+    changed = []
+    for key, obj in sorted(source.items()):
+        copied = target.get(key)
+        if copied is None or copied['size'] != obj['size']:
+            changed.append(key)
+        elif copied['etag'] != obj['etag'] and manifest.get(key) != obj['etag']:
+            changed.append(key)
+    return changed
+
+def transfer_config():
+    # Each worker copies one object, so keep the parts of a large object to a few threads
+    return TransferConfig(multipart_threshold=MULTIPART_THRESHOLD, multipart_chunksize=MULTIPART_CHUNKSIZE,
+                          max_concurrency=4)
+
+def sync(s3, source_bucket, source_prefix, target_bucket, target_prefix, workers=None, config=None):
+    """Copy changed objects from source to target, returning the transfer stats"""
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        source = executor.submit(list_objects, s3, source_bucket, source_prefix)
+        target = executor.submit(list_objects, s3, target_bucket, target_prefix)
+        manifest = executor.submit(load_manifest, s3, target_bucket, target_prefix)
+        source, target, manifest = source.result(), target.result(), manifest.result()
+    listed = time.time()
+    keys = diff(source, target, manifest)
+    print('sync listed {} source and {} target objects in: {:.3f}s, {} to copy'.format(
+        len(source), len(target), listed - start, len(keys)))
+
+    config = config or transfer_config()
+
+    def copy(key):
+        s3.copy({'Bucket': source_bucket, 'Key': source_prefix + key}, target_bucket, target_prefix + key,
+                Config=config)
+        return key
+
+    copied, failed = [], []
+    with ThreadPoolExecutor(max_workers=workers or WORKERS) as executor:
+        futures = [(key, executor.submit(copy, key)) for key in keys]
+        for key, future in futures:
+            try:
+                copied.append(future.result())
+            except ClientError as e:
+                print('copy error {}: {}'.format(key, e))
+                failed.append(key)
+
+    # Record source ETags of what is now in the target, including previous copies
+    manifest = {key: etag for key, etag in manifest.items() if key in source}
+    manifest.update({key: source[key]['etag'] for key in copied})
+    s3.put_object(Bucket=target_bucket, Key=target_prefix + MANIFEST, Body=json.dumps(manifest))
+
+    seconds = time.time() - start
+    copy_seconds = max(time.time() - listed, 1e-9)
+    copied_bytes = sum(source[key]['size'] for key in copied)
+    stats = {
+        'source_objects': len(source),
+        'copied': len(copied),
+        'skipped': len(source) - len(keys),
+        'failed': len(failed),
+        'copied_bytes': copied_bytes,
+        'seconds': round(seconds, 3),
+        'objects_per_sec': round(len(copied) / copy_seconds, 1),
+        'mb_per_sec': round(copied_bytes / copy_seconds / 1e6, 1),
+    }
+    print('sync', json.dumps(stats))
+    if failed:
+        raise RuntimeError('Failed to copy {} objects, eg. {}'.format(len(failed), failed[0]))
+    return stats
@@ -0,0 +1,104 @@
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost
+
+try:
+    from . import data_loader
+except ImportError:  # SageMaker runs the entry point as a top level script
+    import data_loader
+
+# Streaming (external memory) training data for datasets larger than RAM.
+# Channel data is read in batches of BATCH_ROWS lines and handed to XGBoost
+# through a DataIter, which writes each batch to a disk cache under
+# cache_prefix, so memory is bounded by the batch size rather than the
+# dataset. Works with File mode channel directories and Pipe mode FIFOs,
+# where SageMaker exposes <channel>_0, <channel>_1, ... one per pass over the
+# data, concatenating the S3 objects so header lines repeat within a FIFO.
+# Requires XGBoost 1.5 or later.
+# See: https://xgboost.readthedocs.io/en/stable/tutorials/external_memory.html
+
+BATCH_ROWS = int(os.environ.get('STREAM_BATCH_ROWS', '100000'))
+
+def is_pipe(path):
+    """Pipe mode channels are FIFOs named <channel>_<epoch> next to the channel path"""
+    return not os.path.isdir(path) and os.path.exists('{}_0'.format(path.rstrip('/')))
+
+class ChannelIter(xgboost.DataIter):
+    """Yield (features, labels) batches from a channel, one pass per reset"""
+
+    def __init__(self, path, cache_prefix, label_column=data_loader.LABEL_COLUMN, batch_rows=None):
+        self.path = path.rstrip('/')
+        self.pipe = is_pipe(path)
+        self.label_column = label_column
+        self.batch_rows = batch_rows or BATCH_ROWS
+        self.epoch = 0
+        self.rows = 0
+        self._batches = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def sources(self):
+        if self.pipe:
+            # Each pass reads the next epoch's FIFO
+            return ['{}_{}'.format(self.path, self.epoch)]
+        return data_loader.list_files(self.path)
+
+    def batches(self):
+        header = None
+        for source in self.sources():
+            with open(source, 'rb') as f:
+                lines = []
+                for line in f:
+                    if header is None:
+                        header = line
+                        columns = line.decode('utf-8').strip().split(',')
+                        if self.label_column not in columns:
+                            raise ValueError('Label column {} not in {}'.format(self.label_column, source))
+                        label_index = columns.index(self.label_column)
+                        continue
+                    if line == header or not line.strip():
+                        continue # Header of the next file, or a blank line
+                    lines.append(line if line.endswith(b'\n') else line + b'\n')
+                    if len(lines) == self.batch_rows:
+                        yield _parse(lines, label_index)
+                        lines = []
+                if lines:
+                    yield _parse(lines, label_index)
+
+    def next(self, input_data):
+        if self._batches is None:
+            self._batches = self.batches()
+        batch = next(self._batches, None)
+        if batch is None:
+            return 0
+        features, labels = batch
+        self.rows += len(labels)
+        input_data(data=features, label=labels)
+        return 1
+
+    def reset(self):
+        if self._batches is not None:
+            self.epoch += 1
+        self._batches = None
+        self.rows = 0
+
+def _parse(lines, label_index):
+    values = pd.read_csv(io.BytesIO(b''.join(lines)), header=None,
+                         dtype=data_loader.DTYPE, engine='c').values
+    return np.delete(values, label_index, axis=1), values[:, label_index]
+
+def stream_dmatrix(path, cache_dir=None, label_column=data_loader.LABEL_COLUMN, batch_rows=None):
+    """Build an external memory DMatrix for a channel, caching pages under cache_dir"""
+    start = time.time()
+    cache_dir = cache_dir or tempfile.mkdtemp(prefix='xgboost-cache-')
+    name = os.path.basename(path.rstrip('/')) or 'channel'
+    it = ChannelIter(path, os.path.join(cache_dir, name), label_column, batch_rows)
+    dmatrix = xgboost.DMatrix(it)
+    print('streamed {} rows x {} features from {} ({}) in: {:.3f}s peak_rss_mb: {:.1f}'.format(
+        dmatrix.num_row(), dmatrix.num_col(), path, 'pipe' if it.pipe else 'file',
+        time.time() - start, data_loader.peak_rss_mb()))
+    return dmatrix
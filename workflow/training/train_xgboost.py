@@ -4,18 +4,39 @@ import json
 import os
 import pickle
 import random
+import tarfile
 import tempfile
+import time
 import urllib.request
-import pandas as pd
 import glob
 import pickle as pkl
 
 import xgboost
 
-from smdebug import SaveConfig
-from smdebug.xgboost import Hook
+try:
+    from . import capture_policy, data_loader, matrix_cache
+except ImportError:  # SageMaker runs the entry point as a top level script
+    import capture_policy
+    import data_loader
+    import matrix_cache
 
-def parse_args():
+def native_format():
+    """UBJSON is smaller and faster to load, but needs XGBoost 1.6 or later"""
+    major, minor = (int(v) for v in xgboost.__version__.split('.')[:2])
+    return 'model.ubj' if (major, minor) >= (1, 6) else 'model.json'
+
+# Model artifacts by format. The pickled booster is kept for existing consumers,
+# native is the XGBoost format that loads across library versions, and compiled
+# is a Treelite shared library for the platform it was built on.
+MODEL_FILES = {
+    'compiled': 'model.so',
+    'native': native_format(),
+    'pickle': 'model.bin',
+}
+# Fastest to load and predict first
+MODEL_PREFERENCE = ['compiled', 'native', 'pickle']
+
+def parse_args(argv=None):
 
     parser = argparse.ArgumentParser()
 
@@ -27,45 +48,112 @@ def parse_args():
     parser.add_argument("--objective", type=str, default="multi:softmax")
     parser.add_argument("--num_class", type=int, default=15)
     parser.add_argument("--num_round", type=int, default=10)
+    parser.add_argument("--data_mode", type=str, default="memory", choices=["memory", "stream"])
+    parser.add_argument("--cache_dir", type=str, default=os.environ.get('MATRIX_CACHE_DIR'))
+    parser.add_argument("--cache_s3_uri", type=str, default=os.environ.get('MATRIX_CACHE_S3_URI'))
+    parser.add_argument("--model_formats", type=str, default="native,pickle",
+                        help="comma separated formats to save, from {}".format(",".join(MODEL_FILES)))
+    parser.add_argument("--debug_overhead_pct", type=float, default=capture_policy.OVERHEAD_PCT)
+    parser.add_argument("--debug_steps", type=str, default="",
+                        help="comma separated rounds always captured in full, eg. for debugger rules")
 
     parser.add_argument('--train', type=str, default=os.environ.get('SM_CHANNEL_TRAIN'))
     parser.add_argument('--validation', type=str, default=os.environ.get('SM_CHANNEL_VALIDATION'))
+    parser.add_argument('--warm_start_model', type=str, default=os.environ.get('SM_CHANNEL_MODEL'),
+                        help='channel with the model.tar.gz to continue boosting from')
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     return args
 
+def load_model(model_dir, name):
+    """Load the artifact saved in format name from model_dir"""
+    path = os.path.join(model_dir, MODEL_FILES[name])
+    if name == 'compiled':
+        import tl2cgen # Imported lazily, only present where the compiled predictor is used
+        return tl2cgen.Predictor(path)
+    if name == 'pickle':
+        with open(path, 'rb') as f:
+            return pkl.load(f)
+    bst = xgboost.Booster()
+    bst.load_model(path)
+    return bst
+
 def model_fn(model_dir):
-    model_file = model_dir + '/model.bin'
-    model = pkl.load(open(model_file, 'rb'))
-    return model
+    """Load the fastest artifact available in model_dir, falling back to the pickled booster"""
+    for name in MODEL_PREFERENCE:
+        if not os.path.exists(os.path.join(model_dir, MODEL_FILES[name])):
+            continue
+        try:
+            start = time.time()
+            model = load_model(model_dir, name)
+            print('loaded {} model in: {:.3f}s'.format(name, time.time() - start))
+            return model
+        except ImportError as e:
+            print('skipping {} model: {}'.format(name, e))
+    raise ValueError('No model found in {}'.format(model_dir))
 
-def main():
+def load_warm_start(channel):
+    """Extract the model.tar.gz in channel and load its booster to continue training"""
+    model_dir = tempfile.mkdtemp()
+    with tarfile.open(os.path.join(channel, 'model.tar.gz')) as tar:
+        tar.extractall(model_dir, members=safe_members(tar))
+    for name in ('native', 'pickle'):
+        if os.path.exists(os.path.join(model_dir, MODEL_FILES[name])):
+            bst = load_model(model_dir, name)
+            print('warm starting from {} model with {} rounds'.format(name, bst.num_boosted_rounds()))
+            return bst
+    raise ValueError('No booster in {}'.format(channel))
 
-    args = parse_args()
+def safe_members(tar):
+    """Only extract regular files that stay inside the target directory, as in regression/local_model.py"""
+    return [m for m in tar.getmembers()
+            if m.isfile() and not os.path.isabs(m.name) and '..' not in m.name.split('/')]
+
+def predict_fn(input_data, model):
+    """Predict a (rows, features) array, or the DMatrix of the default input_fn, with a booster or compiled predictor"""
+    if isinstance(model, xgboost.Booster):
+        if isinstance(input_data, xgboost.DMatrix):
+            return model.predict(input_data)
+        # inplace_predict skips building a DMatrix, which dominates small requests
+        return model.inplace_predict(input_data)
+    import tl2cgen
+    if isinstance(input_data, xgboost.DMatrix):
+        input_data = input_data.get_data() # scipy CSR matrix of the parsed request
+    return model.predict(tl2cgen.DMatrix(input_data))
+
+def load_data(args):
+    """Return the (train, validation) DMatrix for the channels and data mode in args"""
     train_files_path, validation_files_path = args.train, args.validation
-    
-    train_files_list = glob.glob(train_files_path + '/*.*')
-    print(train_files_list)
-    
-    val_files_list = glob.glob(validation_files_path + '/*.*')
-    print(val_files_list)
-    
-    print('Loading training data...')
-    df_train = pd.concat(map(pd.read_csv, train_files_list))
-    print('Loading validation data...')
-    df_val = pd.concat(map(pd.read_csv, val_files_list))
-    print('Data loading completed.')
-    
-    y = df_train.Target.values
-    X =  df_train.drop(['Target'], axis=1).values
-    val_y = df_val.Target.values
-    val_X = df_val.drop(['Target'], axis=1).values
 
-    dtrain = xgboost.DMatrix(X, label=y)
-    dval = xgboost.DMatrix(val_X, label=val_y)
+    print(data_loader.list_files(train_files_path))
+    print(data_loader.list_files(validation_files_path))
+
+    if args.data_mode == 'stream':
+        # Stream batches through an external memory cache, for File or Pipe mode channels
+        try:
+            from . import streaming
+        except ImportError:  # Imported lazily as DataIter needs XGBoost 1.5
+            import streaming
+        print('Streaming training data...')
+        dtrain = streaming.stream_dmatrix(train_files_path)
+        print('Streaming validation data...')
+        dval = streaming.stream_dmatrix(validation_files_path)
+    else:
+        # Load float32 arrays in parallel straight into the DMatrix inputs,
+        # reusing matrices parsed by earlier runs when a cache is configured
+        cache = None
+        if args.cache_dir or args.cache_s3_uri:
+            cache = matrix_cache.MatrixCache(args.cache_dir or '/tmp/matrix-cache', s3_uri=args.cache_s3_uri)
+        print('Loading training data...')
+        dtrain = data_loader.load_dmatrix(train_files_path, cache=cache)
+        print('Loading validation data...')
+        dval = data_loader.load_dmatrix(validation_files_path, cache=cache)
+    print('Data loading completed.')
+    return dtrain, dval
 
-    params = {
+def build_params(args):
+    return {
         "max_depth": args.max_depth,
         "eta": args.eta,
         "gamma": args.gamma,
@@ -74,21 +162,111 @@ def main():
         "objective": args.objective,
         "num_class": args.num_class}
 
-    hook = Hook.create_from_json_file()
-    hook.train_data = dtrain
-    hook.validation_data = dval
-    
+def train(params, dtrain, dval, num_round, callbacks=None, early_stopping_rounds=None, xgb_model=None,
+          verbose_eval=True):
+    """Train with the validation set in the watchlist, optionally continuing xgb_model"""
     watchlist = [(dtrain, "train"), (dval, "validation")]
 
-    bst = xgboost.train(
+    return xgboost.train(
         params=params,
         dtrain=dtrain,
         evals=watchlist,
-        num_boost_round=args.num_round,
-        callbacks=[hook])
-    
+        num_boost_round=num_round,
+        callbacks=callbacks,
+        early_stopping_rounds=early_stopping_rounds,
+        xgb_model=xgb_model,
+        verbose_eval=verbose_eval)
+
+def save_model(bst, model_dir, formats=('native', 'pickle')):
+    """Save bst to model_dir in each of formats, skipping a compiled predictor that can't be built"""
+    for name in formats:
+        path = os.path.join(model_dir, MODEL_FILES[name])
+        start = time.time()
+        if name == 'pickle':
+            with open(path, 'wb') as f:
+                pkl.dump(bst, f)
+        elif name == 'native':
+            bst.save_model(path)
+        elif name == 'compiled':
+            try:
+                compile_predictor(bst, path)
+            except ImportError as e:
+                print('skipping compiled model: {}'.format(e))
+                continue
+        print('saved {} model {} bytes in: {:.3f}s'.format(name, os.path.getsize(path), time.time() - start))
+
+def compile_predictor(bst, path):
+    """Compile bst into a shared library, which only needs the small tl2cgen runtime to predict"""
+    import treelite
+    import tl2cgen
+    model = treelite.frontend.from_xgboost(bst)
+    tl2cgen.export_lib(model, toolchain='gcc', libpath=path, params={'parallel_comp': os.cpu_count() or 1})
+
+class RoundProfiler(xgboost.callback.TrainingCallback):
+    """Record wall time, rows/sec and peak RSS of every boosting round
+
+    Metrics are printed for the estimator metric definitions, and also saved
+    as smdebug scalars when a hook is given.
+    """
+
+    def __init__(self, rows, hook=None):
+        self.rows = rows
+        self.hook = hook
+        self.started = None
+        self.rounds = []
+
+    def before_iteration(self, model, epoch, evals_log):
+        self.started = time.time()
+        return False
+
+    def after_iteration(self, model, epoch, evals_log):
+        seconds = time.time() - self.started
+        metrics = {
+            'round_seconds': seconds,
+            'rows_per_sec': self.rows / max(seconds, 1e-9),
+            'peak_rss_mb': data_loader.peak_rss_mb(),
+        }
+        self.rounds.append(metrics)
+        print('round: {}; round_seconds: {:.4f}; rows_per_sec: {:.0f}; peak_rss_mb: {:.1f}'.format(
+            epoch, metrics['round_seconds'], metrics['rows_per_sec'], metrics['peak_rss_mb']))
+        if self.hook is not None:
+            for name, value in metrics.items():
+                self.hook.save_scalar(name, value, sm_metric=True)
+        return False
+
+def debug_callbacks(args, dtrain, dval):
+    """Return the smdebug hook wrapped in its capture budget, or none without smdebug"""
+    try:
+        from smdebug.xgboost import Hook
+    except ImportError:
+        print('smdebug not installed, training without the debugger hook')
+        return None, []
+    hook = Hook.create_from_json_file()
+    if not hasattr(hook, 'after_iteration'):
+        # Older smdebug hooks use the legacy callback interface, so capture every round
+        hook.train_data = dtrain
+        hook.validation_data = dval
+        return hook, [hook]
+    required = [int(step) for step in args.debug_steps.split(',') if step]
+    policy = capture_policy.CapturePolicy(args.debug_overhead_pct, required_steps=required)
+    return hook, [capture_policy.BudgetedHook(hook, policy, dtrain, dval)]
+
+def main():
+
+    args = parse_args()
+    dtrain, dval = load_data(args)
+    params = build_params(args)
+
+    hook, callbacks = debug_callbacks(args, dtrain, dval)
+    # The profiler runs first, so round times exclude the debugger capture
+    callbacks = [RoundProfiler(dtrain.num_row(), hook)] + callbacks
+
+    # Continue boosting from the live model on only the new data when warm starting
+    xgb_model = load_warm_start(args.warm_start_model) if args.warm_start_model else None
+    bst = train(params, dtrain, dval, args.num_round, callbacks=callbacks, xgb_model=xgb_model)
+
     model_dir = os.environ.get('SM_MODEL_DIR')
-    pkl.dump(bst, open(model_dir + '/model.bin', 'wb'))
+    save_model(bst, model_dir, args.model_formats.split(','))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
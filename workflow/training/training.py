@@ -1,222 +1,387 @@
-import boto3
-from botocore.exceptions import ClientError
+import argparse
 import json
 import os
-import time
 import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
-# Import Sagemaker and debugger config
-import sagemaker
-from sagemaker.utils import name_from_base
-from sagemaker.xgboost import XGBoost
-from sagemaker.debugger import Rule, rule_configs, DebuggerHookConfig, CollectionConfig
-
-# Import AWS Data Science SDK
-from stepfunctions import steps
-from stepfunctions.inputs import ExecutionInput
-from stepfunctions.workflow import Workflow
-
-# Get Arguments
-
-bucket_name = sys.argv[1]
-prefix = sys.argv[2]
-sagemaker_execution_role = sys.argv[3]
-workflow_arn = sys.argv[4]
-stack_name = sys.argv[5] 
-trial_name = sys.argv[6][:7] # Take the first 8 characters of commit hash
-
-start = time.time()
-
-# Get pipeline execution id as job_name
+import boto3
+from botocore.exceptions import ClientError
 
-codepipeline = boto3.client('codepipeline')
-response = codepipeline.get_pipeline_state( name=stack_name )
-execution_id = response['stageStates'][0]['latestExecution']['pipelineExecutionId']
-job_name = name_from_base(execution_id)
-print('Staring Training job: {}'.format(job_name))
+try:
+    from . import fingerprint, golden_set, warm_start
+except ImportError:  # CodeBuild runs training.py as a top level script
+    import fingerprint
+    import golden_set
+    import warm_start
+
+# Launch the training workflow for a CodeBuild run.
+# The lookups that don't depend on each other (pipeline execution id, live
+# endpoint parameter, estimator construction and attaching the workflow) run
+# concurrently, and the code upload overlaps with checking whether the target
+# endpoint exists. After updating the workflow the state machine is polled
+# until it serves the new definition, rather than sleeping a fixed time, and
+# every phase is timed. Depending on warm_start.plan, the job either retrains
+# on the full dataset or continues the live model on only the new objects.
+# When the data, training source and hyperparameters match a previous
+# completed run, that run's model is deployed without training. The golden
+# set for the pre traffic hook is built from the validation data and the live
+# endpoint's predictions while the workflow is updated.
+# The SageMaker and Step Functions SDKs are imported lazily so the
+# orchestration can be exercised with stubbed clients.
+#
+# Usage: python workflow/training/training.py <bucket> <prefix> <role> <workflow arn> <stack name> <commit>
+
+WORKFLOW_WAIT_SECONDS = float(os.environ.get('WORKFLOW_WAIT_SECONDS', '60'))
+WORKFLOW_POLL_SECONDS = float(os.environ.get('WORKFLOW_POLL_SECONDS', '0.5'))
+OUTPUT_DIR = 'cloud_formation'
+SOURCE_DIR = 'workflow/training/'
+
+Config = namedtuple('Config', ['bucket_name', 'prefix', 'sagemaker_execution_role', 'workflow_arn',
+                               'stack_name', 'trial_name'])
+
+DEBUG_RULE_STEPS = ["17", "18", "19"]
+
+# Per round metrics printed by train_xgboost.RoundProfiler
+METRIC_DEFINITIONS = [
+    {"Name": "train:round_seconds", "Regex": "round_seconds: ([0-9.]+)"},
+    {"Name": "train:rows_per_sec", "Regex": "rows_per_sec: ([0-9.]+)"},
+    {"Name": "train:peak_rss_mb", "Regex": "peak_rss_mb: ([0-9.]+)"},
+]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    for name in Config._fields:
+        parser.add_argument(name)
+    args = vars(parser.parse_args(argv))
+    args['trial_name'] = args['trial_name'][:7] # Take the first 7 characters of commit hash
+    return Config(**args)
+
+def paths(config):
+    bucket_name, prefix = config.bucket_name, config.prefix
+    return {
+        'train': "s3://{}/{}/data/train".format(bucket_name, prefix),
+        'validation': "s3://{}/{}/data/val".format(bucket_name, prefix),
+        'model': "s3://{}/{}/model".format(bucket_name, prefix),
+        'debug': 's3://{0}/{1}/model/debug'.format(bucket_name, prefix),
+        'matrix_cache': 's3://{0}/{1}/cache/matrix'.format(bucket_name, prefix),
+        'code': 's3://{0}/{1}/code'.format(bucket_name, prefix),
+    }
 
-# Lookup environment to get live blue/green from current lambda
-# TODO: Add a deployment success event to switch the paraemter
-# see: https://docs.aws.amazon.com/codedeploy/latest/userguide/monitoring-cloudwatch-events.html
+class Phases:
+    """Wall time of each named phase, which may overlap"""
+
+    def __init__(self):
+        self.seconds = {}
+
+    def run(self, name, fn, *args, **kwargs):
+        start = time.time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.seconds[name] = round(time.time() - start, 3)
+            print('{} completed in: {:.3f}s'.format(name, self.seconds[name]))
+
+def get_job_name(codepipeline, stack_name):
+    """Name the job after the pipeline execution id"""
+    from sagemaker.utils import name_from_base
+    response = codepipeline.get_pipeline_state(name=stack_name)
+    execution_id = response['stageStates'][0]['latestExecution']['pipelineExecutionId']
+    return name_from_base(execution_id)
+
+def get_endpoints(ssm, stack_name):
+    """Return the (endpoint, cooldown endpoint) names, deploying to the one that isn't live
+
+    If the live endpoint parameter is not found default to 'blue/green'.
+    """
+    # TODO: Add a deployment success event to switch the paraemter
+    # see: https://docs.aws.amazon.com/codedeploy/latest/userguide/monitoring-cloudwatch-events.html
+    endpoint_name = '{}-{}'.format(stack_name, 'blue')
+    cooldown_endpoint_name = '{}-{}'.format(stack_name, 'green')
+    try:
+        response = ssm.get_parameter(Name=stack_name)
+        print('get_parameter', response)
+        cooldown_endpoint_name = response['Parameter']['Value'] # Set cooldown as current live
+        endpoint_env = 'green' if cooldown_endpoint_name.endswith('blue') else 'blue'
+        endpoint_name = '{}-{}'.format(stack_name, endpoint_env)
+    except ClientError as e:
+        print('get_parameter error', e)
+    return endpoint_name, cooldown_endpoint_name
+
+def endpoint_exists(sm, endpoint_name):
+    try:
+        response = sm.describe_endpoint(EndpointName=endpoint_name)
+        print('describe_endpoint', response)
+        return True
+    except ClientError as e:
+        print('endpoint error', e)
+        return False
+
+def hyperparameters(config):
+    return {
+        "max_depth": "10",
+        "eta": "0.2",
+        "gamma": "1",
+        "min_child_weight": "6",
+        "silent": "0",
+        "objective": "multi:softmax",
+        "num_class": "15",
+        "num_round": "1", # TEMP: Hack to make faster
+        "data_mode": "memory", # Or "stream" for an external memory DMatrix, with File or Pipe input mode
+        "cache_s3_uri": paths(config)['matrix_cache'], # Reuse parsed matrices when the data hasn't changed
+        "model_formats": "native,pickle", # Add "compiled" for a Treelite predictor when it is installed
+        "debug_overhead_pct": "5", # Share of training time the debugger capture may take
+        "debug_steps": ",".join(DEBUG_RULE_STEPS) # Always captured in full for the confusion rule
+    }
 
-# Attempt to read current live endpoint, if not found default to 'blue/green'
-endpoint_name = '{}-{}'.format(stack_name, 'blue')
-cooldown_endpoint_name = '{}-{}'.format(stack_name, 'green')
-try:
-    ssm = boto3.client('ssm')
-    response = ssm.get_parameter(Name=stack_name)
-    print('get_parameter', response)
-    cooldown_endpoint_name = response['Parameter']['Value'] # Set cooldown as current live
-    endpoint_env = 'green' if cooldown_endpoint_name.endswith('blue') else 'blue'
-    endpoint_name = '{}-{}'.format(stack_name, endpoint_env)
-except ClientError as e:
-    print('get_parameter error', e)
-
-# Check if the endpoint exists
-
-update_endpoint = False
-try:
-    sm = boto3.client('sagemaker')
-    response = sm.describe_endpoint(EndpointName=endpoint_name)
-    print('describe_endpoint', response)
-    update_endpoint = True
-except ClientError as e:
-    print('endpoint error', e)
-
-# Create Estimator with debug hooks
-
-input_train_path = "s3://{}/{}/data/train".format(bucket_name, prefix)
-input_validation_path = "s3://{}/{}/data/val".format(bucket_name, prefix)
-model_output_path =  "s3://{}/{}/model".format(bucket_name, prefix)
-debug_output_path = 's3://{0}/{1}/model/debug'.format(bucket_name, prefix)
-model_code_location = 's3://{0}/{1}/code'.format(bucket_name, prefix)
-entry_point='train_xgboost.py'
-source_dir='workflow/training/'
-
-# TODO: Upload source files here given we are not calling fit
-
-debug_hook_config = DebuggerHookConfig(
-    s3_output_path=debug_output_path,
-    hook_parameters={
-        "save_interval": "1"
-    },
-    collection_configs=[
-        CollectionConfig("hyperparameters"),
-        CollectionConfig("metrics"),
-        CollectionConfig("predictions"),
-        CollectionConfig("labels"),
-        CollectionConfig("feature_importance")
-    ]
-)
-
-debug_rules = [Rule.sagemaker(rule_configs.confusion(),
-    rule_parameters={
-        "category_no": "15",
-        "min_diag": "0.7",
-        "max_off_diag": "0.3",
-        "start_step": "17",
-        "end_step": "19"}
-)]
-
-hyperparameters = {
-    "max_depth": "10",
-    "eta": "0.2",
-    "gamma": "1",
-    "min_child_weight": "6",
-    "silent": "0",
-    "objective": "multi:softmax",
-    "num_class": "15",
-    "num_round": "1" # TEMP: Hack to make faster
-}
-
-xgb = XGBoost(
-    entry_point=entry_point,
-    source_dir=source_dir,
-    output_path=model_output_path,
-    code_location=model_code_location,
-    hyperparameters=hyperparameters,
-    train_instance_type="ml.m5.4xlarge",
-    train_instance_count=1,
-    framework_version="0.90-2",
-    py_version="py3",
-    role=sagemaker_execution_role,
-    debugger_hook_config=debug_hook_config,
-    rules=debug_rules
-)
-
-# Upload model code to s3
-
-xgb.prepare_workflow_for_training(job_name)
-print('uploaded code to: {}'.format(xgb.uploaded_code.s3_prefix))
-
-# Create Workflow steps
-
-execution_input = ExecutionInput(schema={
-    'TrainLocation': str,
-    'ValidationLocation': str,
-    'EndpointName': str
-})
-execution_params = {
-    'TrainLocation': input_train_path,
-    'ValidationLocation': input_validation_path,
-    'EndpointName': endpoint_name
-}
-
-training_step = steps.TrainingStep(
-    'Train Step', 
-    estimator=xgb,
-    data={
+def build_estimator(config):
+    """Create Estimator with debug hooks"""
+    from sagemaker.xgboost import XGBoost
+    from sagemaker.debugger import Rule, rule_configs, DebuggerHookConfig, CollectionConfig
+
+    debug_hook_config = DebuggerHookConfig(
+        s3_output_path=paths(config)['debug'],
+        hook_parameters={
+            "save_interval": "1" # The hook saves whenever invoked, capture_policy samples the rounds
+        },
+        collection_configs=[
+            CollectionConfig("hyperparameters"),
+            CollectionConfig("metrics"),
+            CollectionConfig("predictions"),
+            CollectionConfig("labels"),
+            CollectionConfig("feature_importance")
+        ]
+    )
+
+    debug_rules = [Rule.sagemaker(rule_configs.confusion(),
+        rule_parameters={
+            "category_no": "15",
+            "min_diag": "0.7",
+            "max_off_diag": "0.3",
+            "start_step": DEBUG_RULE_STEPS[0],
+            "end_step": DEBUG_RULE_STEPS[-1]}
+    )]
+
+    return XGBoost(
+        entry_point='train_xgboost.py',
+        source_dir=SOURCE_DIR,
+        output_path=paths(config)['model'],
+        code_location=paths(config)['code'],
+        hyperparameters=hyperparameters(config),
+        train_instance_type="ml.m5.4xlarge",
+        train_instance_count=1,
+        framework_version="1.5-1", # 1.5 or later for data_mode stream
+        py_version="py3",
+        role=config.sagemaker_execution_role,
+        debugger_hook_config=debug_hook_config,
+        rules=debug_rules,
+        metric_definitions=METRIC_DEFINITIONS
+    )
+
+def upload_code(estimator, job_name):
+    """Upload model code to s3, the job_name must match the uploaded code"""
+    estimator.prepare_workflow_for_training(job_name)
+    print('uploaded code to: {}'.format(estimator.uploaded_code.s3_prefix))
+    return estimator.uploaded_code.s3_prefix
+
+def attach_workflow(workflow_arn):
+    from stepfunctions.workflow import Workflow
+    return Workflow.attach(workflow_arn)
+
+def plan_warm_start(s3, sm, config, live_endpoint_name):
+    """Return the training objects and the warm_start.Plan for them"""
+    data_prefix = '{}/data/train/'.format(config.prefix)
+    objects = warm_start.list_objects(s3, config.bucket_name, data_prefix)
+    model_data_url = warm_start.get_live_model(sm, live_endpoint_name)
+    manifest = warm_start.load_manifest(s3, model_data_url) if model_data_url else None
+    return objects, warm_start.plan(objects, manifest, model_data_url, hyperparameters(config))
+
+def find_reusable(s3, sm, config, objects):
+    """Return the fingerprint of this run and a fingerprint.Reuse if a previous run matches"""
+    validation = warm_start.list_objects(s3, config.bucket_name, '{}/data/val/'.format(config.prefix))
+    value = fingerprint.compute(dict(objects, **validation), SOURCE_DIR, hyperparameters(config))
+    print('Training fingerprint: {}'.format(value))
+    return value, fingerprint.find_reusable(sm, value) if fingerprint.REUSE_MODEL else None
+
+def build_definition(estimator, job_name, update_endpoint, plan=None, reuse=None):
+    """Return the chain of training and deployment steps
+
+    A warm start plan trains on a manifest of the new objects, with the live model as the model channel.
+    Reusing a previous run only deploys its model, under a new endpoint config.
+    """
+    import sagemaker
+    from stepfunctions import steps
+    from stepfunctions.inputs import ExecutionInput
+
+    execution_input = ExecutionInput(schema={
+        'TrainLocation': str,
+        'ValidationLocation': str,
+        'EndpointName': str
+    })
+
+    data = {
         'train': sagemaker.s3_input(execution_input['TrainLocation'], content_type='libsvm'),
         'validation': sagemaker.s3_input(execution_input['ValidationLocation'], content_type='libsvm')
-    },
-    job_name=job_name # Require embedding this to job_name matches uploaded code
-)
-
-model_step = steps.ModelStep(
-    'Save model',
-    model=training_step.get_expected_model(),
-    model_name=job_name
-)
-
-endpoint_config_step = steps.EndpointConfigStep(
-    "Create Endpoint Config",
-    endpoint_config_name=job_name,
-    model_name=job_name,
-    initial_instance_count=1, 
-    instance_type='ml.m5.large'
-)
-
-endpoint_step = steps.EndpointStep(
-    "Create or Update Endpoint",
-    endpoint_name=execution_input['EndpointName'],
-    endpoint_config_name=job_name,
-    update=update_endpoint
-)
-
-workflow_definition = steps.Chain([
-    training_step,
-    model_step,
-    endpoint_config_step,
-    endpoint_step
-])
-
-# Update the workflow that is already created 
-
-workflow = Workflow.attach(workflow_arn)
-workflow.update(definition=workflow_definition)
-print('Workflow updated: {}'.format(workflow_arn))
-
-# Sleep for 5 seconds then execute after this is applied
-time.sleep(5)
-
-execution = workflow.execute(
-    inputs=execution_params
-)
-stepfunction_arn = execution.execution_arn
-print('Workflow exectuted: {}'.format(stepfunction_arn))
-
-# Export environment variables
-
-if not os.path.exists('cloud_formation'):
-    os.makedirs('cloud_formation')
-
-with open('cloud_formation/training.vars', 'w' ) as f:
-    f.write('export TRAINING_JOB_NAME={}\nexport ENDPOINT_NAME={}\nexport STEPFUNCTION_ARN={}'.format(
-        job_name, endpoint_name, stepfunction_arn))
-
-# Write deployment parameters
-
-params_deploy = {
-    "Parameters": {
-        "CommitId": trial_name,
-        "EndpointName": endpoint_name,
-        "EndpointVariant": "AllTraffic",
-        "CoolDownEndpointName": cooldown_endpoint_name, 
-        "CoolDownVariant": "AllTraffic",
     }
-}
-with open('cloud_formation/deploy.json', 'w' ) as f:
-    f.write(json.dumps(params_deploy))
+    if plan is not None and plan.mode == 'warm':
+        data['train'] = sagemaker.s3_input(execution_input['TrainLocation'], content_type='libsvm',
+                                           s3_data_type='ManifestFile')
+        data['model'] = sagemaker.s3_input(plan.model_data_url, content_type='application/x-tar')
+
+    training_step = steps.TrainingStep(
+        'Train Step',
+        estimator=estimator,
+        data=data,
+        job_name=job_name # Require embedding this to job_name matches uploaded code
+    )
+
+    model_step = steps.ModelStep(
+        'Save model',
+        model=training_step.get_expected_model(),
+        model_name=job_name
+    )
+
+    endpoint_config_step = steps.EndpointConfigStep(
+        "Create Endpoint Config",
+        endpoint_config_name=job_name,
+        model_name=reuse.job_name if reuse else job_name,
+        initial_instance_count=1,
+        instance_type='ml.m5.large'
+    )
+
+    endpoint_step = steps.EndpointStep(
+        "Create or Update Endpoint",
+        endpoint_name=execution_input['EndpointName'],
+        endpoint_config_name=job_name,
+        update=update_endpoint
+    )
+
+    if reuse:
+        return steps.Chain([
+            endpoint_config_step,
+            endpoint_step
+        ])
+
+    return steps.Chain([
+        training_step,
+        model_step,
+        endpoint_config_step,
+        endpoint_step
+    ])
+
+def wait_for_definition(sfn, workflow_arn, definition, until, sleep=time.sleep):
+    """Poll the state machine until it serves definition, returning False if until passes first"""
+    expected = json.loads(definition)
+    delay = WORKFLOW_POLL_SECONDS
+    while True:
+        response = sfn.describe_state_machine(stateMachineArn=workflow_arn)
+        if json.loads(response['definition']) == expected:
+            return True
+        if time.time() + delay > until:
+            return False
+        sleep(delay)
+        delay = min(delay * 2, 5.0)
+
+def write_outputs(config, job_name, endpoint_name, cooldown_endpoint_name, stepfunction_arn, output_dir=OUTPUT_DIR,
+                  model_data_url=None, golden_set_uri=None):
+    """Export environment variables and write deployment parameters"""
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    with open(os.path.join(output_dir, 'training.vars'), 'w') as f:
+        f.write('export TRAINING_JOB_NAME={}\nexport ENDPOINT_NAME={}\nexport STEPFUNCTION_ARN={}'.format(
+            job_name, endpoint_name, stepfunction_arn))
+
+    params_deploy = {
+        "Parameters": {
+            "CommitId": config.trial_name,
+            "EndpointName": endpoint_name,
+            "ModelDataUrl": model_data_url or "{}/{}/output/model.tar.gz".format(paths(config)['model'], job_name),
+            "EndpointVariant": "AllTraffic",
+            "CoolDownEndpointName": cooldown_endpoint_name,
+            "CoolDownVariant": "AllTraffic",
+            "GoldenSetUri": golden_set_uri or "",
+        }
+    }
+    with open(os.path.join(output_dir, 'deploy.json'), 'w') as f:
+        f.write(json.dumps(params_deploy))
+
+def run(config, clients, estimator_factory=build_estimator, attach=attach_workflow,
+        definition_factory=build_definition, output_dir=OUTPUT_DIR):
+    """Update and execute the training workflow, returning the execution arn"""
+    start = time.time()
+    phases = Phases()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        # Get pipeline execution id as job_name, alongside the lookups that don't need it
+        job = executor.submit(phases.run, 'get_job_name', get_job_name, clients['codepipeline'], config.stack_name)
+        endpoints = executor.submit(phases.run, 'get_endpoints', get_endpoints, clients['ssm'], config.stack_name)
+        estimator = executor.submit(phases.run, 'build_estimator', estimator_factory, config)
+        workflow = executor.submit(phases.run, 'attach_workflow', attach, config.workflow_arn)
+
+        job_name = job.result()
+        print('Staring Training job: {}'.format(job_name))
+        estimator = estimator.result()
+        upload = executor.submit(phases.run, 'upload_code', upload_code, estimator, job_name)
+
+        # Check if the endpoint exists while the code uploads
+        endpoint_name, cooldown_endpoint_name = endpoints.result()
+        warm = executor.submit(phases.run, 'plan_warm_start', plan_warm_start, clients['s3'], clients['sagemaker'],
+                               config, cooldown_endpoint_name)
+        golden = executor.submit(phases.run, 'build_golden', golden_set.build, clients['s3'],
+                                 clients['sagemaker-runtime'], config.bucket_name, config.prefix,
+                                 cooldown_endpoint_name, job_name)
+        update_endpoint = phases.run('endpoint_exists', endpoint_exists, clients['sagemaker'], endpoint_name)
+        objects, plan = warm.result()
+        value, reuse = phases.run('find_reusable', find_reusable, clients['s3'], clients['sagemaker'], config, objects)
+        upload.result()
+        workflow = workflow.result()
+        # A deployment can't pass the pre traffic hook without a golden set, so fail before executing
+        golden_set_uri = golden.result()
+
+    train_location = paths(config)['train']
+    if reuse:
+        print('Reusing model from job {} of trial {}'.format(reuse.job_name, reuse.trial_name))
+    else:
+        print('Training mode: {} ({})'.format(plan.mode, plan.reason))
+        train_location = phases.run(
+            'write_manifests', warm_start.write_manifests, clients['s3'], config.bucket_name,
+            '{}/model/{}'.format(config.prefix, job_name), '{}/data/train'.format(config.prefix),
+            objects, plan, hyperparameters(config)) or train_location
+    model_job_name = reuse.job_name if reuse else job_name
+    phases.run('tag_trial', fingerprint.tag_trial, clients['sagemaker'], config.trial_name, value, model_job_name)
+
+    definition = definition_factory(estimator, job_name, update_endpoint, plan, reuse)
+
+    # Update the workflow that is already created, and wait until it is applied before executing
+    phases.run('update_workflow', workflow.update, definition=definition)
+    print('Workflow updated: {}'.format(config.workflow_arn))
+    applied = phases.run('wait_for_definition', wait_for_definition, clients['stepfunctions'], config.workflow_arn,
+                         workflow.definition.to_json(), time.time() + WORKFLOW_WAIT_SECONDS)
+    if not applied:
+        print('Workflow definition not updated after {}s, executing anyway'.format(WORKFLOW_WAIT_SECONDS))
+
+    execution_params = {
+        'TrainLocation': train_location,
+        'ValidationLocation': paths(config)['validation'],
+        'EndpointName': endpoint_name
+    }
+    execution = phases.run('execute', workflow.execute, inputs=execution_params)
+    stepfunction_arn = execution.execution_arn
+    print('Workflow exectuted: {}'.format(stepfunction_arn))
+
+    write_outputs(config, model_job_name, endpoint_name, cooldown_endpoint_name, stepfunction_arn, output_dir,
+                  reuse.model_data_url if reuse else None, golden_set_uri)
+
+    print('phases', json.dumps(phases.seconds))
+    print('Training launched in: {}'.format(time.time() - start))
+    return stepfunction_arn
+
+def main(argv=None):
+    config = parse_args(argv)
+    clients = {name: boto3.client(name) for name in (
+        'codepipeline', 'ssm', 'sagemaker', 'sagemaker-runtime', 'stepfunctions', 's3')}
+    run(config, clients)
 
-end = time.time()
-print('Training launched in: {}'.format(end-start))
\ No newline at end of file
+if __name__ == '__main__':
+    main(sys.argv[1:])
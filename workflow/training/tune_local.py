@@ -0,0 +1,214 @@
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import xgboost
+
+try:
+    from . import data_loader, matrix_cache, train_xgboost
+except ImportError:  # Run as a script from workflow/training
+    import data_loader
+    import matrix_cache
+    import train_xgboost
+
+# Local hyperparameter search for train_xgboost before paying for training instances.
+# The channels are parsed once into the matrix cache, and every worker process
+# memory maps the same .npy arrays rather than receiving a copy. Configurations
+# are sampled from a search space and pruned with successive halving: each
+# rung trains the surviving trials for --halving times more rounds (continuing
+# from the previous rung's model), with early stopping on the validation set,
+# and keeps the best 1/halving. The ranked trials are written to a CSV.
+#
+# Usage: python workflow/training/tune_local.py --train data/train --validation data/val \
+#            --trials 27 --min_rounds 10 --max_rounds 270 --output tuning.csv
+
+# Search space: name -> (kind, low, high)
+SEARCH_SPACE = {
+    "max_depth": ("int", 3, 10),
+    "eta": ("log", 0.01, 0.3),
+    "gamma": ("float", 0.0, 5.0),
+    "min_child_weight": ("int", 1, 10),
+    "subsample": ("float", 0.6, 1.0),
+    "colsample_bytree": ("float", 0.5, 1.0),
+}
+
+# Metrics where a larger value is better, all others are minimized
+MAXIMIZE = ('auc', 'aucpr', 'map', 'ndcg')
+
+_data = None
+
+def sample(space, rng):
+    """Draw one configuration from the search space"""
+    params = {}
+    for name, (kind, low, high) in sorted(space.items()):
+        if kind == 'int':
+            params[name] = rng.randint(low, high)
+        elif kind == 'log':
+            params[name] = round(math.exp(rng.uniform(math.log(low), math.log(high))), 5)
+        else:
+            params[name] = round(rng.uniform(low, high), 4)
+    return params
+
+def rungs(min_rounds, max_rounds, halving):
+    """Return the cumulative rounds of each successive halving rung"""
+    budgets = [min_rounds]
+    while budgets[-1] * halving <= max_rounds:
+        budgets.append(budgets[-1] * halving)
+    return budgets
+
+def shareable_paths(arrays, directory):
+    """Return .npy paths of arrays for the workers to memory map
+
+    matrix_cache returns memory mapped arrays, but falls back to the parsed
+    arrays when they couldn't be stored, so those are written to directory.
+    """
+    paths = []
+    for array in arrays:
+        filename = getattr(array, 'filename', None)
+        if filename is None:
+            filename = os.path.join(directory, '{}.npy'.format(len(os.listdir(directory))))
+            np.save(filename, array)
+        paths.append(filename)
+    return tuple(paths)
+
+def _init_worker(paths, nthread):
+    """Memory map the shared arrays and build the matrices once per worker process"""
+    global _data
+    train, validation = [tuple(np.load(p, mmap_mode='r') for p in pair) for pair in paths]
+    dtrain = _dmatrix(*train)
+    _data = (dtrain, _dmatrix(*validation, ref=dtrain), nthread)
+
+def _dmatrix(features, labels, ref=None):
+    # QuantileDMatrix bins once up front, so hist trials don't each hold a float copy
+    if hasattr(xgboost, 'QuantileDMatrix'):
+        return xgboost.QuantileDMatrix(features, label=labels, ref=ref)
+    return xgboost.DMatrix(features, label=labels)
+
+def _run_trial(trial, params, rounds, model, early_stopping_rounds):
+    """Train a trial for rounds more rounds, returning its score and model"""
+    dtrain, dval, nthread = _data
+    params = dict(params, nthread=nthread)
+    start = time.time()
+    bst = train_xgboost.train(
+        params, dtrain, dval, rounds,
+        early_stopping_rounds=early_stopping_rounds,
+        xgb_model=xgboost.Booster(model_file=bytearray(model)) if model else None,
+        verbose_eval=False)
+    history = bst.attributes()
+    return {
+        'trial': trial,
+        'score': float(history['best_score']),
+        'best_iteration': int(history['best_iteration']),
+        'rounds': bst.num_boosted_rounds(),
+        'model': bytes(bst.save_raw()),
+        'seconds': time.time() - start,
+    }
+
+def better(metric):
+    """Return a sort key that orders scores of metric best first"""
+    maximize = metric.split('@')[0] in MAXIMIZE
+    return (lambda score: -score) if maximize else (lambda score: score)
+
+def successive_halving(pool, base_params, configs, budgets, halving, early_stopping_rounds, metric):
+    """Run the rungs, returning one result per trial with the last rung it reached"""
+    key = better(metric)
+    results = {}
+    active = list(range(len(configs)))
+    trained = 0
+    for rung, budget in enumerate(budgets):
+        futures = [pool.submit(_run_trial, trial, dict(base_params, **configs[trial]), budget - trained,
+                               results[trial]['model'] if trial in results else None, early_stopping_rounds)
+                   for trial in active]
+        for future in futures:
+            result = future.result()
+            previous = results.get(result['trial'], {})
+            result['seconds'] += previous.get('seconds', 0.0)
+            result['rung'] = rung
+            # Early stopped trials won't improve with more rounds, so they aren't promoted
+            result['stopped'] = result['rounds'] < budget
+            results[result['trial']] = result
+        trained = budget
+        ranked = sorted(active, key=lambda trial: key(results[trial]['score']))
+        print('rung {} rounds {} best {} {:.5f}'.format(
+            rung, budget, metric, results[ranked[0]]['score']))
+        active = [t for t in ranked[:max(1, len(ranked) // halving)] if not results[t]['stopped']]
+        if not active:
+            break
+    return results
+
+def write_results(path, results, configs, metric):
+    """Write trials ranked by rung reached then score"""
+    key = better(metric)
+    ranked = sorted(results.values(), key=lambda r: (-r['rung'], key(r['score'])))
+    names = sorted(set(name for config in configs for name in config))
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['rank', 'trial', 'rung', metric, 'best_iteration', 'rounds', 'stopped', 'seconds'] + names)
+        for rank, r in enumerate(ranked, 1):
+            writer.writerow([rank, r['trial'], r['rung'], r['score'], r['best_iteration'], r['rounds'], r['stopped'],
+                             round(r['seconds'], 3)] + [configs[r['trial']].get(n) for n in names])
+    return ranked
+
+def main():
+    parser = argparse.ArgumentParser(description='Local successive halving search for train_xgboost')
+    parser.add_argument('--train', required=True)
+    parser.add_argument('--validation', required=True)
+    parser.add_argument('--objective', default='multi:softmax')
+    parser.add_argument('--num_class', type=int, default=15)
+    parser.add_argument('--eval_metric', default='merror')
+    parser.add_argument('--trials', type=int, default=27)
+    parser.add_argument('--min_rounds', type=int, default=10)
+    parser.add_argument('--max_rounds', type=int, default=270)
+    parser.add_argument('--halving', type=int, default=3, help='keep 1/halving of trials per rung')
+    parser.add_argument('--early_stopping_rounds', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=data_loader.default_workers())
+    parser.add_argument('--space', help='JSON file of name: [kind, low, high] to replace the search space')
+    parser.add_argument('--cache_dir', default=os.path.join(tempfile.gettempdir(), 'matrix-cache'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='tuning.csv')
+    args = parser.parse_args()
+
+    start = time.time()
+    space = SEARCH_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = {name: tuple(value) for name, value in json.load(f).items()}
+
+    # Parse once into the cache, then hand the workers paths to memory map
+    cache = matrix_cache.MatrixCache(args.cache_dir)
+    scratch = tempfile.TemporaryDirectory()
+    paths = [shareable_paths(cache.load(data_loader.list_files(channel)), scratch.name)
+             for channel in (args.train, args.validation)]
+
+    rng = random.Random(args.seed)
+    configs = [sample(space, rng) for _ in range(args.trials)]
+    base_params = {
+        "objective": args.objective,
+        "num_class": args.num_class,
+        "eval_metric": args.eval_metric,
+        "tree_method": "hist",
+        "seed": args.seed,
+    }
+    budgets = rungs(args.min_rounds, args.max_rounds, args.halving)
+    nthread = max(1, data_loader.default_workers() // args.workers)
+    print('{} trials, rungs {}, {} workers x {} threads'.format(args.trials, budgets, args.workers, nthread))
+
+    with scratch, ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                      initargs=(paths, nthread)) as pool:
+        results = successive_halving(pool, base_params, configs, budgets, args.halving,
+                                     args.early_stopping_rounds, args.eval_metric)
+
+    ranked = write_results(args.output, results, configs, args.eval_metric)
+    print('best trial {} {} {} {}'.format(ranked[0]['trial'], args.eval_metric, ranked[0]['score'],
+                                         json.dumps(configs[ranked[0]['trial']])))
+    print('Tuning completed in: {:.3f}s, results in {}'.format(time.time() - start, args.output))
+
+if __name__ == '__main__':
+    main()
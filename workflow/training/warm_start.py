@@ -0,0 +1,115 @@
+import json
+import os
+from collections import namedtuple
+
+from botocore.exceptions import ClientError
+
+# Warm start planning for training.py.
+# Each launched job records the training objects (key and ETag) it was given
+# in a data manifest next to its model artifact. The next run finds the model
+# behind the live endpoint (endpoint -> endpoint config -> model -> artifact),
+# reads its data manifest and, when only new objects have landed under the
+# train prefix, trains on a SageMaker ManifestFile channel listing just those
+# objects, continuing to boost from the live model. Otherwise it falls back to
+# full retraining, eg. when objects were changed or removed, the new data is a
+# large share of the total, the model has been warm started too many times in
+# a row, or hyperparameters that change the model structure differ.
+
+TRAINING_MODE = os.environ.get('TRAINING_MODE', 'auto') # auto, full or warm
+MAX_NEW_FRACTION = float(os.environ.get('WARM_START_MAX_NEW_FRACTION', '0.5'))
+MAX_CHAIN = int(os.environ.get('WARM_START_MAX_CHAIN', '5'))
+# Hyperparameters the live model must have been trained with to continue it
+MATCH_HYPERPARAMETERS = os.environ.get('WARM_START_MATCH', 'objective,num_class').split(',')
+DATA_MANIFEST = 'data_manifest.json'
+TRAINING_MANIFEST = 'train.manifest'
+
+Plan = namedtuple('Plan', ['mode', 'reason', 'new_keys', 'chain', 'model_data_url'])
+
+def list_objects(s3, bucket, prefix):
+    """Return {key: {'etag', 'size'}} for the objects under prefix"""
+    objects = {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if not obj['Key'].endswith('/'):
+                objects[obj['Key']] = {'etag': obj['ETag'].strip('"'), 'size': obj['Size']}
+    return objects
+
+def get_live_model(sm, endpoint_name):
+    """Return the model artifact url served by endpoint_name, or None if there isn't one"""
+    try:
+        endpoint = sm.describe_endpoint(EndpointName=endpoint_name)
+        config = sm.describe_endpoint_config(EndpointConfigName=endpoint['EndpointConfigName'])
+        model = sm.describe_model(ModelName=config['ProductionVariants'][0]['ModelName'])
+        return model['PrimaryContainer']['ModelDataUrl']
+    except ClientError as e:
+        print('live model error', e)
+        return None
+
+def artifact_prefix(model_data_url):
+    """Return the s3 (bucket, key prefix) of the job that produced model_data_url
+
+    Artifacts are written to <output_path>/<job name>/output/model.tar.gz
+    """
+    bucket, _, key = model_data_url.replace('s3://', '', 1).partition('/')
+    return bucket, key.rsplit('/', 2)[0]
+
+def load_manifest(s3, model_data_url):
+    bucket, prefix = artifact_prefix(model_data_url)
+    try:
+        response = s3.get_object(Bucket=bucket, Key='{}/{}'.format(prefix, DATA_MANIFEST))
+        return json.loads(response['Body'].read())
+    except ClientError as e:
+        print('data manifest error', e)
+        return None
+
+def plan(objects, manifest, model_data_url, hyperparameters, mode=None, max_new_fraction=None, max_chain=None):
+    """Decide between warm starting from model_data_url on the new objects and a full retrain"""
+    mode = mode or TRAINING_MODE
+    max_new_fraction = MAX_NEW_FRACTION if max_new_fraction is None else max_new_fraction
+    max_chain = MAX_CHAIN if max_chain is None else max_chain
+
+    def full(reason):
+        return Plan('full', reason, sorted(objects), 0, None)
+
+    if mode == 'full':
+        return full('training mode is full')
+    if model_data_url is None or manifest is None:
+        return full('no live model with a data manifest')
+    previous = manifest['objects']
+    changed = [key for key, etag in previous.items() if objects.get(key, {}).get('etag') != etag]
+    if changed:
+        return full('{} objects changed or removed since the live model, eg. {}'.format(len(changed), changed[0]))
+    mismatched = [name for name in MATCH_HYPERPARAMETERS
+                  if str(manifest.get('hyperparameters', {}).get(name)) != str(hyperparameters.get(name))]
+    if mismatched:
+        return full('hyperparameters {} changed'.format(','.join(mismatched)))
+    new_keys = sorted(key for key in objects if key not in previous)
+    if not new_keys:
+        return full('no new objects to continue training on')
+    chain = manifest.get('chain', 0) + 1
+    if mode != 'warm':
+        new_bytes = sum(objects[key]['size'] for key in new_keys)
+        total_bytes = sum(obj['size'] for obj in objects.values())
+        if new_bytes > max_new_fraction * total_bytes:
+            return full('new data is {:.0%} of the total'.format(new_bytes / float(total_bytes)))
+        if chain > max_chain:
+            return full('live model is already {} warm starts from a full retrain'.format(chain - 1))
+    return Plan('warm', '{} new objects'.format(len(new_keys)), new_keys, chain, model_data_url)
+
+def write_manifests(s3, bucket, job_prefix, data_prefix, objects, plan, hyperparameters):
+    """Write the job's data manifest, and for a warm start the training manifest, returning its url"""
+    manifest = {
+        'mode': plan.mode,
+        'chain': plan.chain,
+        'objects': {key: obj['etag'] for key, obj in objects.items()},
+        'hyperparameters': hyperparameters,
+    }
+    s3.put_object(Bucket=bucket, Key='{}/{}'.format(job_prefix, DATA_MANIFEST), Body=json.dumps(manifest))
+    if plan.mode != 'warm':
+        return None
+    # A SageMaker manifest is a common prefix followed by object keys relative to it
+    prefix = data_prefix.rstrip('/') + '/'
+    entries = [{'prefix': 's3://{}/{}'.format(bucket, prefix)}] + [key[len(prefix):] for key in plan.new_keys]
+    key = '{}/{}'.format(job_prefix, TRAINING_MANIFEST)
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(entries))
+    return 's3://{}/{}'.format(bucket, key)